@@ -1,9 +1,59 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
 
-from .models import Profile
+from mysite.admin_utils import LargeTableAdmin
+from .models import AccountRemoval, Profile
+from .removal import request_removal, steps
 
-class ProfileAdmin(admin.ModelAdmin):
+class ProfileAdmin(LargeTableAdmin, admin.ModelAdmin):
     list_display = ('user', 'reputation')
-    search_fields = ['user']
+    list_select_related = ('user',)
+    search_fields = ['user__username']
 
-admin.site.register(Profile, ProfileAdmin)
\ No newline at end of file
+class AccountRemovalAdmin(admin.ModelAdmin):
+    list_display = ('username', 'action', 'progress', 'processed', 'created_at', 'finished_at')
+    list_filter = ['action']
+    search_fields = ['username']
+    readonly_fields = ('user_id', 'username', 'step', 'processed', 'created_at', 'updated_at', 'finished_at')
+
+    @admin.display(description='Progress')
+    def progress(self, obj):
+        if obj.finished_at != None:
+            return 'Done'
+        names = [name for name, _ in steps(obj.action)]
+        if obj.step not in names:
+            return 'Waiting'
+        return 'Step %d of %d: %s' % (names.index(obj.step) + 1, len(names), obj.step)
+
+    def has_add_permission(self, request):
+        return False
+
+class RemovingUserAdmin(LargeTableAdmin, UserAdmin):
+    """
+    Users are banned or removed through AccountRemoval instead of being deleted
+    here, since deleting a user with many listings in one request holds the
+    database for as long as the cascade takes.
+    """
+    actions = ['ban_users', 'remove_users']
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def schedule(self, request, queryset, action):
+        for user in queryset:
+            request_removal(user, action)
+        self.message_user(request, '%d users were deactivated; what they own is removed by process_account_removals.' % len(queryset), messages.SUCCESS)
+
+    @admin.action(description='Ban selected users')
+    def ban_users(self, request, queryset):
+        self.schedule(request, queryset, AccountRemoval.BAN)
+
+    @admin.action(description='Remove selected users and their accounts')
+    def remove_users(self, request, queryset):
+        self.schedule(request, queryset, AccountRemoval.REMOVE)
+
+admin.site.register(Profile, ProfileAdmin)
+admin.site.register(AccountRemoval, AccountRemovalAdmin)
+admin.site.unregister(User)
+admin.site.register(User, RemovingUserAdmin)
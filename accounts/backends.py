@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+
+def user_cache_key(user_id):
+    return 'auth-user:%s' % user_id
+
+def invalidate_cached_user(user_id):
+    """
+    Drop a cached user now and again once the transaction commits, so a request in
+    another transaction can not cache the user as it was before the commit.
+    """
+    key = user_cache_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that loads the user of each authenticated request, together with
+    their profile, from the cache. Saving the user or their profile drops the cached copy.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user == None:
+            user = User._default_manager.select_related('profile').filter(pk=user_id).first()
+            if user == None:
+                return None
+            cache.set(key, user, getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 5 * 60))
+        return user if self.user_can_authenticate(user) else None
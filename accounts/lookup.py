@@ -0,0 +1,70 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+class ReputationCache:
+    """
+    Small in-process LRU cache of reputation lookups keyed by name. Entries are
+    dropped when their user's profile changes and expire after timeout seconds,
+    which bounds how stale other worker processes can be. A value of None
+    records that no one has the name.
+    """
+
+    def __init__(self, max_size=10000, timeout=60):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.keys_by_user = {}
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        now = time.monotonic()
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry == None:
+                    continue
+                expires_at, value = entry
+                if expires_at < now:
+                    self._discard(key)
+                    continue
+                self.entries.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set(self, key, value):
+        with self.lock:
+            self._discard(key)
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            if value != None:
+                self.keys_by_user.setdefault(value['user_id'], set()).add(key)
+            while len(self.entries) > self.max_size:
+                self._discard(next(iter(self.entries)))
+
+    def invalidate(self, user_id):
+        with self.lock:
+            for key in list(self.keys_by_user.get(user_id, ())):
+                self._discard(key)
+
+    def delete(self, key):
+        with self.lock:
+            self._discard(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_user.clear()
+
+    def _discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry != None and entry[1] != None:
+            user_id = entry[1]['user_id']
+            keys = self.keys_by_user.get(user_id)
+            if keys != None:
+                keys.discard(key)
+                if not keys:
+                    del self.keys_by_user[user_id]
+
+reputation_cache = ReputationCache(getattr(settings, 'REPUTATION_CACHE_SIZE', 10000), getattr(settings, 'REPUTATION_CACHE_TIMEOUT', 60))
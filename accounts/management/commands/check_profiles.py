@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from accounts.provisioning import backfill_profiles, users_without_profile
+
+class Command(BaseCommand):
+    help = 'Find users without a profile, such as users created with bulk_create, and create their profiles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only count the users without a profile.')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write('%d users have no profile.' % users_without_profile().count())
+            return
+        self.stdout.write('Created the missing profiles of %d users.' % backfill_profiles())
@@ -0,0 +1,43 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from accounts.trust import TrustGraph, compute_trust, normalize
+
+class Command(BaseCommand):
+    help = 'Recompute the EigenTrust score of every profile from the settlement ratings.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cold', action='store_true', help='Start from the pre-trusted users instead of the stored trust.')
+        parser.add_argument('--tolerance', type=float, default=1e-8)
+        parser.add_argument('--max-iterations', type=int, default=100)
+        parser.add_argument('--benchmark', type=int, metavar='EDGES', help='Time the iteration on a random graph with this many edges instead of touching the database.')
+
+    def handle(self, *args, **options):
+        kwargs = {'tolerance': options['tolerance'], 'max_iterations': options['max_iterations']}
+        if options['benchmark']:
+            self.benchmark(options['benchmark'], **kwargs)
+            return
+        started = time.perf_counter()
+        iterations = compute_trust(warm_start=not options['cold'], **kwargs)
+        self.stdout.write('Computed trust in %d iterations (%.2fs).' % (iterations, time.perf_counter() - started))
+
+    def benchmark(self, edge_count, **kwargs):
+        rng = random.Random(0)
+        size = max(edge_count // 10, 2)
+        edges = [(rng.randrange(size), rng.randrange(size), 1) for _ in range(edge_count)]
+        pretrust = normalize([1.0 if i < 10 else 0.0 for i in range(size)])
+
+        started = time.perf_counter()
+        graph = TrustGraph(size, edges)
+        self.stdout.write('Built graph of %d users and %d edges in %.2fs.' % (size, graph.edge_count, time.perf_counter() - started))
+
+        started = time.perf_counter()
+        trust, iterations = graph.iterate(pretrust, **kwargs)
+        self.stdout.write('Cold start: %d iterations in %.2fs.' % (iterations, time.perf_counter() - started))
+
+        # A day of new trades: one percent more edges, then recompute from the previous result.
+        edges += [(rng.randrange(size), rng.randrange(size), 1) for _ in range(edge_count // 100)]
+        graph = TrustGraph(size, edges)
+        started = time.perf_counter()
+        _, iterations = graph.iterate(pretrust, trust, **kwargs)
+        self.stdout.write('Warm start after %d new edges: %d iterations in %.2fs.' % (edge_count // 100, iterations, time.perf_counter() - started))
@@ -0,0 +1,23 @@
+import csv
+import time
+from django.core.management.base import BaseCommand, CommandError
+from accounts.provisioning import import_users
+
+class Command(BaseCommand):
+    help = 'Create users and their profiles in bulk from a CSV roster, skipping usernames that exist.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row naming the username, email, password and character_name columns. Passwords must already be hashed; empty ones are left unusable.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as roster:
+                counts = import_users(csv.DictReader(roster), batch_size=options['batch_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+        elapsed = time.perf_counter() - started
+        self.stdout.write('Created %d users and skipped %d existing usernames in %.2fs (%d users/s).' % (
+            counts['created'], counts['skipped'], elapsed, counts['created'] / elapsed if elapsed else 0
+        ))
@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from accounts.removal import pending_removals, run_removal, steps
+
+class Command(BaseCommand):
+    help = (
+        'Remove what banned and removed users own in small batches, carrying on from where an '
+        'interrupted run stopped. Run it from cron, or with --poll as a worker.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Objects removed per transaction.')
+        parser.add_argument('--pause', type=float, default=0.05, help='Seconds to sleep between batches so other writers get the database.')
+        parser.add_argument('--poll', type=float, metavar='SECONDS', help='Keep running, looking for new removals this often.')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        while True:
+            for removal in pending_removals():
+                self.stdout.write('%s (user %d): starting at %s.' % (removal, removal.user_id, removal.step or 'the beginning'))
+                run_removal(removal, batch_size=options['batch_size'], pause=options['pause'], report=self.report)
+                self.stdout.write('%s: done, %d objects processed.' % (removal, removal.processed))
+            if not options['poll']:
+                return
+            time.sleep(options['poll'])
+
+    def report(self, removal, step, count):
+        if count or self.verbosity > 1:
+            names = [name for name, _ in steps(removal.action)]
+            self.stdout.write('%s: step %d of %d (%s), %d in this batch, %d so far.' % (
+                removal, names.index(step) + 1, len(names), step, count, removal.processed
+            ))
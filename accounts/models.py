@@ -1,15 +1,84 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
-from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.dispatch import Signal, receiver
+from django.db.models.functions import Lower
+from django.db.models.signals import post_delete, post_save
+from .backends import invalidate_cached_user
+from .lookup import reputation_cache
+
+# Sent with the (id, username, character name) of users created in bulk once they
+# are committed, since their inserts send no post_save.
+users_imported = Signal()
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     reputation = models.IntegerField(default=0)
     character_name = models.CharField(max_length=100, blank=True)
+    trust = models.FloatField(default=0, editable=False)
+    class Meta:
+        indexes = [
+            models.Index(Lower('character_name'), name='profile_character_name_ci'),
+        ]
+
+class Rating(models.Model):
+    rater = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    ratee = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    positive = models.BooleanField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class AccountRemoval(models.Model):
+    """
+    A ban or account removal. The user is made inactive when it is requested and
+    what they own is removed later in small batches by process_account_removals,
+    which records the step it is on so an interrupted run carries on from there.
+    """
+    BAN = 'ban'
+    REMOVE = 'remove'
+    ACTION_CHOICES = [
+        (BAN, 'Ban'),
+        (REMOVE, 'Remove account')
+    ]
+    # Not a foreign key, so the record outlives the account it removes.
+    user_id = models.IntegerField()
+    username = models.CharField(max_length=150)
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES, default=BAN)
+    step = models.CharField(max_length=50, blank=True)
+    processed = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(default=None, null=True, blank=True)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_id'], condition=Q(finished_at=None), name='account_removal_one_open_per_user'),
+        ]
+
+    def __str__(self):
+        return '%s of %s' % (self.get_action_display(), self.username)
 
 @receiver(post_save, sender=User)
 def create_reputation(sender, instance, created, **kwargs):
     if created:
         reputation = Profile(user=instance)
-        reputation.save()
\ No newline at end of file
+        reputation.save()
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Profile)
+def invalidate_reputation_cache(sender, instance, **kwargs):
+    reputation_cache.invalidate(instance.pk if sender == User else instance.user_id)
+    if sender == Profile and instance.character_name:
+        # Drops a cached lookup that found no one with the new character name.
+        reputation_cache.delete('character:' + instance.character_name.lower())
+
+@receiver(users_imported)
+def forget_missing_characters(sender, users, **kwargs):
+    for user_id, username, character_name in users:
+        if character_name:
+            reputation_cache.delete('character:' + character_name.lower())
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_auth_user_cache(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk if sender == User else instance.user_id)
@@ -0,0 +1,110 @@
+"""
+Bulk creation of users together with their profiles. Rows are inserted with
+executemany rather than through model instances and bulk_create, which spend
+most of an import preparing values one field at a time. Every concrete field is
+still written and prepared by its model field: the values of a column that all
+rows share, such as defaults, are prepared once per batch.
+
+No post_save is sent, so the profile create_reputation would add for each user
+is inserted here in the same batch instead, and users_imported is sent once the
+import commits, for what the signals would have kept up to date.
+"""
+import secrets
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, identify_hasher
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from .backends import invalidate_cached_user
+from .models import Profile, users_imported
+
+def hashed_password(username, password):
+    """
+    An already hashed password as it is, or an unusable one when it is empty.
+    """
+    if not password:
+        return UNUSABLE_PASSWORD_PREFIX + secrets.token_urlsafe(30)
+    try:
+        identify_hasher(password)
+    except ValueError:
+        raise ValueError('The password of "%s" is not hashed with a known hasher.' % username)
+    return password
+
+def insert_rows(model, rows):
+    """
+    Insert rows, dicts of field attnames to values, into the table of model. Fields
+    the rows leave out get the value a new instance would be saved with.
+    """
+    fields = [field for field in model._meta.concrete_fields if field != model._meta.auto_field]
+    given = [field for field in fields if field.attname in rows[0]]
+    # pre_save gives auto_now fields their time, as when an instance is added.
+    instance = model()
+    shared = {field.attname: field.get_db_prep_save(field.pre_save(instance, True), connection) for field in fields if field not in given}
+    columns = given + [field for field in fields if field not in given]
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(field.column) for field in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    tail = tuple(shared[field.attname] for field in columns[len(given):])
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [tuple(field.get_db_prep_save(row[field.attname], connection) for field in given) + tail for row in rows])
+
+def import_batch(rows):
+    rows = {row['username']: row for row in rows}
+    existing = set(User.objects.filter(username__in=rows).values_list('username', flat=True))
+    usernames = [username for username in rows if username not in existing]
+    if not usernames:
+        return 0
+    insert_rows(User, [
+        {'username': username, 'email': rows[username].get('email') or '', 'password': hashed_password(username, rows[username].get('password'))}
+        for username in usernames
+    ])
+    users = [
+        (user_id, username, rows[username].get('character_name') or '')
+        for user_id, username in User.objects.filter(username__in=usernames).values_list('pk', 'username')
+    ]
+    insert_rows(Profile, [{'user_id': user_id, 'character_name': character_name} for user_id, username, character_name in users])
+    transaction.on_commit(lambda: users_imported.send(sender=User, users=users))
+    return len(usernames)
+
+def import_users(rows, batch_size=1000):
+    """
+    Create a user and their profile for each row of username, email, password and
+    character_name, skipping usernames that exist. Passwords must already be hashed
+    as stored in User.password. The import is one transaction, so a row that stops
+    it leaves no users behind. Returns how many users were created and skipped.
+    """
+    counts = {'created': 0, 'skipped': 0}
+    batch = []
+    with transaction.atomic():
+        for row in rows:
+            if not row.get('username'):
+                raise ValueError('User without a username: %r' % ({key: value for key, value in row.items() if key != 'password'},))
+            batch.append(row)
+            if len(batch) == batch_size:
+                created = import_batch(batch)
+                counts['created'] += created
+                counts['skipped'] += len(batch) - created
+                batch = []
+        if batch:
+            created = import_batch(batch)
+            counts['created'] += created
+            counts['skipped'] += len(batch) - created
+    return counts
+
+def users_without_profile():
+    return User.objects.filter(profile=None)
+
+def backfill_profiles(batch_size=1000):
+    """
+    Create the missing profile of every user without one and return how many
+    users were missing one.
+    """
+    user_ids = list(users_without_profile().values_list('pk', flat=True))
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        with transaction.atomic():
+            Profile.objects.bulk_create([Profile(user_id=user_id) for user_id in batch], ignore_conflicts=True)
+            # Their cached copies were loaded without a profile.
+            for user_id in batch:
+                invalidate_cached_user(user_id)
+    return len(user_ids)
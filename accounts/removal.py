@@ -0,0 +1,131 @@
+"""
+Bans and account removals. Deleting a user directly cascades to everything they
+own in one transaction, which holds the SQLite write lock for as long as it takes
+to collect and delete it all. Here the user is made inactive at once, which logs
+them out, and their listings, bids, orders and searches are then removed in
+batches, each in its own short transaction. The deletes go through the ORM, so
+inboxes, cached pages and other users' listings are kept up to date by the usual
+signals.
+
+A ban stops at the user's market presence and keeps the account, their ratings
+and their reputation; a removal goes on to delete those too.
+"""
+import time
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from carry_services.models import CarryService, CarryServicePotentialBuyer
+from crafts.models import BuyOrder, Craft, CraftBid, CraftPotentialBuyer, craft_updated
+from inbox.models import InboxItem
+from saved_searches.models import SavedSearch
+from .models import AccountRemoval, Rating
+
+def delete_batch(queryset, batch_size):
+    pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+    if pks:
+        queryset.model.objects.filter(pk__in=pks).delete()
+    return len(pks)
+
+def release_purchases(model, user_id, batch_size):
+    """
+    Put listings the user was buying back on the market for their sellers.
+    """
+    listings = list(model.objects.filter(buyer=user_id)[:batch_size])
+    for listing in listings:
+        listing.buyer = None
+        listing.seller_trade_outcome = None
+        listing.buyer_trade_outcome = None
+        listing.save()
+    return len(listings)
+
+def reset_led_auctions(user_id, batch_size):
+    """
+    Hand open auctions the user is winning to the best of the other bids.
+    """
+    crafts = list(Craft.objects.filter(highest_bidder=user_id, buyer=None)[:batch_size])
+    for craft in crafts:
+        bid = craft.bids.exclude(bidder=user_id).order_by('-amount', 'created_at').first()
+        # A bid placed since the craft was read is left as the leading one.
+        updated = Craft.objects.filter(pk=craft.pk, highest_bidder=user_id).update(
+            highest_bid=None if bid == None else bid.amount, highest_bidder=None if bid == None else bid.bidder_id, updated_at=timezone.now()
+        )
+        if updated:
+            craft_updated.send(sender=Craft, instance=craft)
+    return len(crafts)
+
+# Each step handles at most a batch and returns how many objects it handled, so
+# it is run until it returns 0. Steps only look at what is left, which makes
+# running one again after an interruption safe.
+STEPS = [
+    ('craft interest', lambda user_id, batch_size: delete_batch(CraftPotentialBuyer.objects.filter(buyer=user_id), batch_size)),
+    ('carry service interest', lambda user_id, batch_size: delete_batch(CarryServicePotentialBuyer.objects.filter(buyer=user_id), batch_size)),
+    ('craft purchases', lambda user_id, batch_size: release_purchases(Craft, user_id, batch_size)),
+    ('carry service purchases', lambda user_id, batch_size: release_purchases(CarryService, user_id, batch_size)),
+    ('leading bids', reset_led_auctions),
+    ('bids', lambda user_id, batch_size: delete_batch(CraftBid.objects.filter(bidder=user_id), batch_size)),
+    ('buy orders', lambda user_id, batch_size: delete_batch(BuyOrder.objects.filter(buyer=user_id), batch_size)),
+    ('saved searches', lambda user_id, batch_size: delete_batch(SavedSearch.objects.filter(user=user_id), batch_size)),
+    ('crafts', lambda user_id, batch_size: delete_batch(Craft.objects.filter(seller=user_id), batch_size)),
+    ('carry services', lambda user_id, batch_size: delete_batch(CarryService.objects.filter(seller=user_id), batch_size)),
+    ('inbox', lambda user_id, batch_size: delete_batch(InboxItem.objects.filter(user=user_id), batch_size)),
+]
+REMOVAL_STEPS = STEPS + [
+    ('searches for the seller', lambda user_id, batch_size: delete_batch(SavedSearch.objects.filter(seller=user_id), batch_size)),
+    ('ratings', lambda user_id, batch_size: delete_batch(Rating.objects.filter(Q(rater=user_id) | Q(ratee=user_id)), batch_size)),
+    ('account', lambda user_id, batch_size: delete_batch(User.objects.filter(pk=user_id), batch_size)),
+]
+
+def steps(action):
+    return REMOVAL_STEPS if action == AccountRemoval.REMOVE else STEPS
+
+def request_removal(user, action=AccountRemoval.BAN):
+    """
+    Make the user inactive and schedule the removal of what they own. Asking to
+    remove a user who is being banned turns the ban into a removal.
+    """
+    with transaction.atomic():
+        if user.is_active:
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+        removal = AccountRemoval.objects.select_for_update().filter(user_id=user.pk, finished_at=None).first()
+        if removal == None:
+            return AccountRemoval.objects.create(user_id=user.pk, username=user.username, action=action)
+        if action == AccountRemoval.REMOVE and removal.action != action:
+            removal.action = action
+            removal.save(update_fields=['action', 'updated_at'])
+        return removal
+
+def run_removal(removal, batch_size=100, pause=0, report=None):
+    """
+    Run the steps of removal from the one it stopped at, one batch per
+    transaction, sleeping pause seconds between batches so other writers get the
+    database. report is called with the removal, step and batch count after
+    every batch.
+    """
+    while True:
+        names = [name for name, step in steps(removal.action)]
+        start = names.index(removal.step) if removal.step in names else 0
+        for name, step in steps(removal.action)[start:]:
+            while True:
+                with transaction.atomic():
+                    count = step(removal.user_id, batch_size)
+                    removal.step = name
+                    removal.processed += count
+                    removal.save(update_fields=['step', 'processed', 'updated_at'])
+                if report != None:
+                    report(removal, name, count)
+                if count == 0:
+                    break
+                if pause:
+                    time.sleep(pause)
+        # Only finished as the action it ran; a ban turned into a removal while
+        # it ran goes on with the steps of the removal.
+        now = timezone.now()
+        if AccountRemoval.objects.filter(pk=removal.pk, action=removal.action).update(finished_at=now, updated_at=now):
+            removal.finished_at = removal.updated_at = now
+            return
+        removal.refresh_from_db(fields=['action'])
+
+def pending_removals():
+    return AccountRemoval.objects.filter(finished_at=None).order_by('pk')
@@ -1,7 +1,25 @@
-from accounts.models import Profile
-from django.test import TestCase
+from accounts.models import AccountRemoval, Profile, Rating
+from accounts.removal import request_removal, reset_led_auctions, run_removal
+from accounts.backends import CachedModelBackend
+from accounts.lookup import reputation_cache
+from accounts.provisioning import backfill_profiles, import_users
+from autocomplete.index import username_index
+from accounts.trust import TrustGraph, compute_trust, normalize
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import QuerySet
+from django.test import Client, TestCase
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+import io
+from unittest import mock
+from classifications.models import Classification
+from crafts.models import Craft, CraftBid, CraftPotentialBuyer
+from carry_services.models import CarryService
+from inbox.models import InboxItem
 
 # You must run collectstatic before running the tests
 
@@ -123,4 +141,360 @@ class ProfileUpdateViewTests(TestCase):
         new_name = "new name"
         response = self.client.post(reverse('accounts:character-name-change'), data={'character_name': new_name})
         self.assertEqual(response.status_code, 302)
-        self.assertEqual(Profile.objects.get(user=test_user).character_name, new_name)
\ No newline at end of file
+        self.assertEqual(Profile.objects.get(user=test_user).character_name, new_name)
+
+class CachedAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user('test_user', 'test_user@example.com', 'password')
+        self.client.force_login(self.user)
+        return super().setUp()
+
+    def test_warm_request_makes_no_queries(self):
+        """
+        Once the session and user are cached an authenticated page should not query the database.
+        """
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.wsgi_request.user, self.user)
+
+    def test_profile_update_refreshes_cached_user(self):
+        """
+        Changing the character name should be seen by the next request.
+        """
+        self.client.get(reverse('home'))
+        self.client.post(reverse('accounts:character-name-change'), data={'character_name': 'new name'})
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.wsgi_request.user.profile.character_name, 'new name')
+
+    def test_user_update_refreshes_cached_user(self):
+        """
+        Changing the username should be seen by the next request.
+        """
+        self.client.get(reverse('home'))
+        self.client.post(reverse('accounts:user-update'), data={'username': 'renamed', 'email': 'renamed@example.com'})
+        self.assertContains(self.client.get(reverse('home')), 'renamed')
+
+    def test_password_change_logs_out_other_sessions(self):
+        """
+        Other sessions should be logged out once the password changes, while the current one stays.
+        """
+        self.user.set_password('password')
+        self.user.save()
+        other = Client()
+        other.force_login(self.user)
+        self.client.force_login(self.user)
+        self.assertEqual(other.get(reverse('accounts:profile')).status_code, 200)
+        response = self.client.post(reverse('accounts:password-change'), data={'old_password': 'password', 'new_password1': 'a-much-better-passw0rd', 'new_password2': 'a-much-better-passw0rd'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get(reverse('accounts:profile')).status_code, 200)
+        self.assertEqual(other.get(reverse('accounts:profile')).status_code, 302)
+
+class TrustGraphTests(TestCase):
+
+    def test_colluding_ring_does_not_gain_trust(self):
+        """
+        A ring of users rating only each other should not gain trust from the pre-trusted users.
+        """
+        # 0 is pre-trusted and rates 1 and 2, who rate each other and 0. 3, 4 and 5 only rate each other.
+        edges = [(0, 1, 1), (0, 2, 1), (1, 2, 1), (2, 1, 1), (1, 0, 1), (3, 4, 5), (4, 5, 5), (5, 3, 5)]
+        graph = TrustGraph(6, edges)
+        trust, _ = graph.iterate(normalize([1, 0, 0, 0, 0, 0]))
+        self.assertAlmostEqual(sum(trust), 1)
+        for honest in (0, 1, 2):
+            for colluder in (3, 4, 5):
+                self.assertGreater(trust[honest], trust[colluder])
+
+    def test_negative_ratings_do_not_give_trust(self):
+        """
+        A user rated only negatively should only get the trust all users share.
+        """
+        graph = TrustGraph(3, [(0, 1, 1), (0, 2, -3)])
+        trust, _ = graph.iterate(normalize([1, 1, 1]))
+        self.assertGreater(trust[1], trust[2])
+
+    def test_warm_start_converges_faster(self):
+        """
+        Starting from the previous result should need fewer iterations than starting from scratch.
+        """
+        edges = [(i, (i * 7 + 3) % 50, 1) for i in range(50)] + [(i, (i * 11 + 5) % 50, 1) for i in range(50)]
+        pretrust = normalize([1] + [0] * 49)
+        trust, cold_iterations = TrustGraph(50, edges).iterate(pretrust)
+        graph = TrustGraph(50, edges + [(1, 2, 1)])
+        _, warm_iterations = graph.iterate(pretrust, trust)
+        self.assertLess(warm_iterations, cold_iterations)
+
+class ComputeTrustTests(TestCase):
+
+    def test_trust_is_written_to_profiles(self):
+        """
+        Computing trust should write the scores to profiles with 1.0 as the average.
+        """
+        user1 = create_user('test1', 'test1@example.com', 'password')
+        user2 = create_user('test2', 'test2@example.com', 'password')
+        user3 = create_user('test3', 'test3@example.com', 'password')
+        Rating.objects.create(rater=user1, ratee=user2, positive=True)
+        Rating.objects.create(rater=user2, ratee=user1, positive=True)
+        Rating.objects.create(rater=user1, ratee=user3, positive=False)
+        compute_trust()
+        trust = dict(Profile.objects.values_list('user__username', 'trust'))
+        self.assertAlmostEqual(sum(trust.values()), 3)
+        self.assertGreater(trust['test2'], trust['test3'])
+        self.assertGreater(trust['test1'], trust['test3'])
+
+    def test_cached_users_get_new_trust(self):
+        """
+        Computing trust should drop cached users so their profile shows the new trust.
+        """
+        user1 = create_user('test1', 'test1@example.com', 'password')
+        user2 = create_user('test2', 'test2@example.com', 'password')
+        Rating.objects.create(rater=user1, ratee=user2, positive=True)
+        backend = CachedModelBackend()
+        self.assertEqual(backend.get_user(user2.pk).profile.trust, 0)
+        compute_trust()
+        self.assertEqual(backend.get_user(user2.pk).profile.trust, Profile.objects.get(user=user2).trust)
+        self.assertGreater(backend.get_user(user2.pk).profile.trust, 0)
+
+class ReputationLookupViewTests(TestCase):
+
+    def setUp(self):
+        reputation_cache.clear()
+        log_in_with_user(self)
+        return super().setUp()
+
+    def create_player(self, username, character_name, reputation):
+        user = create_user(username, username + '@example.com', 'password')
+        user.profile.character_name = character_name
+        user.profile.reputation = reputation
+        user.profile.save()
+        return user
+
+    def test_lookup_by_character_name_and_username(self):
+        """
+        Names should be matched case-insensitively against character names and exactly against usernames.
+        """
+        self.create_player('test1', 'Aragorn', 3)
+        self.create_player('test2', 'Legolas', -1)
+        response = self.client.get(reverse('accounts:reputation-lookup'), {'name': ['aragorn', 'test2', 'Gimli']})
+        self.assertEqual(response.status_code, 200)
+        players = response.json()['players']
+        self.assertEqual(players['aragorn']['username'], 'test1')
+        self.assertEqual(players['aragorn']['reputation'], 3)
+        self.assertEqual(players['test2']['character_name'], 'Legolas')
+        self.assertEqual(players['Gimli'], None)
+
+    def test_lookup_is_one_query_and_then_cached(self):
+        """
+        A batch should be answered with one query and then served from the cache.
+        """
+        for i in range(20):
+            self.create_player('test%d' % i, 'Character%d' % i, i)
+        names = ['character%d' % i for i in range(20)]
+        self.client.get(reverse('accounts:reputation-lookup'), {'name': names[:1]})
+        with self.assertNumQueries(1):
+            # The session and user come from the cache, so only the profiles are queried.
+            self.client.get(reverse('accounts:reputation-lookup'), {'name': names})
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('accounts:reputation-lookup'), {'name': names})
+        self.assertEqual(response.json()['players']['character19']['reputation'], 19)
+
+    def test_character_names_win_whatever_is_cached(self):
+        """
+        A character name should win over a username even when only the username was cached.
+        """
+        self.create_player('Boromir', '', 1)
+        self.client.get(reverse('accounts:reputation-lookup'), {'name': 'Boromir'})
+        self.create_player('test1', 'Boromir', 5)
+        response = self.client.get(reverse('accounts:reputation-lookup'), {'name': 'Boromir'})
+        self.assertEqual(response.json()['players']['Boromir']['username'], 'test1')
+        self.client.get(reverse('accounts:reputation-lookup'), {'name': 'Boromir'})
+        reputation_cache.delete('character:boromir')
+        response = self.client.get(reverse('accounts:reputation-lookup'), {'name': 'Boromir'})
+        self.assertEqual(response.json()['players']['Boromir']['username'], 'test1')
+
+    def test_settlement_invalidates_cache(self):
+        """
+        Changing the profile should drop the cached reputation.
+        """
+        user = self.create_player('test1', 'Aragorn', 3)
+        self.client.get(reverse('accounts:reputation-lookup'), {'name': 'Aragorn'})
+        profile = Profile.objects.get(user=user)
+        profile.reputation = 4
+        profile.save()
+        response = self.client.get(reverse('accounts:reputation-lookup'), {'name': 'Aragorn'})
+        self.assertEqual(response.json()['players']['Aragorn']['reputation'], 4)
+
+    def test_too_many_names(self):
+        """
+        Looking up too many names at once should be rejected.
+        """
+        response = self.client.get(reverse('accounts:reputation-lookup'), {'name': ['name%d' % i for i in range(301)]})
+        self.assertEqual(response.status_code, 400)
+
+class ImportUsersTests(TestCase):
+
+    def test_users_are_created_with_profiles(self):
+        """
+        Imported users should get their profile, hashed password and character name.
+        """
+        password = make_password('secret')
+        counts = import_users([
+            {'username': 'test1', 'email': 'test1@example.com', 'password': password, 'character_name': 'Aragorn'},
+            {'username': 'test2', 'email': '', 'password': '', 'character_name': ''},
+            {'username': 'test3', 'email': '', 'password': password, 'character_name': 'Gimli'},
+        ], batch_size=2)
+        self.assertEqual(counts, {'created': 3, 'skipped': 0})
+        user = User.objects.select_related('profile').get(username='test1')
+        self.assertTrue(user.check_password('secret'))
+        self.assertEqual(user.profile.character_name, 'Aragorn')
+        self.assertEqual(user.profile.reputation, 0)
+        self.assertFalse(User.objects.get(username='test2').has_usable_password())
+        self.assertEqual(Profile.objects.count(), 3)
+
+    def test_existing_usernames_are_skipped(self):
+        """
+        Usernames that already exist should be left as they are.
+        """
+        user = create_user('test1', 'test1@example.com', 'password')
+        counts = import_users([{'username': 'test1', 'email': 'other@example.com'}, {'username': 'test2'}])
+        self.assertEqual(counts, {'created': 1, 'skipped': 1})
+        self.assertEqual(User.objects.get(pk=user.pk).email, 'test1@example.com')
+
+    def test_plain_passwords_are_refused(self):
+        """
+        A password that is not hashed should stop the import, and leave none of its users behind.
+        """
+        with self.assertRaises(ValueError):
+            import_users([{'username': 'test1'}, {'username': 'test2'}, {'username': 'test3', 'password': 'secret'}], batch_size=2)
+        self.assertFalse(User.objects.exists())
+
+    def test_imported_users_reach_the_indexes(self):
+        """
+        Imported users should be completed and found by a character name looked up before.
+        """
+        log_in_with_user(self)
+        create_user('Aragorn', 'aragorn@example.com', 'password')
+        reputation_cache.clear()
+        username_index.rebuild()
+        self.client.get(reverse('accounts:reputation-lookup'), {'name': 'Aragorn'})
+        with self.captureOnCommitCallbacks(execute=True):
+            import_users([{'username': 'strider', 'character_name': 'Aragorn'}])
+        self.assertEqual(username_index.complete('stri'), ['strider'])
+        response = self.client.get(reverse('accounts:reputation-lookup'), {'name': 'Aragorn'})
+        self.assertEqual(response.json()['players']['Aragorn']['username'], 'strider')
+
+    def test_missing_profiles_are_backfilled(self):
+        """
+        Users created without post_save should get their profile from the checker.
+        """
+        User.objects.bulk_create([User(username='test1'), User(username='test2')])
+        create_user('test3', 'test3@example.com', 'password')
+        self.assertEqual(backfill_profiles(), 2)
+        self.assertEqual(Profile.objects.count(), 3)
+        self.assertEqual(backfill_profiles(), 0)
+
+class AccountRemovalTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user('banned', 'banned@example.com', 'password')
+        self.other = create_user('other', 'other@example.com', 'password')
+        self.classification = Classification.objects.create(name='apple', has_crafts=True)
+        for _ in range(3):
+            Craft.objects.create(classification=self.classification, seller=self.user, amount=1, price=1, currency='gold')
+        self.wanted = Craft.objects.create(classification=self.classification, seller=self.other, amount=1, price=1, currency='gold')
+        CraftPotentialBuyer.objects.create(craft=self.wanted, buyer=self.user)
+        self.bought = CarryService.objects.create(seller=self.other, buyer=self.user, price=1, currency='gold', seller_trade_outcome=True)
+        Rating.objects.create(rater=self.other, ratee=self.user, positive=True)
+        return super().setUp()
+
+    def test_ban_keeps_the_account(self):
+        """
+        A ban should log the user out at once, and its run should remove their
+        listings and interest and give their purchases back to the sellers.
+        """
+        removal = request_removal(self.user)
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+        self.assertEqual(Craft.objects.filter(seller=self.user).count(), 3)
+        run_removal(removal, batch_size=2)
+        self.assertEqual(Craft.objects.filter(seller=self.user).count(), 0)
+        self.assertFalse(CraftPotentialBuyer.objects.exists())
+        self.bought.refresh_from_db()
+        self.assertEqual((self.bought.buyer, self.bought.seller_trade_outcome), (None, None))
+        self.assertEqual(list(InboxItem.objects.values_list('user', 'kind')), [(self.other.pk, InboxItem.SELLING), (self.other.pk, InboxItem.SELLING)])
+        self.assertTrue(Rating.objects.filter(ratee=self.user).exists())
+        self.assertTrue(User.objects.filter(pk=self.user.pk).exists())
+        self.assertNotEqual(AccountRemoval.objects.get().finished_at, None)
+
+    def test_removal_resumes_where_it_stopped(self):
+        """
+        A removal interrupted halfway should carry on from its step and end by
+        deleting the account.
+        """
+        removal = request_removal(self.user, AccountRemoval.REMOVE)
+        AccountRemoval.objects.filter(pk=removal.pk).update(step='crafts', processed=5)
+        call_command('process_account_removals', batch_size=2, pause=0, stdout=io.StringIO())
+        removal.refresh_from_db()
+        # Three crafts, two inbox items, a rating and the account.
+        self.assertEqual(removal.processed, 5 + 3 + 2 + 1 + 1)
+        self.assertEqual(removal.step, 'account')
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Rating.objects.exists())
+        self.assertNotEqual(removal.finished_at, None)
+
+    def test_ban_upgraded_to_removal(self):
+        """
+        Asking to remove a user who is being banned should turn the ban into a removal.
+        """
+        ban = request_removal(self.user)
+        removal = request_removal(self.user, AccountRemoval.REMOVE)
+        self.assertEqual(removal.pk, ban.pk)
+        self.assertEqual(AccountRemoval.objects.get().action, AccountRemoval.REMOVE)
+
+    def test_ban_upgraded_while_running(self):
+        """
+        A ban turned into a removal while it runs should go on to delete the account.
+        """
+        ban = request_removal(self.user)
+        def upgrade(removal, name, count):
+            if name == 'crafts':
+                request_removal(self.user, AccountRemoval.REMOVE)
+        run_removal(ban, report=upgrade)
+        ban.refresh_from_db()
+        self.assertEqual(ban.action, AccountRemoval.REMOVE)
+        self.assertEqual(ban.step, 'account')
+        self.assertNotEqual(ban.finished_at, None)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+
+    def test_leading_bid_placed_meanwhile_is_kept(self):
+        """
+        A bid that overtook the user since their auctions were read should stay the leading one.
+        """
+        auction = Craft.objects.create(classification=self.classification, seller=self.other, amount=1, price=1, currency='gold', is_auction=True, auction_ends_at=timezone.now() + timedelta(hours=1))
+        third = create_user('third', 'third@example.com', 'password')
+        auction.place_bid(third, 5)
+        auction.place_bid(self.user, 6)
+        first = QuerySet.first
+        def first_then_outbid(queryset):
+            bid = first(queryset)
+            if queryset.model == CraftBid:
+                Craft.objects.filter(pk=auction.pk).update(highest_bid=7, highest_bidder=third)
+            return bid
+        with mock.patch.object(QuerySet, 'first', first_then_outbid):
+            self.assertEqual(reset_led_auctions(self.user.pk, 10), 1)
+        auction.refresh_from_db()
+        self.assertEqual((auction.highest_bid, auction.highest_bidder), (7, third))
+
+    def test_leading_bid_goes_to_the_next_bidder(self):
+        """
+        Auctions the user was winning should go to the next best bid.
+        """
+        auction = Craft.objects.create(classification=self.classification, seller=self.other, amount=1, price=1, currency='gold', is_auction=True, auction_ends_at=timezone.now() + timedelta(hours=1))
+        third = create_user('third', 'third@example.com', 'password')
+        auction.place_bid(third, 5)
+        auction.place_bid(self.user, 6)
+        run_removal(request_removal(self.user))
+        auction.refresh_from_db()
+        self.assertEqual((auction.highest_bid, auction.highest_bidder), (5, third))
+        self.assertEqual(list(CraftBid.objects.values_list('bidder', flat=True)), [third.pk])
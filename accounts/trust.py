@@ -0,0 +1,95 @@
+"""
+EigenTrust style global trust computed from the ratings users give each other
+when a trade is settled.
+
+The transposed local trust matrix C^T is built once as a scipy CSR matrix, so one
+power iteration step is a single sparse matrix-vector product.
+"""
+import numpy
+from scipy import sparse
+from django.contrib.auth.models import User
+from django.db.models import Case, IntegerField, Sum, Value, When
+from listing_cache.versions import TRUST, bump, version_key
+from .backends import invalidate_cached_user
+from .lookup import reputation_cache
+from .models import Profile, Rating
+
+class TrustGraph:
+
+    def __init__(self, size, edges):
+        """
+        Build the graph from (rater, ratee, score) edges where rater and ratee are
+        node indexes below size. Only positive aggregated scores count as trust.
+        """
+        self.size = size
+        edges = numpy.array([edge for edge in edges if edge[2] > 0 and edge[0] != edge[1]], dtype=float).reshape(-1, 3)
+        raters, ratees, scores = edges[:, 0].astype(numpy.intp), edges[:, 1].astype(numpy.intp), edges[:, 2]
+        out_sum = numpy.bincount(raters, weights=scores, minlength=size)
+        # Row j holds the normalized trust c_ij every rater i places in j.
+        self.matrix = sparse.csr_matrix((scores / out_sum[raters], (ratees, raters)), shape=(size, size))
+        self.dangling = out_sum == 0
+        self.edge_count = len(edges)
+
+    def iterate(self, pretrust, initial=None, alpha=0.15, tolerance=1e-8, max_iterations=100):
+        """
+        Run the power iteration t = (1 - alpha) * C^T t + alpha * p until the L1
+        change drops below tolerance. Passing the previous result as initial warm
+        starts the iteration. Returns the trust vector and the iteration count.
+        """
+        pretrust = numpy.asarray(pretrust, dtype=float)
+        trust = numpy.asarray(normalize(initial if initial is not None else pretrust), dtype=float)
+        iteration = 0
+        for iteration in range(1, max_iterations + 1):
+            # Users who have not rated anyone hand their trust to the pre-trusted users.
+            dangling_mass = trust[self.dangling].sum()
+            new_trust = (1 - alpha) * (self.matrix @ trust + dangling_mass * pretrust) + alpha * pretrust
+            delta = numpy.abs(new_trust - trust).sum()
+            trust = new_trust
+            if delta < tolerance:
+                break
+        return trust.tolist(), iteration
+
+def normalize(vector):
+    total = sum(vector)
+    if total <= 0:
+        return [1.0 / len(vector)] * len(vector)
+    return [value / total for value in vector]
+
+def rating_edges():
+    """
+    Aggregate settlement ratings into (rater, ratee, score) edges, +1 per positive
+    and -1 per negative rating.
+    """
+    score = Sum(Case(When(positive=True, then=Value(1)), default=Value(-1), output_field=IntegerField()))
+    return Rating.objects.values_list('rater', 'ratee').annotate(score=score).order_by()
+
+def compute_trust(warm_start=True, **kwargs):
+    """
+    Recompute the trust of every profile and write it back. Trust is stored scaled
+    by the number of users so that 1.0 is the average trust. Returns the number of
+    iterations the power iteration needed.
+    """
+    profiles = list(Profile.objects.only('pk', 'user', 'trust').order_by('user'))
+    if not profiles:
+        return 0
+    index = {profile.user_id: i for i, profile in enumerate(profiles)}
+    size = len(profiles)
+    graph = TrustGraph(size, ((index[rater], index[ratee], score) for rater, ratee, score in rating_edges() if rater in index and ratee in index))
+    staff = set(User.objects.filter(is_staff=True, is_active=True).values_list('pk', flat=True))
+    pretrust = normalize([1.0 if profile.user_id in staff else 0.0 for profile in profiles])
+    initial = None
+    if warm_start and any(profile.trust > 0 for profile in profiles):
+        initial = [profile.trust for profile in profiles]
+    trust, iterations = graph.iterate(pretrust, initial, **kwargs)
+    changed = []
+    for profile, value in zip(profiles, trust):
+        if profile.trust != value * size:
+            profile.trust = value * size
+            changed.append(profile)
+    Profile.objects.bulk_update(changed, ['trust'], batch_size=500)
+    reputation_cache.clear()
+    # bulk_update sends no post_save, so drop the cached users holding the old trust.
+    for profile in changed:
+        invalidate_cached_user(profile.user_id)
+    bump([version_key(TRUST)])
+    return iterations
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import CustomLogOutView, CustomLogInView, CustomPasswordChangeDoneView, CustomPasswordChangeView, ProfileDetailView, ProfileUpdateView, RegistrationView, UserUpdateView
+from .views import CustomLogOutView, CustomLogInView, CustomPasswordChangeDoneView, CustomPasswordChangeView, ProfileDetailView, ProfileUpdateView, RegistrationView, ReputationLookupView, UserUpdateView
 
 app_name = 'accounts'
 urlpatterns = [
@@ -10,5 +10,6 @@ urlpatterns = [
     path('account_update/', UserUpdateView.as_view(), name='user-update'),
     path('profile/', ProfileDetailView.as_view(), name='profile'),
     path('registration/', RegistrationView.as_view(), name='registration'),
-    path('change_character_name/', ProfileUpdateView.as_view(), name='character-name-change')
+    path('change_character_name/', ProfileUpdateView.as_view(), name='character-name-change'),
+    path('api/reputation/', ReputationLookupView.as_view(), name='reputation-lookup')
 ]
@@ -7,6 +7,11 @@ from django.views.generic.edit import CreateView, UpdateView
 from django.views.generic.base import TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.http import JsonResponse
+from django.views.generic.base import View
+from .lookup import reputation_cache
 
 class UserUpdateView(LoginRequiredMixin, UpdateView):
     model = User
@@ -50,4 +55,58 @@ class ProfileUpdateView(LoginRequiredMixin, UpdateView):
         return Profile.objects.get(user=self.request.user)
 
 class HomePageView(TemplateView):
-    template_name = 'home.html'
\ No newline at end of file
+    template_name = 'home.html'
+
+class ReputationLookupView(LoginRequiredMixin, View):
+    """
+    Batched reputation lookup for the game client overlay. Takes repeated name
+    parameters, each matched case-insensitively against character names and
+    exactly against usernames, and answers all of them with at most one query.
+    """
+    max_names = 300
+
+    def get(self, request, *args, **kwargs):
+        names = list(dict.fromkeys(request.GET.getlist('name')))
+        if len(names) > self.max_names:
+            return JsonResponse({'error': 'At most %d names can be looked up at once.' % self.max_names}, status=400)
+        character_keys = {name: 'character:' + name.lower() for name in names}
+        username_keys = {name: 'username:' + name for name in names}
+        found = reputation_cache.get_many(list(character_keys.values()) + list(username_keys.values()))
+        # Which one a name matches depends on its character key, so a name is only
+        # answered from the cache once it is known whether a character has it.
+        missing = [
+            name for name in names
+            if character_keys[name] not in found or (found[character_keys[name]] == None and username_keys[name] not in found)
+        ]
+        if missing:
+            profiles = Profile.objects.annotate(character_name_lower=Lower('character_name')).filter(
+                # The username subquery keeps both sides of the OR on an index.
+                Q(character_name_lower__in=[name.lower() for name in missing]) | Q(user__in=User.objects.filter(username__in=missing).values('pk'))
+            ).values('user_id', 'user__username', 'character_name', 'reputation', 'trust').order_by('pk')
+            for profile in profiles:
+                value = {
+                    'user_id': profile['user_id'],
+                    'username': profile['user__username'],
+                    'character_name': profile['character_name'],
+                    'reputation': profile['reputation'],
+                    'trust': profile['trust'],
+                }
+                keys = ['username:' + profile['user__username']]
+                if profile['character_name']:
+                    keys.append('character:' + profile['character_name'].lower())
+                for key in keys:
+                    if found.get(key) == None:
+                        found[key] = value
+                        reputation_cache.set(key, value)
+            for name in missing:
+                if character_keys[name] not in found:
+                    found[character_keys[name]] = None
+                    reputation_cache.set(character_keys[name], None)
+        players = {}
+        for name in names:
+            # Character names are what the overlay sees in game, so they win over usernames.
+            value = found.get(character_keys[name])
+            if value == None:
+                value = found.get(username_keys[name])
+            players[name] = None if value == None else {field: value[field] for field in ('username', 'character_name', 'reputation', 'trust')}
+        return JsonResponse({'players': players})
@@ -0,0 +1,154 @@
+"""
+In-process prefix indexes for the search box completions. An index is a sorted
+list of casefolded names searched with bisect, so a lookup is a binary search
+and a scan of at most limit entries, without touching the database.
+
+Indexes are built when the process starts and kept current in this process by
+signals. A background thread rebuilds them every AUTOCOMPLETE_REBUILD_INTERVAL
+seconds, which picks up changes made in other processes and by bulk writes that
+send no signals. A rebuild loads into new lists and swaps them in, replaying the
+signalled changes it missed while it was loading.
+"""
+import atexit
+import bisect
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+logger = logging.getLogger(__name__)
+
+class PrefixIndex:
+
+    def __init__(self, load):
+        # load() returns (id, name) pairs for every entry.
+        self.load = load
+        self.entries = []
+        self.names = {}
+        self.built_at = None
+        # Changes signalled while a rebuild is loading, as (id, name or None).
+        self.pending = None
+        self.lock = threading.Lock()
+        self.rebuild_lock = threading.Lock()
+
+    def rebuild(self):
+        with self.rebuild_lock:
+            with self.lock:
+                self.pending = []
+            try:
+                names = dict(self.load())
+            except Exception:
+                with self.lock:
+                    self.pending = None
+                raise
+            entries = sorted((name.casefold(), name) for name in names.values())
+            with self.lock:
+                pending, self.pending = self.pending, None
+                self.names, self.entries, self.built_at = names, entries, time.monotonic()
+                for id, name in pending:
+                    self._apply(id, name)
+
+    def complete(self, prefix, limit=10):
+        """
+        Up to limit names starting with prefix, ignoring case, in sorted order.
+        """
+        key = prefix.casefold()
+        if not key:
+            return []
+        completions = []
+        with self.lock:
+            start = bisect.bisect_left(self.entries, (key,))
+            for entry_key, name in self.entries[start:start + limit]:
+                if not entry_key.startswith(key):
+                    break
+                completions.append(name)
+        return completions
+
+    def set(self, id, name):
+        with self.lock:
+            self._apply(id, name)
+
+    def remove(self, id):
+        with self.lock:
+            self._apply(id, None)
+
+    def clear(self):
+        with self.lock:
+            self.names, self.entries, self.built_at = {}, [], None
+
+    def _apply(self, id, name):
+        if self.pending != None:
+            self.pending.append((id, name))
+        # An index that was never built gets the change with its first build.
+        if self.built_at == None:
+            return
+        self._discard(id)
+        if name != None:
+            self.names[id] = name
+            bisect.insort(self.entries, (name.casefold(), name))
+
+    def _discard(self, id):
+        name = self.names.pop(id, None)
+        if name != None:
+            entry = (name.casefold(), name)
+            position = bisect.bisect_left(self.entries, entry)
+            if position < len(self.entries) and self.entries[position] == entry:
+                del self.entries[position]
+
+class IndexRebuilder:
+    """
+    Builds the indexes when the process starts and rebuilds them in a background
+    thread, so completions never wait on the database.
+    """
+
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def rebuild(self):
+        for index in self.indexes:
+            try:
+                index.rebuild()
+            except DatabaseError:
+                logger.exception('Could not rebuild a completion index, keeping the last one.')
+
+    def start(self):
+        """
+        Build the indexes and start the background rebuilds. Called from the WSGI
+        and ASGI entry points, like the view counter.
+        """
+        if self.thread != None:
+            return
+        self.rebuild()
+        connection.close()
+        interval = getattr(settings, 'AUTOCOMPLETE_REBUILD_INTERVAL', 300)
+        if not interval:
+            return
+        self.thread = threading.Thread(target=self.run, args=(interval,), name='autocomplete-rebuilder', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self, interval):
+        while not self.stopped.wait(interval):
+            self.rebuild()
+            connection.close()
+
+def load_classifications():
+    from classifications.models import Classification
+    return Classification.objects.values_list('name', 'name').iterator()
+
+def load_usernames():
+    from django.contrib.auth.models import User
+    return User.objects.values_list('pk', 'username').iterator()
+
+classification_index = PrefixIndex(load_classifications)
+username_index = PrefixIndex(load_usernames)
+
+INDEXES = {'classification': classification_index, 'user': username_index}
+
+rebuilder = IndexRebuilder(INDEXES.values())
@@ -0,0 +1,30 @@
+import random
+import string
+import time
+from django.core.management.base import BaseCommand
+from autocomplete.index import PrefixIndex
+
+class Command(BaseCommand):
+    help = 'Time prefix completions against an in-process index of random names.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--names', type=int, default=100000)
+        parser.add_argument('--lookups', type=int, default=100000)
+        parser.add_argument('--limit', type=int, default=10)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        names = {i: ''.join(rng.choices(string.ascii_letters + string.digits, k=rng.randint(4, 16))) for i in range(options['names'])}
+        index = PrefixIndex(lambda: names.items())
+        started = time.perf_counter()
+        index.rebuild()
+        self.stdout.write('Built an index of %d names in %.2fs.' % (len(names), time.perf_counter() - started))
+        prefixes = [name[:rng.randint(1, 3)] for name in rng.choices(list(names.values()), k=options['lookups'])]
+        started = time.perf_counter()
+        for prefix in prefixes:
+            index.complete(prefix, options['limit'])
+        self.stdout.write('Top %d completions: %.2f us per lookup.' % (options['limit'], (time.perf_counter() - started) / len(prefixes) * 1e6))
+        started = time.perf_counter()
+        for i in range(1000):
+            index.set(rng.randrange(len(names)), 'renamed%d' % i)
+        self.stdout.write('Renames: %.2f us each.' % ((time.perf_counter() - started) / 1000 * 1e6))
@@ -0,0 +1,32 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.dispatch import receiver
+from django.db.models.signals import post_delete, post_save
+from accounts.models import users_imported
+from classifications.models import Classification
+from .index import classification_index, username_index
+
+@receiver(post_save, sender=Classification)
+def index_classification(sender, instance, **kwargs):
+    transaction.on_commit(lambda: classification_index.set(instance.pk, instance.name))
+
+@receiver(post_delete, sender=Classification)
+def unindex_classification(sender, instance, **kwargs):
+    transaction.on_commit(lambda: classification_index.remove(instance.pk))
+
+@receiver(post_save, sender=User)
+def index_username(sender, instance, update_fields=None, **kwargs):
+    if update_fields != None and 'username' not in update_fields:
+        return
+    pk, username = instance.pk, instance.username
+    transaction.on_commit(lambda: username_index.set(pk, username))
+
+@receiver(post_delete, sender=User)
+def unindex_username(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: username_index.remove(pk))
+
+@receiver(users_imported)
+def index_imported_usernames(sender, users, **kwargs):
+    for user_id, username, character_name in users:
+        username_index.set(user_id, username)
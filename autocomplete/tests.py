@@ -0,0 +1,96 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from classifications.models import Classification
+from .index import IndexRebuilder, PrefixIndex, classification_index, username_index
+
+def create_user(username, email, password):
+    """
+    Create a user with given username, email and password.
+    """
+    return User.objects.create(username=username, email=email, password=password)
+
+def complete(self, kind, q, **params):
+    return self.client.get(reverse('autocomplete:autocomplete'), {'kind': kind, 'q': q, **params}).json()['completions']
+
+class AutocompleteViewTests(TestCase):
+
+    def setUp(self):
+        classification_index.clear()
+        username_index.clear()
+        self.user = create_user('test_user', 'test_user@example.com', 'password')
+        self.client.force_login(self.user)
+        return super().setUp()
+
+    def test_prefix_completions(self):
+        """
+        Names starting with the prefix should be completed in order, ignoring case.
+        """
+        for name in ['apple', 'Apricot', 'banana', 'applesauce']:
+            Classification.objects.create(name=name)
+        classification_index.rebuild()
+        self.assertEqual(complete(self, 'classification', 'AP'), ['apple', 'applesauce', 'Apricot'])
+        self.assertEqual(complete(self, 'classification', 'ap', limit=1), ['apple'])
+        self.assertEqual(complete(self, 'classification', 'c'), [])
+        self.assertEqual(complete(self, 'classification', ''), [])
+
+    def test_completions_do_not_query(self):
+        """
+        Lookups should be answered from memory, and an index that was never
+        built should answer nothing rather than load on the request.
+        """
+        create_user('seller', 'seller@example.com', 'password')
+        with self.assertNumQueries(0):
+            self.assertEqual(username_index.complete('sel'), [])
+        username_index.rebuild()
+        complete(self, 'user', 'a')
+        with self.assertNumQueries(0):
+            self.assertEqual(complete(self, 'user', 'sel'), ['seller'])
+            self.assertEqual(complete(self, 'user', 'test'), ['test_user'])
+
+    @override_settings(AUTOCOMPLETE_REBUILD_INTERVAL=0)
+    def test_indexes_are_built_at_start(self):
+        """
+        Starting the rebuilder should build its indexes.
+        """
+        Classification.objects.create(name='apple')
+        IndexRebuilder([classification_index, username_index]).start()
+        self.assertEqual(classification_index.complete('a'), ['apple'])
+        self.assertEqual(username_index.complete('t'), ['test_user'])
+
+    def test_changes_during_a_rebuild_are_kept(self):
+        """
+        Changes signalled while a rebuild loads should survive the swap.
+        """
+        def load():
+            yield 1, 'apple'
+            yield 2, 'apricot'
+            index.set(3, 'avocado')
+            index.remove(1)
+        index = PrefixIndex(load)
+        index.rebuild()
+        self.assertEqual(index.complete('a'), ['apricot', 'avocado'])
+
+    def test_signals_update_the_index(self):
+        """
+        Created, renamed and deleted users should be reflected once committed.
+        """
+        username_index.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            seller = create_user('seller', 'seller@example.com', 'password')
+        self.assertEqual(complete(self, 'user', 's'), ['seller'])
+        with self.captureOnCommitCallbacks(execute=True):
+            seller.username = 'vendor'
+            seller.save()
+        self.assertEqual(complete(self, 'user', 's'), [])
+        self.assertEqual(complete(self, 'user', 'v'), ['vendor'])
+        with self.captureOnCommitCallbacks(execute=True):
+            seller.delete()
+        self.assertEqual(complete(self, 'user', 'v'), [])
+
+    def test_unknown_kind(self):
+        """
+        Completing something other than classifications and users should be rejected.
+        """
+        response = self.client.get(reverse('autocomplete:autocomplete'), {'kind': 'craft', 'q': 'a'})
+        self.assertEqual(response.status_code, 400)
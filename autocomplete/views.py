@@ -0,0 +1,21 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import JsonResponse
+from django.views import View
+from .index import INDEXES
+
+class AutocompleteView(LoginRequiredMixin, View):
+    """
+    Completions for the search boxes. Takes the typed prefix as q, what to complete
+    as kind, classification or user, and answers from the in-process indexes.
+    """
+    max_limit = 50
+
+    def get(self, request, *args, **kwargs):
+        index = INDEXES.get(request.GET.get('kind', 'classification'))
+        if index == None:
+            return JsonResponse({'error': 'kind must be one of %s.' % ', '.join(sorted(INDEXES))}, status=400)
+        try:
+            limit = min(max(int(request.GET.get('limit', 10)), 1), self.max_limit)
+        except ValueError:
+            return JsonResponse({'error': 'limit must be a number.'}, status=400)
+        return JsonResponse({'completions': index.complete(request.GET.get('q', ''), limit)})
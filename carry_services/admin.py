@@ -1,4 +1,5 @@
 from django.contrib import admin
+from mysite.admin_utils import LargeTableAdmin, expire_listings, force_settle_listings
 
 from .models import CarryService, CarryServicePotentialBuyer
 
@@ -6,9 +7,12 @@ class CarryServicePotentialBuyerInline(admin.StackedInline):
     model = CarryServicePotentialBuyer
     extra = 0
 
-class CarryServiceAdmin(admin.ModelAdmin):
-    list_display = ('price', 'currency', 'seller', 'buyer', 'created_at')
+class CarryServiceAdmin(LargeTableAdmin, admin.ModelAdmin):
+    list_display = ('type', 'price', 'currency', 'seller', 'buyer', 'created_at')
+    list_select_related = ('currency', 'seller', 'buyer')
+    list_filter = ['type']
     inlines = [CarryServicePotentialBuyerInline]
-    search_fields = ['seller', 'buyer']
+    search_fields = ['seller__username', 'buyer__username']
+    actions = [expire_listings, force_settle_listings]
 
 admin.site.register(CarryService, CarryServiceAdmin)
\ No newline at end of file
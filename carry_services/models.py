@@ -1,10 +1,33 @@
 import uuid
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.dispatch import Signal, receiver
+from django.db.models.signals import post_delete, post_save, pre_save
+from accounts.models import Profile, Rating
+from currencies.models import CurrencyField, normalized_price
+
+# Sent with the carry service as instance when its trade settles, just before it is deleted.
+carry_service_settled = Signal()
 
 class CarryService(models.Model):
+    DUNGEON = 'dungeon'
+    RAID = 'raid'
+    LEVEL_BOOST = 'level_boost'
+    ACHIEVEMENT = 'achievement'
+    PVP = 'pvp'
+    OTHER = 'other'
+    TYPE_CHOICES = [
+        (DUNGEON, 'Dungeon'),
+        (RAID, 'Raid'),
+        (LEVEL_BOOST, 'Level boost'),
+        (ACHIEVEMENT, 'Achievement'),
+        (PVP, 'PvP'),
+        (OTHER, 'Other')
+    ]
     def validate_greater_than_zero(value):
         if value < 1:
             raise ValidationError(
@@ -12,14 +35,23 @@ class CarryService(models.Model):
                 params={'value': value}
             )
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    type = models.CharField(max_length=20, choices=TYPE_CHOICES, default=OTHER)
     price = models.IntegerField(validators=[validate_greater_than_zero])
-    currency = models.CharField(max_length=100)
+    currency = CurrencyField()
+    normalized_price = models.FloatField(default=None, null=True, editable=False)
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
     buyer = models.ForeignKey(User, default=None, null=True, blank=True, on_delete=models.SET_DEFAULT, related_name='+')
     seller_trade_outcome = models.BooleanField(default=None, null=True)
     buyer_trade_outcome = models.BooleanField(default=None, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    seller_reputation = models.IntegerField(default=0, editable=False)
     class Meta:
+        indexes = [
+            models.Index(fields=['-seller_reputation', 'price'], name='carry_service_best_sellers'),
+            models.Index(fields=['normalized_price'], name='carry_service_normalized_price'),
+            models.Index(fields=['type', 'normalized_price'], name='carry_service_type'),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=~models.Q(buyer=models.F('seller')),
@@ -29,7 +61,16 @@ class CarryService(models.Model):
 
     @property
     def potential_buyers(self):
-        return CarryServicePotentialBuyer.objects.filter(carry_service=self)
+        return CarryServicePotentialBuyer.objects.filter(carry_service=self).select_related('buyer__profile')
+
+    def ranked_potential_buyers(self):
+        """
+        Potential buyers with their profiles, best reputation first and then in
+        the order they joined, in a single joined query.
+        """
+        return User.objects.filter(carryservicepotentialbuyer__carry_service=self).exclude(pk=self.seller_id).select_related('profile').annotate(
+            joined_at=F('carryservicepotentialbuyer__created_at')
+        ).order_by('-profile__reputation', 'joined_at')
 
     def is_seller(self, user):
         return self.seller == user
@@ -40,13 +81,69 @@ class CarryService(models.Model):
     def is_buyer(self, user):
         return self.buyer == user
 
+    @transaction.atomic
+    def settle(self):
+        buyer_profile = Profile.objects.get(user=self.buyer)
+        seller_profile = Profile.objects.get(user=self.seller)
+        if self.seller_trade_outcome:
+            buyer_profile.reputation += 1
+        else:
+            buyer_profile.reputation -= 1
+        if self.buyer_trade_outcome:
+            seller_profile.reputation += 1
+        else:
+            seller_profile.reputation -= 1
+        buyer_profile.save()
+        seller_profile.save()
+        Rating.objects.bulk_create([
+            Rating(rater=self.seller, ratee=self.buyer, positive=self.seller_trade_outcome),
+            Rating(rater=self.buyer, ratee=self.seller, positive=self.buyer_trade_outcome)
+        ])
+        carry_service_settled.send(sender=CarryService, instance=self)
+        self.delete()
+
     def get_absolute_url(self):
         return reverse("carry_services:carry-service-detail", args=(self.pk, ))
 
+def carry_service_facets(queryset):
+    """
+    How many of the carry services in queryset there are of each type and in each
+    currency, counted by one grouped query.
+    """
+    types = dict.fromkeys(dict(CarryService.TYPE_CHOICES), 0)
+    currencies = {}
+    for type, currency, count in queryset.order_by().values_list('type', 'currency__code').annotate(count=Count('pk')):
+        types[type] = types.get(type, 0) + count
+        currencies[currency] = currencies.get(currency, 0) + count
+    return {
+        'types': [(type, label, types[type]) for type, label in CarryService.TYPE_CHOICES if types[type]],
+        'currencies': sorted(currencies.items()),
+    }
+
 class CarryServicePotentialBuyer(models.Model):
     carry_service = models.ForeignKey(CarryService, on_delete=models.CASCADE)
     buyer = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['carry_service', 'buyer'], name='carry_service_and_buyer_must_be_unique'),
         ]
+
+@receiver(pre_save, sender=CarryService)
+def copy_seller_reputation(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance.seller_reputation = Profile.objects.filter(user=instance.seller_id).values_list('reputation', flat=True).first() or 0
+
+@receiver(pre_save, sender=CarryService)
+def copy_normalized_price(sender, instance, **kwargs):
+    instance.normalized_price = normalized_price(instance.price, instance.currency_id)
+
+@receiver(post_save, sender=Profile)
+def sync_carry_service_seller_reputation(sender, instance, **kwargs):
+    CarryService.objects.filter(seller=instance.user_id).exclude(seller_reputation=instance.reputation).update(seller_reputation=instance.reputation)
+
+@receiver(post_delete, sender=CarryServicePotentialBuyer)
+def touch_carry_service(sender, instance, **kwargs):
+    # The carry service page lists its potential buyers, so losing one modifies the carry service.
+    CarryService.objects.filter(pk=instance.carry_service_id).update(updated_at=timezone.now())
@@ -33,7 +33,7 @@ class CarryServiceCreateViewTests(TestCase):
         User should be able to create a carry service.
         """
         log_in_with_user(self)
-        response = self.client.post(reverse('carry_services:carry-service-create'), data={'price': 100, 'currency': 'test'})
+        response = self.client.post(reverse('carry_services:carry-service-create'), data={'type': 'dungeon', 'price': 100, 'currency': 'test'})
         self.assertEqual(response.status_code, 302)
         self.assertEqual(CarryService.objects.count(), 1)
 
@@ -45,7 +45,7 @@ class CarryServiceCreateViewTests(TestCase):
         self.client.force_login(test_user)
         for _ in range(0,5):
             create_carry_service(test_user)
-        response = self.client.post(reverse('carry_services:carry-service-create'), data={'price': 100, 'currency': 'test'})
+        response = self.client.post(reverse('carry_services:carry-service-create'), data={'type': 'dungeon', 'price': 100, 'currency': 'test'})
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'You may not have more than')
 
@@ -579,4 +579,94 @@ class CarryServiceBuyerTradeOutcomeViewTests(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertEqual(CarryService.objects.filter(pk=carry_service4.pk).count(), 0)
         self.assertEqual(Profile.objects.get(user=user7).reputation, -1)
-        self.assertEqual(Profile.objects.get(user=user8).reputation, -1)
\ No newline at end of file
+        self.assertEqual(Profile.objects.get(user=user8).reputation, -1)
+
+class CarryServiceSellerReputationTests(TestCase):
+
+    def test_settlement_updates_open_carry_services_of_seller(self):
+        """
+        Settling a trade should update the seller reputation on the seller's open carry services.
+        """
+        user1 = create_user('test1', 'test1@example.com', 'password')
+        user2 = create_user('test2', 'test2@example.com', 'password')
+        carry_service = create_carry_service(user1, user2, seller_trade_outcome=False)
+        open_carry_service = create_carry_service(user1)
+        self.client.force_login(user2)
+        self.client.post(reverse('carry_services:carry-service-buyer-outcome', kwargs={'pk': carry_service.pk}), data={'outcome': 'False'})
+        self.assertEqual(CarryService.objects.get(pk=open_carry_service.pk).seller_reputation, -1)
+
+    def test_list_sorted_by_best_sellers_first(self):
+        """
+        Sorting by reputation should list the best sellers first and then by price.
+        """
+        log_in_with_user(self)
+        user1 = create_user('test1', 'test1@example.com', 'password')
+        user2 = create_user('test2', 'test2@example.com', 'password')
+        Profile.objects.filter(user=user2).update(reputation=5)
+        carry_service1 = create_carry_service(user1)
+        carry_service2 = CarryService.objects.create(seller=user2, price=10, currency="test")
+        carry_service3 = create_carry_service(user2)
+        response = self.client.get(reverse('carry_services:carry-service-list') + "?sort=reputation")
+        self.assertEqual(list(response.context['object_list']), [carry_service3, carry_service2, carry_service1])
+
+class CarryServiceAutoSelectBuyerViewTests(TestCase):
+
+    def test_auto_select_best_buyer(self):
+        """
+        Auto-selecting should pick the potential buyer with the best reputation.
+        """
+        seller = create_user('seller', 'seller@example.com', 'password')
+        user1 = create_user('test1', 'test1@example.com', 'password')
+        user2 = create_user('test2', 'test2@example.com', 'password')
+        Profile.objects.filter(user=user2).update(reputation=2)
+        carry_service = create_carry_service(seller)
+        create_carry_service_potential_buyer(carry_service, user1)
+        create_carry_service_potential_buyer(carry_service, user2)
+        self.client.force_login(seller)
+        response = self.client.get(reverse('carry_services:carry-service-select-buyer', kwargs={'pk': carry_service.pk}))
+        self.assertEqual(list(response.context['shortlist']), [user2, user1])
+        response = self.client.post(reverse('carry_services:carry-service-auto-select-buyer', kwargs={'pk': carry_service.pk}))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(CarryService.objects.get(pk=carry_service.pk).buyer, user2)
+
+class CarryServiceTypeTests(TestCase):
+    def setUp(self):
+        log_in_with_user(self)
+        self.seller = create_user('test1', 'test1@example.com', 'password')
+        self.raid = CarryService.objects.create(seller=self.seller, type=CarryService.RAID, price=10, currency='gold')
+        self.boost = CarryService.objects.create(seller=self.seller, type=CarryService.LEVEL_BOOST, price=20, currency='gold')
+        self.dungeon = CarryService.objects.create(seller=self.seller, type=CarryService.DUNGEON, price=30, currency='silver')
+        return super().setUp()
+
+    def test_search_by_type(self):
+        """
+        Searching by type should match the type names.
+        """
+        response = self.client.get(reverse('carry_services:carry-service-list'), {'searchby': 'type', 'search': 'level'})
+        self.assertEqual(list(response.context['object_list']), [self.boost])
+
+    def test_filter_by_type_and_currency(self):
+        """
+        The type and currency filters should narrow the list together.
+        """
+        url = reverse('carry_services:carry-service-list')
+        self.assertEqual(list(self.client.get(url, {'type': CarryService.DUNGEON}).context['object_list']), [self.dungeon])
+        response = self.client.get(url, {'currency': 'Gold', 'sort': 'price'})
+        self.assertEqual(list(response.context['object_list']), [self.raid, self.boost])
+        self.assertEqual(list(self.client.get(url, {'currency': 'gold', 'type': CarryService.DUNGEON}).context['object_list']), [])
+
+    def test_facet_counts(self):
+        """
+        Facets should count the carry services of each type and currency, and be
+        counted again only after a carry service changes.
+        """
+        url = reverse('carry_services:carry-service-list')
+        facets = self.client.get(url).context['facets']
+        self.assertEqual(facets['types'], [(CarryService.DUNGEON, 'Dungeon', 1), (CarryService.RAID, 'Raid', 1), (CarryService.LEVEL_BOOST, 'Level boost', 1)])
+        self.assertEqual(facets['currencies'], [('gold', 2), ('silver', 1)])
+        CarryService.objects.filter(pk=self.dungeon.pk).update(type=CarryService.RAID)
+        self.assertEqual(self.client.get(url).context['facets'], facets)
+        self.dungeon.refresh_from_db()
+        self.dungeon.save()
+        facets = self.client.get(url).context['facets']
+        self.assertEqual(facets['types'], [(CarryService.RAID, 'Raid', 2), (CarryService.LEVEL_BOOST, 'Level boost', 1)])
@@ -1,22 +1,58 @@
-from accounts.models import Profile
+import hashlib
+from django.db.models import F
 from django.views.generic.base import RedirectView
 from django.views.generic.edit import DeleteView, FormView
 from .forms import SelectBuyerForm, TradeOutcomeForm
 from django.views.generic import ListView, CreateView, DetailView, UpdateView
-from .models import CarryService, CarryServicePotentialBuyer
+from .models import CarryService, CarryServicePotentialBuyer, carry_service_facets
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.core.cache import cache
+from django.core.paginator import Paginator
 from django.urls import reverse
+from django.utils.http import urlencode
 from django.template.response import SimpleTemplateResponse
+from listing_cache.versions import CARRY_SERVICES, TRENDING, get_version, version_key
+from listing_cache.rows import CarryServiceRow, Rows
+from listing_cache.views import ConditionalGetMixin, listing_validators, version_validators
+from currencies.models import normalize_code
+from trending.counters import view_counter
+from trending.models import trending_carry_services
 
 
-class CarryServiceListView(LoginRequiredMixin, ListView):
+class CarryServiceListView(LoginRequiredMixin, ConditionalGetMixin, ListView):
     model = CarryService
+    def get_validators(self):
+        return version_validators((CARRY_SERVICES,), (TRENDING,))
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['search_by'] = self.request.GET.get("searchby", "seller")
         context['search'] = self.request.GET.get("search", "")
+        context['sort'] = self.request.GET.get("sort", "")
+        context['type'] = self.request.GET.get("type", "")
+        context['currency'] = self.request.GET.get("currency", "")
+        context['trending_list'] = trending_carry_services()
+        context['list_version'] = get_version(version_key(CARRY_SERVICES))
+        context['carry_service_rows'] = Rows(self.object_list, CarryServiceRow)
+        context['facet_query'] = urlencode({'searchby': context['search_by'], 'search': context['search'], 'sort': context['sort']})
+        context['facets'] = self.get_facets(context['list_version'], context['search_by'], context['search'])
         return context
+    def get_facets(self, list_version, search_by, search):
+        # Counted over the search before the type and currency filters, and kept
+        # until the next change to any carry service.
+        key = 'carry_service_facets:%s:%s' % (list_version, hashlib.md5(('%s:%s' % (search_by, search)).encode()).hexdigest())
+        return cache.get_or_set(key, lambda: carry_service_facets(self.get_search_queryset()), 600)
     def get_queryset(self):
+        queryset = self.get_search_queryset()
+        if self.request.GET.get("type"):
+            queryset = queryset.filter(type=self.request.GET["type"])
+        if self.request.GET.get("currency"):
+            queryset = queryset.filter(currency__code=normalize_code(self.request.GET["currency"]))
+        if self.request.GET.get("sort", None) == 'reputation':
+            return queryset.order_by('-seller_reputation', 'price')
+        if self.request.GET.get("sort", None) == 'price':
+            return queryset.order_by(F('normalized_price').asc(nulls_last=True), 'price', 'created_at')
+        return queryset
+    def get_search_queryset(self):
         search_by = self.request.GET.get("searchby", None)
         search = self.request.GET.get("search", None)
         if search_by != None and search != None:
@@ -25,13 +61,14 @@ class CarryServiceListView(LoginRequiredMixin, ListView):
             elif search_by == 'buyer':
                 return CarryService.objects.filter(buyer__username__contains=search)
             elif search_by == 'type':
-                return CarryService.objects.filter(type__contains=search)
+                search = search.casefold()
+                return CarryService.objects.filter(type__in=[type for type, label in CarryService.TYPE_CHOICES if search in label.casefold()])
         return super().get_queryset()
             
 
 class CarryServiceCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
     model = CarryService
-    fields = ['price', 'currency']
+    fields = ['type', 'price', 'currency']
     def test_func(self):
         return CarryService.objects.filter(seller = self.request.user).count() < 5
     def handle_no_permission(self):
@@ -40,8 +77,20 @@ class CarryServiceCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView
         form.instance.seller = self.request.user
         return super().form_valid(form)
 
-class CarryServiceDetailView(LoginRequiredMixin, DetailView):
+class CarryServiceDetailView(LoginRequiredMixin, ConditionalGetMixin, DetailView):
     model = CarryService
+    queryset = CarryService.objects.select_related('seller__profile', 'buyer__profile')
+
+    def get_validators(self):
+        row = CarryService.objects.filter(pk=self.kwargs['pk']).values_list('updated_at', 'seller', 'buyer').first()
+        if row == None:
+            return None
+        updated_at, seller, buyer = row
+        potential_buyers = CarryServicePotentialBuyer.objects.filter(carry_service=self.kwargs['pk']).order_by('pk').values_list('buyer', 'updated_at')
+        return listing_validators(updated_at, [seller, buyer], list(potential_buyers))
+
+    def record_view(self):
+        view_counter.record('carry_service', self.kwargs['pk'])
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -83,11 +132,35 @@ class RemoveCarryServicePotentialBuyerView(LoginRequiredMixin, UserPassesTestMix
 class CarryServiceSelectBuyerView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     model = CarryService
     form_class = SelectBuyerForm
+    template_name = 'carry_services/carryservice_select_buyer.html'
+    paginate_by = 20
     def test_func(self):
         self.object = self.get_object()
         does_not_have_buyer = self.object.buyer == None
         return self.object.is_seller(self.request.user) and does_not_have_buyer
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        paginator = Paginator(context['form'].fields['buyer'].queryset, self.paginate_by)
+        context['shortlist'] = paginator.get_page(self.request.GET.get('page'))
+        return context
+
+class CarryServiceAutoSelectBuyerView(LoginRequiredMixin, UserPassesTestMixin, RedirectView):
+    http_method_names=['post']
+    pattern_name='carry_services:carry-service-detail'
+
+    def get_redirect_url(self, *args, **kwargs):
+        best_buyer = self.object.ranked_potential_buyers().first()
+        if best_buyer != None:
+            self.object.buyer = best_buyer
+            self.object.save()
+        return reverse('carry_services:carry-service-detail', kwargs={'pk': kwargs['pk']})
+
+    def test_func(self):
+        self.object = CarryService.objects.get(pk=self.kwargs['pk'])
+        does_not_have_buyer = self.object.buyer == None
+        return self.object.is_seller(self.request.user) and does_not_have_buyer
+
 class CarryServiceDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     model = CarryService
 
@@ -118,26 +191,14 @@ class CarryServiceSellerTradeOutcomeView(CarryServiceTradeOutcomeView):
     def form_valid(self, form):
         self.object = self.get_object()
         
+        if form.cleaned_data['outcome'] == 'True':
+            self.object.seller_trade_outcome = True
+        else:
+            self.object.seller_trade_outcome = False
         if self.object.buyer_trade_outcome == None:
-            if form.cleaned_data['outcome'] == 'True':
-                self.object.seller_trade_outcome = True
-            else:
-                self.object.seller_trade_outcome = False
             self.object.save()
         else:
-            buyer_profile = Profile.objects.get(user=self.object.buyer)
-            seller_profile = Profile.objects.get(user=self.object.seller)
-            if form.cleaned_data['outcome'] == 'True':
-                buyer_profile.reputation += 1
-            else:
-                buyer_profile.reputation -= 1
-            if self.object.buyer_trade_outcome:
-                seller_profile.reputation += 1
-            else:
-                seller_profile.reputation -= 1
-            buyer_profile.save()
-            seller_profile.save()
-            self.object.delete()
+            self.object.settle()
         return super().form_valid(form)
 
     def test_func(self):
@@ -151,26 +212,14 @@ class CarryServiceBuyerTradeOutcomeView(CarryServiceTradeOutcomeView):
     def form_valid(self, form):
         self.object = self.get_object()
         
+        if form.cleaned_data['outcome'] == 'True':
+            self.object.buyer_trade_outcome = True
+        else:
+            self.object.buyer_trade_outcome = False
         if self.object.seller_trade_outcome == None:
-            if form.cleaned_data['outcome'] == 'True':
-                self.object.buyer_trade_outcome = True
-            else:
-                self.object.buyer_trade_outcome = False
             self.object.save()
         else:
-            buyer_profile = Profile.objects.get(user=self.object.buyer)
-            seller_profile = Profile.objects.get(user=self.object.seller)
-            if form.cleaned_data['outcome'] == 'True':
-                seller_profile.reputation += 1
-            else:
-                seller_profile.reputation -= 1
-            if self.object.seller_trade_outcome:
-                buyer_profile.reputation += 1
-            else:
-                buyer_profile.reputation -= 1
-            buyer_profile.save()
-            seller_profile.save()
-            self.object.delete()
+            self.object.settle()
         return super().form_valid(form)
 
     def test_func(self):
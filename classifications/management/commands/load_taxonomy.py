@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from classifications.taxonomy import load_taxonomy, read_csv, read_json
+
+class Command(BaseCommand):
+    help = 'Create or update classifications from a JSON or CSV taxonomy, writing only the nodes that changed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='A JSON array of classifications, as in a fixture, or a CSV file with name, parent, has_picture and has_crafts columns.')
+        parser.add_argument('--format', choices=['json', 'csv'], help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'json')
+        read = read_csv if file_format == 'csv' else read_json
+        started = time.perf_counter()
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as stream:
+                counts = load_taxonomy(read(stream), batch_size=options['batch_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+        self.stdout.write('Created %d, updated %d and left %d classifications unchanged (%.2fs).' % (
+            counts['created'], counts['updated'], counts['unchanged'], time.perf_counter() - started
+        ))
@@ -0,0 +1,141 @@
+"""
+Bulk loading of large classification trees. Files are read one node at a time,
+compared with the stored tree, and only new or changed nodes are written, parents
+before children, in batched upserts.
+"""
+import csv
+import json
+import re
+from django.db import transaction
+from listing_cache.versions import CLASSIFICATIONS, bump, version_key
+from .models import Classification
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+TRUE = {'1', 'true', 'yes', 't', 'y'}
+
+def iter_json_array(stream, chunk_size=1 << 16):
+    """
+    Yield the items of a top level JSON array one at a time, reading the stream in
+    chunks instead of all at once.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position = '', 0
+
+    def fill():
+        nonlocal buffer, position
+        chunk = stream.read(chunk_size)
+        buffer, position = buffer[position:] + chunk, 0
+        return chunk != ''
+
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            position = WHITESPACE.match(buffer, position).end()
+            if position < len(buffer) or not fill():
+                return position < len(buffer)
+
+    if not skip_whitespace() or buffer[position] != '[':
+        raise ValueError('Expected a JSON array.')
+    position += 1
+    while True:
+        if not skip_whitespace():
+            raise ValueError('Unexpected end of JSON input.')
+        if buffer[position] == ']':
+            return
+        if buffer[position] == ',':
+            position += 1
+            continue
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if not fill():
+                raise
+            continue
+        yield item
+
+def to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in TRUE
+    return bool(value)
+
+def node(fields):
+    """
+    A (name, parent, has_picture, has_crafts) tuple from a row or a fixture object.
+    """
+    if 'fields' in fields:
+        fields = dict(fields['fields'], name=fields.get('pk', fields['fields'].get('name')))
+    name = fields.get('name')
+    if not name:
+        raise ValueError('Classification without a name: %r' % (fields,))
+    return (name, fields.get('parent') or None, to_bool(fields.get('has_picture', False)), to_bool(fields.get('has_crafts', False)))
+
+def read_json(stream):
+    """
+    Nodes from a JSON array of fixture objects or of flat objects with name,
+    parent, has_picture and has_crafts.
+    """
+    for item in iter_json_array(stream):
+        yield node(item)
+
+def read_csv(stream):
+    """
+    Nodes from CSV with a header row naming the name, parent, has_picture and
+    has_crafts columns.
+    """
+    for row in csv.DictReader(stream):
+        yield node(row)
+
+def tree_depths(parents, names):
+    """
+    The depth of each of names in the tree given by the parents mapping, raising
+    ValueError for unknown parents and cycles.
+    """
+    depths = {None: -1}
+    for name in names:
+        path, seen = [], set()
+        while name not in depths:
+            if name in seen:
+                raise ValueError('Classification "%s" is its own ancestor.' % name)
+            if name not in parents:
+                raise ValueError('Parent "%s" of classification "%s" does not exist.' % (name, path[-1]))
+            seen.add(name)
+            path.append(name)
+            name = parents[name]
+        for child in reversed(path):
+            depths[child] = depths[name] + 1
+            name = child
+    return depths
+
+def load_taxonomy(nodes, batch_size=1000):
+    """
+    Create or update the classifications in nodes and return how many were
+    created, updated and left unchanged. Nodes may come in any order; classifications
+    missing from nodes are kept.
+    """
+    stored = {row[0]: row[1:] for row in Classification.objects.values_list('name', 'parent', 'has_picture', 'has_crafts').iterator()}
+    loaded = {}
+    for name, *fields in nodes:
+        loaded[name] = tuple(fields)
+    changed = [name for name, fields in loaded.items() if stored.get(name) != fields]
+    parents = {name: fields[0] for name, fields in stored.items()}
+    parents.update((name, fields[0]) for name, fields in loaded.items())
+    depths = tree_depths(parents, changed)
+    counts = {'created': sum(1 for name in changed if name not in stored), 'unchanged': len(loaded) - len(changed)}
+    counts['updated'] = len(changed) - counts['created']
+    if not changed:
+        return counts
+    changed.sort(key=depths.__getitem__)
+    with transaction.atomic():
+        Classification.objects.bulk_create(
+            [Classification(name=name, parent_id=loaded[name][0], has_picture=loaded[name][1], has_crafts=loaded[name][2]) for name in changed],
+            batch_size=batch_size, update_conflicts=True, unique_fields=['name'], update_fields=['parent', 'has_picture', 'has_crafts'],
+        )
+        # bulk_create sends no signals, so the cached pages showing these nodes
+        # are refreshed here once: the node, its old and new parent and the root list.
+        keys = {version_key(CLASSIFICATIONS)}
+        for name in changed:
+            keys.add(version_key('classification', name))
+            for parent in {loaded[name][0], stored.get(name, (None,))[0]} - {None}:
+                keys.add(version_key('classification', parent))
+        bump(keys)
+    return counts
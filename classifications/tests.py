@@ -1,5 +1,11 @@
+import io
+import json
+import os
+import tempfile
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 from .models import Classification
+from .taxonomy import iter_json_array
 from crafts.models import Craft
 from django.contrib.auth.models import User
 from django.urls import reverse
@@ -22,6 +28,18 @@ def create_user(username, email, password):
     """
     return User.objects.create(username=username, email=email, password=password)
 
+def write_taxonomy(text, suffix):
+    """
+    Write a taxonomy file with the given text and return its path.
+    """
+    taxonomy = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False)
+    with taxonomy:
+        taxonomy.write(text)
+    return taxonomy.name
+
+def tree():
+    return list(Classification.objects.order_by('name').values_list('name', 'parent', 'has_picture', 'has_crafts'))
+
 def log_in_with_user(self):
     self.client.force_login(create_user('test_user', 'test_user@example.com', 'password'))
 
@@ -124,4 +142,75 @@ class ClassificationDetailViewTests(TestCase):
             response.context['craft_list'],
             [craft2, craft1],
             ordered=False
-        )
\ No newline at end of file
+        )
+
+    def test_sort_by_best_sellers_first(self):
+        """
+        Sorting by reputation should list crafts of the best sellers first and then by price.
+        """
+        user1 = create_user('test1', 'test1@example.com', 'password')
+        user2 = create_user('test2', 'test2@example.com', 'password')
+        user2.profile.reputation = 5
+        user2.profile.save()
+        classification1 = create_classification('test1')
+        craft1 = create_craft(classification1, user1)
+        craft2 = Craft.objects.create(classification=classification1, seller=user2, amount=1, price=10, currency="test")
+        craft3 = create_craft(classification1, user2)
+        response = self.client.get(reverse('classifications:classification-detail', args=[classification1.pk]) + "?sort=reputation")
+        self.assertEqual(list(response.context['craft_list']), [craft3, craft2, craft1])
+
+class LoadTaxonomyTests(TestCase):
+
+    def load(self, text, suffix='.json'):
+        path = write_taxonomy(text, suffix)
+        self.addCleanup(os.remove, path)
+        call_command('load_taxonomy', path, stdout=io.StringIO())
+
+    def test_children_before_parents(self):
+        """
+        Children listed before their parents should be loaded under them.
+        """
+        self.load(json.dumps([
+            {'name': 'apple', 'parent': 'fruit', 'has_crafts': True},
+            {'model': 'classifications.classification', 'pk': 'fruit', 'fields': {'parent': 'food'}},
+            {'name': 'food', 'parent': None},
+        ]))
+        self.assertEqual(tree(), [('apple', 'fruit', False, True), ('food', None, False, False), ('fruit', 'food', False, False)])
+
+    def test_reloading_unchanged_taxonomy_writes_nothing(self):
+        """
+        Loading the same taxonomy again should only read the stored tree.
+        """
+        text = json.dumps([{'name': 'fruit'}, {'name': 'apple', 'parent': 'fruit'}])
+        self.load(text)
+        with self.assertNumQueries(1):
+            self.load(text)
+
+    def test_csv_updates_changed_nodes(self):
+        """
+        A CSV taxonomy should update moved and changed nodes and keep the others.
+        """
+        create_classification('fruit')
+        create_classification('vegetable')
+        create_classification('onion', Classification.objects.get(name='fruit'))
+        self.load('name,parent,has_picture,has_crafts\nonion,vegetable,true,true\nkiwi,fruit,false,1\n', '.csv')
+        self.assertEqual(tree(), [('fruit', None, False, False), ('kiwi', 'fruit', False, True), ('onion', 'vegetable', True, True), ('vegetable', None, False, False)])
+
+    def test_invalid_tree_is_not_loaded(self):
+        """
+        Cycles and unknown parents should be refused without writing anything.
+        """
+        with self.assertRaisesMessage(CommandError, 'own ancestor'):
+            self.load(json.dumps([{'name': 'a', 'parent': 'b'}, {'name': 'b', 'parent': 'a'}]))
+        with self.assertRaisesMessage(CommandError, 'Parent "fruit" of classification "apple" does not exist.'):
+            self.load(json.dumps([{'name': 'apple', 'parent': 'fruit'}]))
+        self.assertEqual(tree(), [])
+
+    def test_json_is_read_in_chunks(self):
+        """
+        Items should be parsed across chunk boundaries.
+        """
+        items = [{'name': 'item %d' % i, 'parent': None} for i in range(20)]
+        self.assertEqual(list(iter_json_array(io.StringIO(json.dumps(items, indent=2)), chunk_size=7)), items)
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO('[{"name": "a"}, '), chunk_size=4))
@@ -1,21 +1,46 @@
+from django.db.models import F
 from django.views.generic import ListView, DetailView
 from .models import Classification
 from django.contrib.auth.mixins import LoginRequiredMixin
 from crafts.models import Craft
+from listing_cache.versions import CLASSIFICATIONS, TRENDING, get_version, version_key
+from listing_cache.rows import CraftRow, Rows
+from listing_cache.views import ConditionalGetMixin, version_validators
+from django.utils import timezone
+from market.models import bucket_start, market_stats
+from trending.models import trending_crafts
 
-class ClassificationListView(LoginRequiredMixin, ListView):
+class ClassificationListView(LoginRequiredMixin, ConditionalGetMixin, ListView):
     model = Classification
 
+    def get_validators(self):
+        return version_validators((CLASSIFICATIONS,))
+
     def get_queryset(self):
         return Classification.objects.filter(parent=None)
 
-class ClassificationDetailView(LoginRequiredMixin, DetailView):
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['list_version'] = get_version(version_key(CLASSIFICATIONS))
+        return context
+
+class ClassificationDetailView(LoginRequiredMixin, ConditionalGetMixin, DetailView):
     model = Classification
 
+    def get_validators(self):
+        # Missing classifications get no version keys.
+        if not Classification.objects.filter(pk=self.kwargs['pk']).exists():
+            return None
+        parts, last_modified = version_validators(('classification', self.kwargs['pk']), (TRENDING,))
+        # Market windows move on with every bucket, even when nothing settles.
+        bucket = bucket_start(timezone.now())
+        return (parts, bucket), max(last_modified, bucket)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['search_by'] = self.request.GET.get("searchby", "seller")
         context['search'] = self.request.GET.get("search", "")
+        context['sort'] = self.request.GET.get("sort", "")
         self.object = self.get_object()
         all_craft = Craft.objects.filter(classification=self.object)
         if context['search_by'] != None and context['search'] != None:
@@ -25,5 +50,13 @@ class ClassificationDetailView(LoginRequiredMixin, DetailView):
                 context['craft_list'] = all_craft.filter(buyer__username__contains=context['search'])
             else:
                 context['craft_list'] = all_craft.all()
+        if context['sort'] == 'reputation':
+            context['craft_list'] = context['craft_list'].order_by('-seller_reputation', 'price')
+        elif context['sort'] == 'price':
+            context['craft_list'] = context['craft_list'].order_by(F('normalized_price').asc(nulls_last=True), 'price', 'created_at')
+        context['craft_rows'] = Rows(context['craft_list'], CraftRow)
         context['classification_list'] = Classification.objects.filter(parent=self.object)
+        context['trending_list'] = trending_crafts(self.object)
+        context['market_stats'] = market_stats(self.object) if self.object.has_crafts else {}
+        context['list_version'] = get_version(version_key('classification', self.object.pk))
         return context
\ No newline at end of file
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from mysite.admin_utils import LargeTableAdmin, expire_listings, force_settle_listings
 
 from .models import Craft, CraftPotentialBuyer
 
@@ -6,10 +7,12 @@ class CraftPotentialBuyerInline(admin.StackedInline):
     model = CraftPotentialBuyer
     extra = 0
 
-class CraftAdmin(admin.ModelAdmin):
+class CraftAdmin(LargeTableAdmin, admin.ModelAdmin):
     list_display = ('classification', 'amount', 'price', 'currency', 'seller', 'buyer', 'created_at')
+    list_select_related = ('classification', 'currency', 'seller', 'buyer')
     inlines = [CraftPotentialBuyerInline]
     list_filter = ['classification']
-    search_fields = ['seller', 'buyer']
+    search_fields = ['seller__username', 'buyer__username']
+    actions = [expire_listings, force_settle_listings]
 
 admin.site.register(Craft, CraftAdmin)
\ No newline at end of file
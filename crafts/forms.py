@@ -1,10 +1,10 @@
 from django import forms
-from .models import Craft, CraftPotentialBuyer
+from .models import Craft
 from django.contrib.auth.models import User
 
 class UserModelChoiceField(forms.ModelChoiceField):
     def label_from_instance(self, obj):
-        return obj.username
+        return '%s, reputation: %d' % (obj.username, obj.profile.reputation)
 
 class SelectBuyerForm(forms.ModelForm):
     class Meta:
@@ -16,8 +16,10 @@ class SelectBuyerForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super(SelectBuyerForm, self).__init__(*args, **kwargs)
         if self.instance:
-            pks = CraftPotentialBuyer.objects.filter(craft=self.instance).exclude(buyer=self.instance.seller).values('buyer')
-            self.fields['buyer'].queryset = User.objects.filter(pk__in=pks)
+            self.fields['buyer'].queryset = self.instance.ranked_potential_buyers()
+
+class BidForm(forms.Form):
+    amount = forms.IntegerField(min_value=1)
 
 class TradeOutcomeForm(forms.Form):
     TRUE_FALSE_CHOICES = [
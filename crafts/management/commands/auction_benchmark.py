@@ -0,0 +1,83 @@
+import random
+import statistics
+import threading
+import time
+import uuid
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.utils import timezone
+from classifications.models import Classification
+from crafts.models import Craft, CraftBid
+
+class Command(BaseCommand):
+    help = 'Place bids on one auction from many threads at once and check that the bid book stayed consistent.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=200)
+        parser.add_argument('--bids', type=int, default=5, help='Bids placed by each thread.')
+
+    def handle(self, *args, **options):
+        threads, bids = options['threads'], options['bids']
+        run = uuid.uuid4().hex[:8]
+        classification, _ = Classification.objects.get_or_create(name='auction-benchmark', defaults={'has_crafts': True})
+        seller = User.objects.create(username='auction-benchmark-seller-' + run)
+        # Bidders do not need profiles, so skip the post_save receiver.
+        bidders = User.objects.bulk_create([User(username='auction-benchmark-%s-%d' % (run, i)) for i in range(threads)])
+        craft = Craft.objects.create(classification=classification, seller=seller, amount=1, price=1, currency='benchmark', is_auction=True, auction_ends_at=timezone.now() + timedelta(hours=1))
+        try:
+            self.benchmark(craft, bidders, bids)
+        finally:
+            craft.delete()
+            User.objects.filter(pk__in=[seller.pk] + [bidder.pk for bidder in bidders]).delete()
+
+    def benchmark(self, craft, bidders, bids):
+        barrier = threading.Barrier(len(bidders))
+        lock = threading.Lock()
+        accepted, rejected, errors, latencies = [], [0], [0], []
+
+        def bid(bidder, seed):
+            rng = random.Random(seed)
+            barrier.wait()
+            try:
+                for _ in range(bids):
+                    amount = rng.randint(1, len(bidders) * bids)
+                    started = time.perf_counter()
+                    try:
+                        ok = craft.place_bid(bidder, amount)
+                    except OperationalError:
+                        with lock:
+                            errors[0] += 1
+                        continue
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        if ok:
+                            accepted.append(amount)
+                        else:
+                            rejected[0] += 1
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=bid, args=(bidder, i)) for i, bidder in enumerate(bidders)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        craft.refresh_from_db()
+        book = list(CraftBid.objects.filter(craft=craft).order_by('pk').values_list('amount', flat=True))
+        attempts = len(latencies) + errors[0]
+        self.stdout.write('%d threads placed %d bids in %.2fs (%.0f bids/s).' % (len(bidders), attempts, elapsed, attempts / elapsed))
+        self.stdout.write('Accepted %d, outbid %d, database errors %d.' % (len(accepted), rejected[0], errors[0]))
+        if latencies:
+            latencies.sort()
+            self.stdout.write('Latency p50 %.1fms, p99 %.1fms.' % (statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.99) - 1] * 1000))
+        if len(book) != len(accepted) or any(a >= b for a, b in zip(book, book[1:])):
+            raise CommandError('Accepted bids were not strictly increasing: %s' % book)
+        if accepted and craft.highest_bid != max(accepted):
+            raise CommandError('Highest bid %s is not the best accepted bid %d.' % (craft.highest_bid, max(accepted)))
+        self.stdout.write(self.style.SUCCESS('Bid book is consistent: highest bid %s.' % craft.highest_bid))
@@ -0,0 +1,33 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from crafts.matching import BookOrder, OrderBook
+
+class Command(BaseCommand):
+    help = 'Measure the in-memory order book: standing buy orders added and listings matched per second.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--listings', type=int, default=100000)
+        parser.add_argument('--markets', type=int, default=100, help='Number of (classification, currency) pairs.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        markets = [('classification-%d' % i, 'gold') for i in range(options['markets'])]
+        book = OrderBook()
+
+        orders = [BookOrder(pk, rng.randrange(1000), rng.randint(50, 150), rng.randint(1, 20)) for pk in range(1, options['orders'] + 1)]
+        keys = [rng.choice(markets) for _ in orders]
+        started = time.perf_counter()
+        for key, order in zip(keys, orders):
+            book.add(key, order)
+        elapsed = time.perf_counter() - started
+        self.stdout.write('Added %d buy orders in %.2fs (%.0f orders/s).' % (len(orders), elapsed, len(orders) / elapsed))
+
+        listings = [(rng.choice(markets), rng.randint(50, 150), rng.randint(1, 20), rng.randrange(1000)) for _ in range(options['listings'])]
+        fills = 0
+        started = time.perf_counter()
+        for key, price, amount, seller_id in listings:
+            fills += len(book.match(key, price, amount, seller_id))
+        elapsed = time.perf_counter() - started
+        self.stdout.write('Matched %d listings into %d fills in %.2fs (%.0f listings/s).' % (len(listings), fills, elapsed, len(listings) / elapsed))
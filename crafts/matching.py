@@ -0,0 +1,203 @@
+"""
+Price-time priority matching of craft listings against standing buy orders.
+
+Standing buy orders are kept in memory in one heap per (classification, currency),
+highest max price first and oldest first within a price. The heaps are only an
+index: every fill is confirmed with a conditional write on the row being
+contended for, so a stale in-memory book can cost a retry but never a double fill.
+"""
+import heapq
+import threading
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from currencies.models import normalized_price
+from .models import BuyOrder, Craft, craft_updated
+
+class BookOrder:
+    __slots__ = ('pk', 'buyer_id', 'max_price', 'remaining')
+
+    def __init__(self, pk, buyer_id, max_price, remaining):
+        self.pk = pk
+        self.buyer_id = buyer_id
+        self.max_price = max_price
+        self.remaining = remaining
+
+class OrderBook:
+
+    def __init__(self):
+        self.books = {}
+        self.orders = {}
+        self.last_pk = 0
+
+    def add(self, key, order):
+        if order.pk in self.orders or order.remaining <= 0:
+            return
+        self.orders[order.pk] = order
+        # Primary keys grow with creation time, so they double as the time priority.
+        heapq.heappush(self.books.setdefault(key, []), (-order.max_price, order.pk, order))
+        self.last_pk = max(self.last_pk, order.pk)
+
+    def cancel(self, pk):
+        order = self.orders.pop(pk, None)
+        if order != None:
+            order.remaining = 0
+
+    def best(self, key, price, seller_id=None):
+        """
+        Return the best order willing to pay at least price, skipping the seller's own orders.
+        """
+        heap = self.books.get(key)
+        if not heap:
+            return None
+        skipped = []
+        best = None
+        while heap:
+            _, pk, order = heap[0]
+            if order.remaining <= 0:
+                heapq.heappop(heap)
+                self.orders.pop(pk, None)
+            elif order.max_price < price:
+                break
+            elif order.buyer_id == seller_id:
+                skipped.append(heapq.heappop(heap))
+            else:
+                best = order
+                break
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        return best
+
+    def match(self, key, price, quantity, seller_id=None, reserve=None):
+        """
+        Fill up to quantity at price or better. reserve(order, quantity) is called
+        before each fill is taken from the book; when it returns False it must
+        have refreshed order.remaining, and matching moves on.
+        Returns a list of (order, quantity) fills.
+        """
+        fills = []
+        while quantity > 0:
+            order = self.best(key, price, seller_id)
+            if order == None:
+                break
+            filled = min(quantity, order.remaining)
+            if reserve != None and not reserve(order, filled):
+                continue
+            order.remaining -= filled
+            quantity -= filled
+            fills.append((order, filled))
+        return fills
+
+class ListingTaken(Exception):
+    pass
+
+def take_listing(craft, quantity, price, buy_order_id, buyer_id):
+    """
+    Move quantity of an open listing to a buyer. The listing is only written if it
+    still has the amount read earlier. A partial fill is split off into a craft of its
+    own, so every fill goes through trade outcomes and settlement separately.
+    Returns the craft recording the fill.
+    """
+    open_listing = Craft.objects.filter(pk=craft.pk, buyer=None, amount=craft.amount)
+    if quantity == craft.amount:
+        if not open_listing.update(buyer=buyer_id, price=price, normalized_price=normalized_price(price, craft.currency_id), buy_order=buy_order_id, updated_at=timezone.now()):
+            raise ListingTaken()
+        craft.buyer_id = buyer_id
+        craft.price = price
+        craft.normalized_price = normalized_price(price, craft.currency_id)
+        craft.buy_order_id = buy_order_id
+        craft_updated.send(sender=Craft, instance=craft)
+        return craft
+    if not open_listing.update(amount=F('amount') - quantity, updated_at=timezone.now()):
+        raise ListingTaken()
+    craft.amount -= quantity
+    craft_updated.send(sender=Craft, instance=craft)
+    return Craft.objects.create(
+        classification_id=craft.classification_id, currency_id=craft.currency_id, seller_id=craft.seller_id,
+        amount=quantity, price=price, buyer_id=buyer_id, buy_order_id=buy_order_id
+    )
+
+class MatchingEngine:
+    """
+    The process-wide order book. It is rebuilt from the database on first use and
+    picks up orders placed by other processes by primary key before every match.
+    """
+
+    def __init__(self):
+        self.book = None
+        self.lock = threading.RLock()
+
+    def rebuild(self):
+        with self.lock:
+            self.book = OrderBook()
+            self.load(BuyOrder.objects.filter(remaining__gt=0))
+
+    def sync(self):
+        if self.book == None:
+            self.rebuild()
+        else:
+            self.load(BuyOrder.objects.filter(remaining__gt=0, pk__gt=self.book.last_pk))
+
+    def load(self, orders):
+        for pk, buyer_id, classification_id, currency, max_price, remaining in orders.order_by('pk').values_list('pk', 'buyer', 'classification', 'currency', 'max_price', 'remaining'):
+            self.book.add((classification_id, currency), BookOrder(pk, buyer_id, max_price, remaining))
+
+    def match_listing(self, craft):
+        """
+        Fill a new listing against standing buy orders at each order's price.
+        Returns the crafts recording the fills.
+        """
+        if craft.is_auction or craft.buyer_id != None:
+            return []
+        fills = []
+
+        def reserve(order, quantity):
+            with transaction.atomic():
+                if not BuyOrder.objects.filter(pk=order.pk, remaining__gte=quantity).update(remaining=F('remaining') - quantity):
+                    order.remaining = BuyOrder.objects.filter(pk=order.pk).values_list('remaining', flat=True).first() or 0
+                    return False
+                fills.append(take_listing(craft, quantity, order.max_price, order.pk, order.buyer_id))
+            return True
+
+        with self.lock:
+            self.sync()
+            try:
+                self.book.match((craft.classification_id, craft.currency_id), craft.price, craft.amount, craft.seller_id, reserve)
+            except ListingTaken:
+                pass
+        return fills
+
+    def place_order(self, order):
+        """
+        Fill a new buy order against open listings, cheapest and then oldest first,
+        at each listing's price. Whatever is left stands in the book.
+        Returns the crafts recording the fills.
+        """
+        fills = []
+        listings = Craft.objects.filter(
+            classification=order.classification_id, currency=order.currency_id, buyer=None, is_auction=False, price__lte=order.max_price
+        ).exclude(seller=order.buyer_id).order_by('price', 'created_at')
+        for craft in listings.iterator():
+            if order.remaining == 0:
+                break
+            quantity = min(order.remaining, craft.amount)
+            try:
+                with transaction.atomic():
+                    fill = take_listing(craft, quantity, craft.price, order.pk, order.buyer_id)
+                    BuyOrder.objects.filter(pk=order.pk).update(remaining=F('remaining') - quantity)
+            except ListingTaken:
+                continue
+            order.remaining -= quantity
+            fills.append(fill)
+        with self.lock:
+            self.sync()
+            self.book.add((order.classification_id, order.currency_id), BookOrder(order.pk, order.buyer_id, order.max_price, order.remaining))
+        return fills
+
+    def cancel_order(self, order):
+        BuyOrder.objects.filter(pk=order.pk).update(remaining=0)
+        with self.lock:
+            if self.book != None:
+                self.book.cancel(order.pk)
+
+matching_engine = MatchingEngine()
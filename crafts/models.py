@@ -1,9 +1,22 @@
 import uuid
+from datetime import timedelta
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.dispatch import Signal, receiver
+from django.db.models.signals import post_delete, post_save, pre_save
+from accounts.models import Profile, Rating
 from classifications.models import Classification
+from currencies.models import CurrencyField, get_currency, normalized_price, normalized_price_expression
+
+# Sent with the craft as instance after conditional updates, which bypass save() and post_save.
+craft_updated = Signal()
+# Sent with the craft as instance when its trade settles, just before it is deleted.
+craft_settled = Signal()
 
 class Craft(models.Model):
     def validate_greater_than_zero(value):
@@ -16,13 +29,26 @@ class Craft(models.Model):
     classification = models.ForeignKey(Classification, on_delete=models.CASCADE, related_name='craft', limit_choices_to={'has_crafts': True})
     amount = models.IntegerField(validators=[validate_greater_than_zero])
     price = models.IntegerField(validators=[validate_greater_than_zero])
-    currency = models.CharField(max_length=100)
+    currency = CurrencyField()
+    normalized_price = models.FloatField(default=None, null=True, editable=False)
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
     buyer = models.ForeignKey(User, default=None, null=True, blank=True, on_delete=models.SET_DEFAULT, related_name='+')
     seller_trade_outcome = models.BooleanField(default=None, null=True)
     buyer_trade_outcome = models.BooleanField(default=None, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    seller_reputation = models.IntegerField(default=0, editable=False)
+    is_auction = models.BooleanField(default=False)
+    auction_ends_at = models.DateTimeField(default=None, null=True, blank=True)
+    highest_bid = models.IntegerField(default=None, null=True, editable=False)
+    highest_bidder = models.ForeignKey(User, default=None, null=True, on_delete=models.SET_NULL, related_name='+', editable=False)
+    buy_order = models.ForeignKey('BuyOrder', default=None, null=True, on_delete=models.SET_NULL, related_name='fills', editable=False)
     class Meta:
+        indexes = [
+            models.Index(fields=['classification', '-seller_reputation', 'price'], name='craft_best_sellers'),
+            models.Index(fields=['classification', 'currency', 'price', 'created_at'], name='craft_asks'),
+            models.Index(fields=['classification', 'normalized_price'], name='craft_normalized_price'),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=~models.Q(buyer=models.F('seller')),
@@ -32,7 +58,16 @@ class Craft(models.Model):
 
     @property
     def potential_buyers(self):
-        return CraftPotentialBuyer.objects.filter(craft=self)
+        return CraftPotentialBuyer.objects.filter(craft=self).select_related('buyer__profile')
+
+    def ranked_potential_buyers(self):
+        """
+        Potential buyers with their profiles, best reputation first and then in
+        the order they joined, in a single joined query.
+        """
+        return User.objects.filter(craftpotentialbuyer__craft=self).exclude(pk=self.seller_id).select_related('profile').annotate(
+            joined_at=F('craftpotentialbuyer__created_at')
+        ).order_by('-profile__reputation', 'joined_at')
 
     def is_seller(self, user):
         return self.seller == user
@@ -43,13 +78,145 @@ class Craft(models.Model):
     def is_buyer(self, user):
         return self.buyer == user
 
+    def clean(self):
+        if not self.is_auction:
+            return
+        # Only a new or moved end time has to be in the future, so ended auctions can still be edited.
+        if self.auction_ends_at == None or (self.auction_ends_at <= timezone.now() and (
+            self._state.adding or Craft.objects.filter(pk=self.pk).values_list('auction_ends_at', flat=True).first() != self.auction_ends_at
+        )):
+            raise ValidationError({'auction_ends_at': 'An auction needs an end time in the future.'})
+
+    @property
+    def auction_open(self):
+        return self.is_auction and self.buyer_id == None and self.auction_ends_at > timezone.now()
+
+    @property
+    def minimum_bid(self):
+        if self.highest_bid == None:
+            return self.price
+        return self.highest_bid + getattr(settings, 'AUCTION_MIN_INCREMENT', 1)
+
+    def place_bid(self, bidder, amount):
+        """
+        Place a bid with a single conditional UPDATE, so concurrent bidders are
+        serialized by the database instead of a read-modify-write race. A bid in
+        the last AUCTION_SOFT_CLOSE seconds pushes the end of the auction back.
+        Returns whether the bid was accepted.
+        """
+        now = timezone.now()
+        extended_end = now + timedelta(seconds=getattr(settings, 'AUCTION_SOFT_CLOSE', 5 * 60))
+        increment = getattr(settings, 'AUCTION_MIN_INCREMENT', 1)
+        with transaction.atomic():
+            accepted = Craft.objects.filter(
+                Q(highest_bid=None, price__lte=amount) | Q(highest_bid__lte=amount - increment),
+                pk=self.pk, is_auction=True, buyer=None, auction_ends_at__gt=now,
+            ).exclude(seller=bidder).update(
+                highest_bid=amount,
+                highest_bidder=bidder,
+                updated_at=now,
+                auction_ends_at=Case(When(auction_ends_at__lt=extended_end, then=Value(extended_end)), default=F('auction_ends_at')),
+            )
+            if accepted:
+                CraftBid.objects.create(craft_id=self.pk, bidder=bidder, amount=amount)
+        return accepted == 1
+
+    def close_auction(self):
+        """
+        Hand an ended auction to the highest bidder at the winning bid.
+        """
+        closed = Craft.objects.filter(
+            pk=self.pk, is_auction=True, buyer=None, auction_ends_at__lte=timezone.now(), highest_bidder__isnull=False
+        ).update(
+            buyer=F('highest_bidder'), price=F('highest_bid'), normalized_price=normalized_price_expression(F('highest_bid'), get_currency(self.currency_id)), updated_at=timezone.now()
+        ) == 1
+        if closed:
+            self.refresh_from_db(fields=['buyer', 'price'])
+            craft_updated.send(sender=Craft, instance=self)
+        return closed
+
+    @transaction.atomic
+    def settle(self):
+        buyer_profile = Profile.objects.get(user=self.buyer)
+        seller_profile = Profile.objects.get(user=self.seller)
+        if self.seller_trade_outcome:
+            buyer_profile.reputation += 1
+        else:
+            buyer_profile.reputation -= 1
+        if self.buyer_trade_outcome:
+            seller_profile.reputation += 1
+        else:
+            seller_profile.reputation -= 1
+        buyer_profile.save()
+        seller_profile.save()
+        Rating.objects.bulk_create([
+            Rating(rater=self.seller, ratee=self.buyer, positive=self.seller_trade_outcome),
+            Rating(rater=self.buyer, ratee=self.seller, positive=self.buyer_trade_outcome)
+        ])
+        craft_settled.send(sender=Craft, instance=self)
+        self.delete()
+
     def get_absolute_url(self):
         return reverse("crafts:craft-detail", args=(self.pk, ))
 
+class CraftBid(models.Model):
+    craft = models.ForeignKey(Craft, on_delete=models.CASCADE, related_name='bids')
+    bidder = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    amount = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    class Meta:
+        indexes = [
+            models.Index(fields=['craft', '-amount'], name='craft_bid_book'),
+        ]
+
+class BuyOrder(models.Model):
+    def validate_greater_than_zero(value):
+        if value < 1:
+            raise ValidationError(
+                ('Quantity %(value)s is not allowed'),
+                params={'value': value}
+            )
+    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    classification = models.ForeignKey(Classification, on_delete=models.CASCADE, related_name='+', limit_choices_to={'has_crafts': True})
+    currency = CurrencyField()
+    quantity = models.IntegerField(validators=[validate_greater_than_zero])
+    remaining = models.IntegerField(editable=False)
+    max_price = models.IntegerField(validators=[validate_greater_than_zero])
+    created_at = models.DateTimeField(auto_now_add=True)
+    class Meta:
+        indexes = [
+            models.Index(fields=['classification', 'currency'], condition=Q(remaining__gt=0), name='open_buy_orders'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.remaining == None:
+            self.remaining = self.quantity
+        super().save(*args, **kwargs)
+
 class CraftPotentialBuyer(models.Model):
     craft = models.ForeignKey(Craft, on_delete=models.CASCADE)
     buyer = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['craft', 'buyer'], name='craft_and_buyer_must_be_unique'),
-        ]
\ No newline at end of file
+        ]
+
+@receiver(pre_save, sender=Craft)
+def copy_seller_reputation(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance.seller_reputation = Profile.objects.filter(user=instance.seller_id).values_list('reputation', flat=True).first() or 0
+
+@receiver(pre_save, sender=Craft)
+def copy_normalized_price(sender, instance, **kwargs):
+    instance.normalized_price = normalized_price(instance.price, instance.currency_id)
+
+@receiver(post_save, sender=Profile)
+def sync_craft_seller_reputation(sender, instance, **kwargs):
+    Craft.objects.filter(seller=instance.user_id).exclude(seller_reputation=instance.reputation).update(seller_reputation=instance.reputation)
+
+@receiver(post_delete, sender=CraftPotentialBuyer)
+def touch_craft(sender, instance, **kwargs):
+    # The craft page lists its potential buyers, so losing one modifies the craft.
+    Craft.objects.filter(pk=instance.craft_id).update(updated_at=timezone.now())
@@ -1,8 +1,16 @@
-from django.test import TestCase
-from .models import Classification, Craft, CraftPotentialBuyer
+from datetime import timedelta
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from .matching import BookOrder, OrderBook, matching_engine
+from .models import BuyOrder, Classification, Craft, CraftPotentialBuyer
 from django.contrib.auth.models import User
-from accounts.models import Profile
+from accounts.models import Profile, Rating
 from django.urls import reverse
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from mysite.admin_utils import EstimatedCountPaginator
 
 # You must run collectstatic before running the tests
 
@@ -557,4 +565,418 @@ class CraftBuyerTradeOutcomeViewTests(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertEqual(Craft.objects.filter(pk=craft4.pk).count(), 0)
         self.assertEqual(Profile.objects.get(user=user7).reputation, -1)
-        self.assertEqual(Profile.objects.get(user=user8).reputation, -1)
\ No newline at end of file
+        self.assertEqual(Profile.objects.get(user=user8).reputation, -1)
+
+class CraftSellerReputationTests(TestCase):
+
+    def test_new_craft_copies_seller_reputation(self):
+        """
+        New craft should copy the seller's reputation.
+        """
+        user = create_user('test1', 'test1@example.com', 'password')
+        Profile.objects.filter(user=user).update(reputation=3)
+        craft = create_craft(create_classification('test1'), user)
+        self.assertEqual(Craft.objects.get(pk=craft.pk).seller_reputation, 3)
+
+    def test_settlement_updates_open_crafts_of_seller(self):
+        """
+        Settling a trade should update the seller reputation on the seller's open crafts.
+        """
+        user1 = create_user('test1', 'test1@example.com', 'password')
+        user2 = create_user('test2', 'test2@example.com', 'password')
+        classification = create_classification('test1')
+        craft = create_craft(classification, user1, user2, seller_trade_outcome=True)
+        open_craft = create_craft(classification, user1)
+        self.client.force_login(user2)
+        self.client.post(reverse('crafts:craft-buyer-outcome', kwargs={'pk': craft.pk}), data={'outcome': 'True'})
+        self.assertEqual(Craft.objects.get(pk=open_craft.pk).seller_reputation, 1)
+
+    def test_settlement_records_ratings(self):
+        """
+        Settling a trade should record who rated whom.
+        """
+        user1 = create_user('test1', 'test1@example.com', 'password')
+        user2 = create_user('test2', 'test2@example.com', 'password')
+        craft = create_craft(create_classification('test1'), user1, user2, seller_trade_outcome=False)
+        self.client.force_login(user2)
+        self.client.post(reverse('crafts:craft-buyer-outcome', kwargs={'pk': craft.pk}), data={'outcome': 'True'})
+        self.assertEqual(
+            sorted(Rating.objects.values_list('rater__username', 'ratee__username', 'positive')),
+            [('test1', 'test2', False), ('test2', 'test1', True)]
+        )
+
+def create_auction(classification, seller, price=10, ends_in=timedelta(hours=1)):
+    """
+    Create an auction with the given classification, seller, starting price and time left.
+    """
+    return Craft.objects.create(classification=classification, seller=seller, amount=1, price=price, currency="test", is_auction=True, auction_ends_at=timezone.now() + ends_in)
+
+class CraftAuctionTests(TestCase):
+
+    def setUp(self):
+        self.seller = create_user('seller', 'seller@example.com', 'password')
+        self.bidder1 = create_user('test1', 'test1@example.com', 'password')
+        self.bidder2 = create_user('test2', 'test2@example.com', 'password')
+        self.classification = create_classification('test1')
+        return super().setUp()
+
+    def test_bids_must_beat_starting_price_and_highest_bid(self):
+        """
+        A bid should be accepted only if it is at least the starting price and beats the highest bid.
+        """
+        craft = create_auction(self.classification, self.seller)
+        self.assertFalse(craft.place_bid(self.bidder1, 9))
+        self.assertTrue(craft.place_bid(self.bidder1, 10))
+        self.assertFalse(craft.place_bid(self.bidder2, 10))
+        self.assertTrue(craft.place_bid(self.bidder2, 11))
+        craft = Craft.objects.get(pk=craft.pk)
+        self.assertEqual(craft.highest_bid, 11)
+        self.assertEqual(craft.highest_bidder, self.bidder2)
+        self.assertEqual(list(craft.bids.order_by('-amount').values_list('amount', flat=True)), [11, 10])
+
+    def test_seller_cannot_bid_and_ended_auction_does_not_accept_bids(self):
+        """
+        Seller's own bids and bids after the end should be rejected.
+        """
+        craft = create_auction(self.classification, self.seller)
+        self.assertFalse(craft.place_bid(self.seller, 100))
+        ended = create_auction(self.classification, self.seller, ends_in=timedelta(seconds=-1))
+        self.assertFalse(ended.place_bid(self.bidder1, 100))
+
+    @override_settings(AUCTION_SOFT_CLOSE=300)
+    def test_late_bid_extends_auction(self):
+        """
+        A bid close to the end should push the end back, an early bid should not.
+        """
+        craft = create_auction(self.classification, self.seller, ends_in=timedelta(seconds=60))
+        craft.place_bid(self.bidder1, 10)
+        ends_at = Craft.objects.get(pk=craft.pk).auction_ends_at
+        self.assertGreater(ends_at, timezone.now() + timedelta(seconds=290))
+        early = create_auction(self.classification, self.seller, ends_in=timedelta(hours=1))
+        early.place_bid(self.bidder1, 10)
+        self.assertEqual(Craft.objects.get(pk=early.pk).auction_ends_at, early.auction_ends_at)
+
+    def test_bid_view(self):
+        """
+        Bidders should be able to bid through the view and see an error when outbid.
+        """
+        craft = create_auction(self.classification, self.seller)
+        self.client.force_login(self.bidder1)
+        response = self.client.post(reverse('crafts:craft-bid', kwargs={'pk': craft.pk}), data={'amount': 15})
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(self.bidder2)
+        response = self.client.post(reverse('crafts:craft-bid', kwargs={'pk': craft.pk}), data={'amount': 12})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'The minimum bid is now 16')
+        self.client.force_login(self.seller)
+        response = self.client.post(reverse('crafts:craft-bid', kwargs={'pk': craft.pk}), data={'amount': 20})
+        self.assertEqual(response.status_code, 403)
+
+    def test_auction_cannot_take_potential_buyers(self):
+        """
+        Auctions should be sold by bidding, not by picking a potential buyer.
+        """
+        craft = create_auction(self.classification, self.seller)
+        self.client.force_login(self.bidder1)
+        response = self.client.post(reverse('crafts:craft-add-potential-buyer', kwargs={'pk': craft.pk}))
+        self.assertEqual(response.status_code, 403)
+
+    def test_close_auction_hands_craft_to_highest_bidder(self):
+        """
+        Closing an ended auction should make the highest bidder the buyer at the winning bid.
+        """
+        craft = create_auction(self.classification, self.seller)
+        craft.place_bid(self.bidder1, 25)
+        self.client.force_login(self.seller)
+        response = self.client.post(reverse('crafts:craft-close-auction', kwargs={'pk': craft.pk}))
+        self.assertEqual(response.status_code, 403)
+        Craft.objects.filter(pk=craft.pk).update(auction_ends_at=timezone.now() - timedelta(seconds=1))
+        response = self.client.post(reverse('crafts:craft-close-auction', kwargs={'pk': craft.pk}))
+        self.assertEqual(response.status_code, 302)
+        craft = Craft.objects.get(pk=craft.pk)
+        self.assertEqual(craft.buyer, self.bidder1)
+        self.assertEqual(craft.price, 25)
+
+    def test_create_auction_needs_end_time_in_future(self):
+        """
+        Creating an auction without a future end time should fail.
+        """
+        self.client.force_login(self.seller)
+        data = {'classification': self.classification.pk, 'amount': 1, 'price': 100, 'currency': 'test', 'is_auction': 'on'}
+        response = self.client.post(reverse('crafts:craft-create'), data=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Craft.objects.count(), 0)
+        data['auction_ends_at'] = (timezone.now() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+        response = self.client.post(reverse('crafts:craft-create'), data=data)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Craft.objects.get().is_auction)
+
+    def test_ended_auction_can_still_be_edited(self):
+        """
+        An ended auction should pass validation unless its end time is moved to another past time.
+        """
+        craft = create_auction(self.classification, self.seller, ends_in=-timedelta(hours=1))
+        craft = Craft.objects.get(pk=craft.pk)
+        craft.price = 20
+        craft.clean()
+        craft.auction_ends_at -= timedelta(hours=1)
+        with self.assertRaises(ValidationError):
+            craft.clean()
+
+def create_buy_order(buyer, classification, quantity, max_price, currency="test"):
+    """
+    Create a buy order through the matching engine.
+    """
+    order = BuyOrder.objects.create(buyer=buyer, classification=classification, currency=currency, quantity=quantity, max_price=max_price)
+    return order, matching_engine.place_order(order)
+
+class OrderBookTests(TestCase):
+
+    def test_price_time_priority(self):
+        """
+        Orders should fill highest price first, then oldest first.
+        """
+        book = OrderBook()
+        book.add('key', BookOrder(1, 10, 100, 5))
+        book.add('key', BookOrder(2, 11, 120, 5))
+        book.add('key', BookOrder(3, 12, 120, 5))
+        fills = book.match('key', 90, 12)
+        self.assertEqual([(order.pk, quantity) for order, quantity in fills], [(2, 5), (3, 5), (1, 2)])
+        self.assertEqual(book.orders[1].remaining, 3)
+
+    def test_price_limit_and_own_orders(self):
+        """
+        Orders below the listing price and the seller's own orders should not fill.
+        """
+        book = OrderBook()
+        book.add('key', BookOrder(1, 10, 120, 5))
+        book.add('key', BookOrder(2, 11, 80, 5))
+        self.assertEqual(book.match('key', 90, 5, seller_id=10), [])
+        self.assertEqual(book.best('key', 90), book.orders[1])
+
+class CraftMatchingTests(TestCase):
+
+    def setUp(self):
+        matching_engine.rebuild()
+        self.seller = create_user('seller', 'seller@example.com', 'password')
+        self.buyer1 = create_user('test1', 'test1@example.com', 'password')
+        self.buyer2 = create_user('test2', 'test2@example.com', 'password')
+        self.classification = create_classification('test1')
+        return super().setUp()
+
+    def create_listing(self, amount, price):
+        self.client.force_login(self.seller)
+        self.client.post(reverse('crafts:craft-create'), data={'classification': self.classification.pk, 'amount': amount, 'price': price, 'currency': 'test'})
+        return Craft.objects.filter(seller=self.seller, buyer=None).order_by('-created_at').first()
+
+    def test_new_listing_fills_standing_orders_partially(self):
+        """
+        A new listing should be split into one craft per fill against standing orders.
+        """
+        order1, _ = create_buy_order(self.buyer1, self.classification, 3, 12)
+        order2, _ = create_buy_order(self.buyer2, self.classification, 5, 11)
+        listing = self.create_listing(20, 10)
+        self.assertEqual(listing.amount, 12)
+        fills = Craft.objects.exclude(buyer=None).order_by('-price')
+        self.assertEqual([(craft.buyer, craft.amount, craft.price) for craft in fills], [(self.buyer1, 3, 12), (self.buyer2, 5, 11)])
+        self.assertEqual(BuyOrder.objects.get(pk=order1.pk).remaining, 0)
+        self.assertEqual(BuyOrder.objects.get(pk=order2.pk).remaining, 0)
+
+    def test_listing_fully_filled_goes_to_buyer(self):
+        """
+        A listing filled completely by one order should itself get the buyer.
+        """
+        order, _ = create_buy_order(self.buyer1, self.classification, 10, 12)
+        listing = self.create_listing(4, 10)
+        self.assertEqual(listing, None)
+        craft = Craft.objects.get()
+        self.assertEqual((craft.buyer, craft.amount, craft.price, craft.buy_order), (self.buyer1, 4, 12, order))
+        self.assertEqual(BuyOrder.objects.get(pk=order.pk).remaining, 6)
+
+    def test_fills_do_not_count_toward_listing_limit(self):
+        """
+        Crafts split off by fills should not count toward the limit of 5 open crafts.
+        """
+        create_buy_order(self.buyer1, self.classification, 3, 12)
+        self.create_listing(20, 10)
+        for _ in range(4):
+            self.create_listing(1, 10)
+        self.assertEqual(Craft.objects.filter(seller=self.seller, buyer=None).count(), 5)
+        self.assertEqual(Craft.objects.filter(seller=self.seller).exclude(buyer=None).count(), 1)
+
+    def test_new_order_fills_cheapest_listings_first(self):
+        """
+        A new buy order should fill open listings cheapest first at the listing price and keep the rest standing.
+        """
+        expensive = Craft.objects.create(classification=self.classification, seller=self.seller, amount=5, price=9, currency="test")
+        cheap = Craft.objects.create(classification=self.classification, seller=self.seller, amount=2, price=7, currency="test")
+        Craft.objects.create(classification=self.classification, seller=self.seller, amount=5, price=20, currency="test")
+        order, fills = create_buy_order(self.buyer1, self.classification, 4, 10)
+        self.assertEqual([(craft.amount, craft.price) for craft in fills], [(2, 7), (2, 9)])
+        self.assertEqual(Craft.objects.get(pk=cheap.pk).buyer, self.buyer1)
+        self.assertEqual(Craft.objects.get(pk=expensive.pk).amount, 3)
+        self.assertEqual(order.remaining, 0)
+
+    def test_stale_order_in_book_is_skipped(self):
+        """
+        An order cancelled by another process should not be filled.
+        """
+        order1, _ = create_buy_order(self.buyer1, self.classification, 3, 12)
+        create_buy_order(self.buyer2, self.classification, 3, 11)
+        BuyOrder.objects.filter(pk=order1.pk).update(remaining=0)
+        self.create_listing(3, 10)
+        self.assertEqual(Craft.objects.get().buyer, self.buyer2)
+
+    def test_orders_placed_by_other_processes_are_picked_up(self):
+        """
+        Orders written to the database outside the engine should be matched.
+        """
+        BuyOrder.objects.create(buyer=self.buyer1, classification=self.classification, currency="test", quantity=1, max_price=10)
+        self.create_listing(1, 10)
+        self.assertEqual(Craft.objects.get().buyer, self.buyer1)
+
+    def test_cancel_order(self):
+        """
+        Buyer should be able to cancel their order.
+        """
+        order, _ = create_buy_order(self.buyer1, self.classification, 3, 12)
+        self.client.force_login(self.buyer2)
+        response = self.client.post(reverse('crafts:buy-order-cancel', kwargs={'pk': order.pk}))
+        self.assertEqual(response.status_code, 403)
+        self.client.force_login(self.buyer1)
+        self.client.post(reverse('crafts:buy-order-cancel', kwargs={'pk': order.pk}))
+        self.assertEqual(BuyOrder.objects.get(pk=order.pk).remaining, 0)
+        self.assertEqual(self.create_listing(3, 10).buyer, None)
+
+    def test_buy_order_views(self):
+        """
+        Buyer should be able to place a buy order and see its fills.
+        """
+        Craft.objects.create(classification=self.classification, seller=self.seller, amount=5, price=9, currency="test")
+        self.client.force_login(self.buyer1)
+        response = self.client.post(reverse('crafts:buy-order-create'), data={'classification': self.classification.pk, 'currency': 'test', 'quantity': 2, 'max_price': 10})
+        self.assertEqual(response.status_code, 302)
+        response = self.client.get(reverse('crafts:buy-order-list'))
+        self.assertContains(response, '0 of 2 left')
+        self.assertContains(response, '2 for 9 from seller')
+
+class CraftBuyerShortlistTests(TestCase):
+
+    def setUp(self):
+        self.seller = create_user('seller', 'seller@example.com', 'password')
+        self.classification = create_classification('test1')
+        self.craft = create_craft(self.classification, self.seller)
+        self.buyers = []
+        for i, reputation in enumerate([1, 5, 1, 3]):
+            user = create_user('test%d' % i, 'test%d@example.com' % i, 'password')
+            Profile.objects.filter(user=user).update(reputation=reputation)
+            create_craft_potetial_buyer(self.craft, user)
+            self.buyers.append(user)
+        return super().setUp()
+
+    def test_ranked_by_reputation_then_join_time(self):
+        """
+        Potential buyers should be ranked by reputation and then by the time they joined, in one query.
+        """
+        with self.assertNumQueries(1):
+            ranked = [(user.username, user.profile.reputation) for user in self.craft.ranked_potential_buyers()]
+        self.assertEqual(ranked, [('test1', 5), ('test3', 3), ('test0', 1), ('test2', 1)])
+
+    def test_shortlist_is_paginated(self):
+        """
+        Select buyer view should show a page of the shortlist with reputation inline.
+        """
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('crafts:craft-select-buyer', kwargs={'pk': self.craft.pk}))
+        self.assertEqual(list(response.context['shortlist']), [self.buyers[1], self.buyers[3], self.buyers[0], self.buyers[2]])
+        self.assertContains(response, 'test1, reputation: 5')
+
+    def test_auto_select_best_buyer(self):
+        """
+        Auto-selecting should pick the potential buyer with the best reputation.
+        """
+        self.client.force_login(self.seller)
+        response = self.client.post(reverse('crafts:craft-auto-select-buyer', kwargs={'pk': self.craft.pk}))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Craft.objects.get(pk=self.craft.pk).buyer, self.buyers[1])
+
+    def test_only_seller_can_auto_select(self):
+        """
+        Other users should not be able to auto-select the buyer.
+        """
+        self.client.force_login(self.buyers[0])
+        response = self.client.post(reverse('crafts:craft-auto-select-buyer', kwargs={'pk': self.craft.pk}))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Craft.objects.get(pk=self.craft.pk).buyer, None)
+
+class CraftAdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.classification = create_classification('test')
+        self.seller = create_user('seller', 'seller@example.com', 'password')
+        self.buyer = create_user('buyer', 'buyer@example.com', 'password')
+        return super().setUp()
+
+    def changelist(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:crafts_craft_changelist'), params)
+        return response, len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """
+        The changelist should join the related rows instead of querying them for each row.
+        """
+        create_craft(self.classification, self.seller, self.buyer)
+        self.changelist()
+        _, few = self.changelist()
+        for _ in range(5):
+            create_craft(create_classification('test%d' % Classification.objects.count()), create_user('seller%d' % User.objects.count(), '', ''), self.buyer)
+        response, many = self.changelist()
+        self.assertEqual(len(response.context['cl'].result_list), 6)
+        self.assertEqual(few, many)
+
+    def test_search_by_username_prefix(self):
+        """
+        Searching should match sellers and buyers whose username starts with the search.
+        """
+        sold = create_craft(self.classification, self.seller, self.buyer)
+        create_craft(self.classification, create_user('other', 'other@example.com', 'password'))
+        response, _ = self.changelist(q='buy')
+        self.assertEqual(list(response.context['cl'].result_list), [sold])
+        response, _ = self.changelist(q='sel')
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+
+    def test_expire_listings(self):
+        """
+        Expiring should delete the selected listings that have no buyer.
+        """
+        open_craft = create_craft(self.classification, self.seller)
+        sold = create_craft(self.classification, self.seller, self.buyer)
+        self.client.post(reverse('admin:crafts_craft_changelist'), {'action': 'expire_listings', ACTION_CHECKBOX_NAME: [open_craft.pk, sold.pk]})
+        self.assertEqual(list(Craft.objects.all()), [sold])
+
+    def test_force_settle_listings(self):
+        """
+        Force settling should settle the selected trades, counting missing outcomes as positive.
+        """
+        sold = create_craft(self.classification, self.seller, self.buyer, seller_trade_outcome=False)
+        open_craft = create_craft(self.classification, self.seller)
+        self.client.post(reverse('admin:crafts_craft_changelist'), {'action': 'force_settle_listings', ACTION_CHECKBOX_NAME: [sold.pk, open_craft.pk]})
+        self.assertEqual(list(Craft.objects.all()), [open_craft])
+        self.assertEqual(Profile.objects.get(user=self.buyer).reputation, -1)
+        self.assertEqual(Profile.objects.get(user=self.seller).reputation, 1)
+
+    def test_estimated_count(self):
+        """
+        Past the exact count limit, unfiltered lists should be counted from the table size and filtered ones stop at the limit.
+        """
+        crafts = [create_craft(self.classification, self.seller) for _ in range(4)]
+        crafts[1].delete()
+        paginator = EstimatedCountPaginator(Craft.objects.order_by('pk'), 2)
+        paginator.exact_count_limit = 2
+        self.assertEqual(paginator.count, 4)
+        paginator = EstimatedCountPaginator(Craft.objects.filter(seller=self.seller).order_by('pk'), 2)
+        paginator.exact_count_limit = 2
+        self.assertEqual(paginator.count, 3)
+        paginator = EstimatedCountPaginator(Craft.objects.order_by('pk'), 2)
+        self.assertEqual(paginator.count, 3)
@@ -1,13 +1,19 @@
 from django.urls import path
 
-from .views import CraftBuyerTradeOutcomeView, CraftDeleteView, CraftCreateView, CraftDetailView, CraftSelectBuyerView, AddCraftPotentialBuyerView, CraftSellerTradeOutcomeView, RemoveCraftPotentialBuyerView
+from .views import CraftAutoSelectBuyerView, BuyOrderCreateView, BuyOrderListView, CancelBuyOrderView, CloseCraftAuctionView, CraftBuyerTradeOutcomeView, CraftDeleteView, CraftCreateView, CraftDetailView, CraftSelectBuyerView, AddCraftPotentialBuyerView, CraftSellerTradeOutcomeView, PlaceCraftBidView, RemoveCraftPotentialBuyerView
 
 app_name = 'crafts'
 urlpatterns = [
     path('add-craft/', CraftCreateView.as_view(), name='craft-create'),
     path('<uuid:pk>/', CraftDetailView.as_view(), name='craft-detail'),
+    path('buy-orders/', BuyOrderListView.as_view(), name='buy-order-list'),
+    path('buy-orders/add/', BuyOrderCreateView.as_view(), name='buy-order-create'),
+    path('buy-orders/<int:pk>/cancel', CancelBuyOrderView.as_view(), name='buy-order-cancel'),
     path('<uuid:pk>/add-potential-buyer', AddCraftPotentialBuyerView.as_view(), name='craft-add-potential-buyer'),
     path('<uuid:pk>/remove-potential-buyer', RemoveCraftPotentialBuyerView.as_view(), name='craft-remove-potential-buyer'),
+    path('<uuid:pk>/bid', PlaceCraftBidView.as_view(), name='craft-bid'),
+    path('<uuid:pk>/close-auction', CloseCraftAuctionView.as_view(), name='craft-close-auction'),
+    path('<uuid:pk>/auto-select-buyer', CraftAutoSelectBuyerView.as_view(), name='craft-auto-select-buyer'),
     path('<uuid:pk>/select-buyer', CraftSelectBuyerView.as_view(), name='craft-select-buyer'),
     path('<uuid:pk>/buyer-outcome', CraftBuyerTradeOutcomeView.as_view(), name='craft-buyer-outcome'),
     path('<uuid:pk>/seller-outcome', CraftSellerTradeOutcomeView.as_view(), name='craft-seller-outcome'),
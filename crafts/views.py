@@ -1,27 +1,50 @@
 from django.urls.base import reverse_lazy
-from accounts.models import Profile
 from django.views.generic.base import RedirectView
 from django.views.generic.edit import DeleteView, FormView
-from .forms import SelectBuyerForm, TradeOutcomeForm
-from django.views.generic import CreateView, DetailView, UpdateView
-from .models import Craft, CraftPotentialBuyer
+from .forms import BidForm, SelectBuyerForm, TradeOutcomeForm
+from django.views.generic import CreateView, DetailView, ListView, UpdateView
+from .matching import matching_engine
+from .models import BuyOrder, Craft, CraftPotentialBuyer
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.core.paginator import Paginator
 from django.urls import reverse
 from django.template.response import SimpleTemplateResponse
+from django.utils import timezone
+from listing_cache.views import ConditionalGetMixin, listing_validators
+from trending.counters import view_counter
 
 class CraftCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
     model = Craft
-    fields = ['classification', 'amount', 'price', 'currency']
+    fields = ['classification', 'amount', 'price', 'currency', 'is_auction', 'auction_ends_at']
     def test_func(self):
-        return Craft.objects.filter(seller = self.request.user).count() < 5
+        return Craft.objects.filter(seller = self.request.user, buyer=None).count() < 5
     def handle_no_permission(self):
         return SimpleTemplateResponse('crafts/craft_create_limit.html')
     def form_valid(self, form):
         form.instance.seller = self.request.user
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        matching_engine.match_listing(self.object)
+        return response
 
-class CraftDetailView(LoginRequiredMixin, DetailView):
+class CraftDetailView(LoginRequiredMixin, ConditionalGetMixin, DetailView):
     model = Craft
+    queryset = Craft.objects.select_related('classification', 'seller__profile', 'buyer__profile', 'highest_bidder__profile')
+
+    def get_validators(self):
+        row = Craft.objects.filter(pk=self.kwargs['pk']).values_list('updated_at', 'seller', 'buyer', 'highest_bidder', 'is_auction', 'auction_ends_at').first()
+        if row == None:
+            return None
+        updated_at, seller, buyer, highest_bidder, is_auction, auction_ends_at = row
+        potential_buyers = CraftPotentialBuyer.objects.filter(craft=self.kwargs['pk']).order_by('pk').values_list('buyer', 'updated_at')
+        parts, last_modified = listing_validators(updated_at, [seller, buyer, highest_bidder], list(potential_buyers))
+        if not is_auction:
+            return parts, last_modified
+        # An auction page changes by itself when the auction ends.
+        ended = auction_ends_at <= timezone.now()
+        return parts + (ended,), max(last_modified, auction_ends_at) if ended else last_modified
+
+    def record_view(self):
+        view_counter.record('craft', self.kwargs['pk'])
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -47,7 +70,7 @@ class AddCraftPotentialBuyerView(LoginRequiredMixin, UserPassesTestMixin, Redire
         object = Craft.objects.get(pk=self.kwargs['pk'])
         does_not_have_buyer = object.buyer == None
         is_seller = object.is_seller(self.request.user)
-        return (not is_seller) and does_not_have_buyer
+        return (not is_seller) and does_not_have_buyer and not object.is_auction
 
 class RemoveCraftPotentialBuyerView(LoginRequiredMixin, UserPassesTestMixin, RedirectView):
     http_method_names=['post']
@@ -67,11 +90,35 @@ class RemoveCraftPotentialBuyerView(LoginRequiredMixin, UserPassesTestMixin, Red
 class CraftSelectBuyerView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     model = Craft
     form_class = SelectBuyerForm
+    template_name = 'crafts/craft_select_buyer.html'
+    paginate_by = 20
 
     def test_func(self):
         self.object = self.get_object()
         does_not_have_buyer = self.object.buyer == None
-        return self.object.is_seller(self.request.user) and does_not_have_buyer
+        return self.object.is_seller(self.request.user) and does_not_have_buyer and not self.object.is_auction
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        paginator = Paginator(context['form'].fields['buyer'].queryset, self.paginate_by)
+        context['shortlist'] = paginator.get_page(self.request.GET.get('page'))
+        return context
+
+class CraftAutoSelectBuyerView(LoginRequiredMixin, UserPassesTestMixin, RedirectView):
+    http_method_names=['post']
+    pattern_name='crafts:craft-detail'
+
+    def get_redirect_url(self, *args, **kwargs):
+        best_buyer = self.object.ranked_potential_buyers().first()
+        if best_buyer != None:
+            self.object.buyer = best_buyer
+            self.object.save()
+        return reverse('crafts:craft-detail', kwargs={'pk': kwargs['pk']})
+
+    def test_func(self):
+        self.object = Craft.objects.get(pk=self.kwargs['pk'])
+        does_not_have_buyer = self.object.buyer == None
+        return self.object.is_seller(self.request.user) and does_not_have_buyer and not self.object.is_auction
 
 class CraftDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     model = Craft
@@ -80,7 +127,47 @@ class CraftDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     def test_func(self):
         self.object = self.get_object()
         does_not_have_buyer = self.object.buyer == None
-        return self.object.is_seller(self.request.user) and does_not_have_buyer
+        does_not_have_bids = self.object.highest_bid == None
+        return self.object.is_seller(self.request.user) and does_not_have_buyer and does_not_have_bids
+
+class PlaceCraftBidView(LoginRequiredMixin, UserPassesTestMixin, FormView):
+    form_class = BidForm
+    template_name = 'crafts/craft_bid.html'
+
+    def get_object(self):
+        return Craft.objects.get(pk=self.kwargs['pk'])
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['object'] = self.object
+        return context
+
+    def get_success_url(self):
+        return reverse('crafts:craft-detail', kwargs={'pk': self.kwargs['pk']})
+
+    def form_valid(self, form):
+        if not self.object.place_bid(self.request.user, form.cleaned_data['amount']):
+            self.object = self.get_object()
+            form.add_error('amount', 'Your bid was outbid or the auction has ended. The minimum bid is now %d.' % self.object.minimum_bid)
+            return self.form_invalid(form)
+        return super().form_valid(form)
+
+    def test_func(self):
+        self.object = self.get_object()
+        return self.object.auction_open and not self.object.is_seller(self.request.user)
+
+class CloseCraftAuctionView(LoginRequiredMixin, UserPassesTestMixin, RedirectView):
+    http_method_names=['post']
+    pattern_name='crafts:craft-detail'
+
+    def get_redirect_url(self, *args, **kwargs):
+        Craft.objects.get(pk=kwargs['pk']).close_auction()
+        return reverse('crafts:craft-detail', kwargs={'pk': kwargs['pk']})
+
+    def test_func(self):
+        object = Craft.objects.get(pk=self.kwargs['pk'])
+        is_seller_or_winner = object.is_seller(self.request.user) or object.highest_bidder == self.request.user
+        return object.is_auction and object.buyer == None and not object.auction_open and is_seller_or_winner
 
 class CraftTradeOutcomeView(LoginRequiredMixin, UserPassesTestMixin, FormView):
     form_class=TradeOutcomeForm
@@ -100,26 +187,14 @@ class CraftSellerTradeOutcomeView(CraftTradeOutcomeView):
     def form_valid(self, form):
         self.object = self.get_object()
         
+        if form.cleaned_data['outcome'] == 'True':
+            self.object.seller_trade_outcome = True
+        else:
+            self.object.seller_trade_outcome = False
         if self.object.buyer_trade_outcome == None:
-            if form.cleaned_data['outcome'] == 'True':
-                self.object.seller_trade_outcome = True
-            else:
-                self.object.seller_trade_outcome = False
             self.object.save()
         else:
-            buyer_profile = Profile.objects.get(user=self.object.buyer)
-            seller_profile = Profile.objects.get(user=self.object.seller)
-            if form.cleaned_data['outcome'] == 'True':
-                buyer_profile.reputation += 1
-            else:
-                buyer_profile.reputation -= 1
-            if self.object.buyer_trade_outcome:
-                seller_profile.reputation += 1
-            else:
-                seller_profile.reputation -= 1
-            buyer_profile.save()
-            seller_profile.save()
-            self.object.delete()
+            self.object.settle()
         return super().form_valid(form)
 
     def test_func(self):
@@ -133,30 +208,46 @@ class CraftBuyerTradeOutcomeView(CraftTradeOutcomeView):
     def form_valid(self, form):
         self.object = self.get_object()
         
+        if form.cleaned_data['outcome'] == 'True':
+            self.object.buyer_trade_outcome = True
+        else:
+            self.object.buyer_trade_outcome = False
         if self.object.seller_trade_outcome == None:
-            if form.cleaned_data['outcome'] == 'True':
-                self.object.buyer_trade_outcome = True
-            else:
-                self.object.buyer_trade_outcome = False
             self.object.save()
         else:
-            buyer_profile = Profile.objects.get(user=self.object.buyer)
-            seller_profile = Profile.objects.get(user=self.object.seller)
-            if form.cleaned_data['outcome'] == 'True':
-                seller_profile.reputation += 1
-            else:
-                seller_profile.reputation -= 1
-            if self.object.seller_trade_outcome:
-                buyer_profile.reputation += 1
-            else:
-                buyer_profile.reputation -= 1
-            buyer_profile.save()
-            seller_profile.save()
-            self.object.delete()
+            self.object.settle()
         return super().form_valid(form)
 
     def test_func(self):
         self.object = self.get_object()
         has_buyer = self.object.buyer != None
         buyer_trade_open = self.object.buyer_trade_outcome == None
-        return self.object.is_buyer(self.request.user) and has_buyer and buyer_trade_open
\ No newline at end of file
+        return self.object.is_buyer(self.request.user) and has_buyer and buyer_trade_open
+
+class BuyOrderListView(LoginRequiredMixin, ListView):
+    model = BuyOrder
+
+    def get_queryset(self):
+        return BuyOrder.objects.filter(buyer=self.request.user).select_related('classification').prefetch_related('fills__seller').order_by('-created_at')
+
+class BuyOrderCreateView(LoginRequiredMixin, CreateView):
+    model = BuyOrder
+    fields = ['classification', 'currency', 'quantity', 'max_price']
+    success_url = reverse_lazy('crafts:buy-order-list')
+
+    def form_valid(self, form):
+        form.instance.buyer = self.request.user
+        response = super().form_valid(form)
+        matching_engine.place_order(self.object)
+        return response
+
+class CancelBuyOrderView(LoginRequiredMixin, UserPassesTestMixin, RedirectView):
+    http_method_names=['post']
+    pattern_name='crafts:buy-order-list'
+
+    def get_redirect_url(self, *args, **kwargs):
+        matching_engine.cancel_order(BuyOrder.objects.get(pk=kwargs['pk']))
+        return reverse('crafts:buy-order-list')
+
+    def test_func(self):
+        return BuyOrder.objects.get(pk=self.kwargs['pk']).buyer == self.request.user
@@ -0,0 +1,15 @@
+from django.contrib import admin
+
+from .models import Currency, CurrencyAlias
+
+class CurrencyAliasInline(admin.TabularInline):
+    model = CurrencyAlias
+    extra = 0
+
+class CurrencyAdmin(admin.ModelAdmin):
+    list_display = ('code', 'rate')
+    list_editable = ['rate']
+    inlines = [CurrencyAliasInline]
+    search_fields = ['code', 'aliases__alias']
+
+admin.site.register(Currency, CurrencyAdmin)
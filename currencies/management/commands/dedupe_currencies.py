@@ -0,0 +1,123 @@
+import copy
+from collections import defaultdict
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from carry_services.models import CarryService
+from crafts.models import Craft
+from currencies.models import Currency, CurrencyAlias, CurrencyField, currency_cache, intern_currency, normalize_code, reprice
+from listing_cache.models import carry_service_keys, craft_keys
+from listing_cache.versions import bump
+from market.models import PriceBucket, rebuild_price_buckets
+
+def currency_fields():
+    for model in apps.get_models():
+        for field in model._meta.local_concrete_fields:
+            if isinstance(field, CurrencyField):
+                yield model, field
+
+class Command(BaseCommand):
+    help = (
+        'Move free-text currency columns left by earlier versions onto the currency dictionary, '
+        'merge currencies that normalize or alias to the same code, and recompute normalized prices.'
+    )
+
+    def handle(self, *args, **options):
+        converted = self.convert_text_columns()
+        merged = self.merge_duplicates()
+        if converted or merged:
+            # Buckets of merged currencies would collide, so they are counted again.
+            rebuild_price_buckets()
+        for currency in Currency.objects.all():
+            reprice(currency)
+        currency_cache.clear()
+        self.stdout.write('Converted %d text columns, merged %d duplicate currencies and repriced %d currencies.' % (
+            converted, merged, Currency.objects.count()
+        ))
+
+    def text_columns(self):
+        found = []
+        with connection.cursor() as cursor:
+            tables = set(connection.introspection.table_names(cursor))
+            for model, field in currency_fields():
+                if model._meta.db_table in tables:
+                    columns = {column.name for column in connection.introspection.get_table_description(cursor, model._meta.db_table)}
+                    if field.name in columns and field.column not in columns:
+                        found.append((model, field, columns))
+        return found
+
+    def convert_text_columns(self):
+        """
+        Replace each text currency column with a key into the dictionary, with one
+        UPDATE per distinct string rather than per row.
+        """
+        found = self.text_columns()
+        if not found:
+            return 0
+        quote = connection.ops.quote_name
+        with connection.schema_editor() as editor:
+            for model, field, columns in found:
+                table = quote(model._meta.db_table)
+                if model == PriceBucket:
+                    # Derived from the price history, and its unique constraint is on the text.
+                    editor.delete_model(model)
+                    editor.create_model(model)
+                    continue
+                for other in model._meta.local_concrete_fields:
+                    if other.column not in columns:
+                        added = copy.copy(other)
+                        if other == field or not other.has_default():
+                            added.null = True
+                        definition, params = editor.column_sql(model, added, include_default=True)
+                        editor.execute('ALTER TABLE %s ADD COLUMN %s %s' % (table, quote(added.column), definition), params)
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT DISTINCT %s FROM %s' % (quote(field.name), table))
+                    texts = [text for text, in cursor.fetchall()]
+                for text in texts:
+                    currency = intern_currency(text) if text and text.strip() else None
+                    if currency == None and not field.null:
+                        raise CommandError('%s has rows without a currency.' % model._meta.label)
+                    editor.execute('UPDATE %s SET %s = %%s WHERE %s = %%s' % (table, quote(field.column), quote(field.name)), [None if currency == None else currency.pk, text])
+                with connection.cursor() as cursor:
+                    constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+                for name, constraint in constraints.items():
+                    if field.name in constraint['columns'] and constraint['index'] and not constraint['unique']:
+                        editor.execute(editor.sql_delete_index % {'table': table, 'name': quote(name)})
+                editor.execute('ALTER TABLE %s DROP COLUMN %s' % (table, quote(field.name)))
+                editor.execute(editor._create_index_sql(model, fields=[field]))
+                for index in model._meta.indexes:
+                    if index.name not in constraints or field.name in constraints[index.name]['columns']:
+                        editor.add_index(model, index)
+        return len(found)
+
+    def merge_duplicates(self):
+        """
+        Point everything at one currency per normalized code or alias and delete
+        the others.
+        """
+        aliases = dict(CurrencyAlias.objects.values_list('alias', 'currency'))
+        kept = {}
+        merges = defaultdict(list)
+        for currency in Currency.objects.order_by('pk'):
+            code = normalize_code(currency.code)
+            target = aliases.get(code)
+            if target != None and target != currency.pk:
+                merges[target].append(currency.pk)
+            elif code in kept:
+                merges[kept[code].pk].append(currency.pk)
+            else:
+                kept[code] = currency
+        with transaction.atomic():
+            if merges:
+                PriceBucket.objects.all().delete()
+            for target, duplicates in merges.items():
+                for model, field in [*currency_fields(), (CurrencyAlias, CurrencyAlias._meta.get_field('currency'))]:
+                    model._base_manager.filter(**{field.name + '__in': duplicates}).update(**{field.name: target})
+                Currency.objects.filter(pk__in=duplicates).delete()
+            for code, currency in kept.items():
+                if currency.code != code:
+                    Currency.objects.filter(pk=currency.pk).update(code=code)
+            if merges:
+                # Cached listings show the codes of the merged currencies.
+                bump(craft_keys(Craft.objects.filter(currency__in=merges).values_list('pk', 'classification')) | carry_service_keys(CarryService.objects.filter(currency__in=merges).values_list('pk', flat=True)))
+        return sum(len(duplicates) for duplicates in merges.values())
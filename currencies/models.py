@@ -0,0 +1,230 @@
+"""
+The currency dictionary. Listings point at a Currency by an integer key instead
+of repeating free text, and what sellers type is interned: normalized, resolved
+through the aliases and looked up or added once. Interned currencies are kept
+in a per-process cache for CURRENCY_CACHE_TIMEOUT seconds.
+
+Each currency has an exchange rate to a common unit. Listings keep their price
+times that rate in an indexed normalized_price column, so lists in different
+currencies can be sorted together. Changing a rate rewrites the column in bulk.
+A currency added by a seller has no rate until one is set, and its listings have
+no normalized price and sort after all others.
+
+Currencies typed into forms are only resolved while the form is validated, and
+added to the dictionary when the listing is saved, so a rejected form adds none.
+"""
+import threading
+import time
+from django import forms
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import ExpressionWrapper, F, FloatField
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
+from django.dispatch import receiver
+from django.db.models.signals import post_delete, post_save, pre_save
+
+class Currency(models.Model):
+    code = models.CharField(max_length=100, unique=True)
+    rate = models.FloatField(default=None, null=True, blank=True, help_text='Value of one unit in the common unit that listings are sorted by. Listings in currencies without a rate sort last.')
+    class Meta:
+        verbose_name_plural = 'currencies'
+
+    def __str__(self):
+        return self.code
+
+class CurrencyAlias(models.Model):
+    alias = models.CharField(max_length=100, unique=True)
+    currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='aliases')
+    class Meta:
+        verbose_name_plural = 'currency aliases'
+
+    def save(self, *args, **kwargs):
+        self.alias = normalize_code(self.alias)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.alias
+
+def normalize_code(text):
+    return ' '.join(text.split()).casefold()
+
+class CurrencyCache:
+
+    def __init__(self):
+        self.by_code = {}
+        self.by_id = {}
+        self.lock = threading.Lock()
+
+    def timeout(self):
+        return getattr(settings, 'CURRENCY_CACHE_TIMEOUT', 60)
+
+    def get(self, entries, key):
+        entry = entries.get(key)
+        if entry == None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def add(self, code, currency):
+        expires_at = time.monotonic() + self.timeout()
+        with self.lock:
+            if code != None:
+                self.by_code[code] = (expires_at, currency)
+            self.by_id[currency.pk] = (expires_at, currency)
+
+    def clear(self):
+        with self.lock:
+            self.by_code.clear()
+            self.by_id.clear()
+
+currency_cache = CurrencyCache()
+
+def cache_on_commit(code, currency):
+    # A currency added in a transaction that rolls back must not outlive it here.
+    transaction.on_commit(lambda: currency_cache.add(code, currency))
+
+def find_currency(text):
+    """
+    The currency that text names, or None when the dictionary has none.
+    """
+    code = normalize_code(text)
+    if not code:
+        raise ValueError('A currency needs a code.')
+    currency = currency_cache.get(currency_cache.by_code, code)
+    if currency == None:
+        alias = CurrencyAlias.objects.select_related('currency').filter(alias=code).first()
+        currency = alias.currency if alias != None else Currency.objects.filter(code=code).first()
+        if currency != None:
+            cache_on_commit(code, currency)
+    return currency
+
+def intern_currency(text):
+    """
+    The currency that text names, added to the dictionary if it is new.
+    """
+    currency = find_currency(text)
+    if currency == None:
+        code = normalize_code(text)
+        currency = Currency.objects.get_or_create(code=code)[0]
+        cache_on_commit(code, currency)
+    return currency
+
+def get_currency(pk):
+    currency = currency_cache.get(currency_cache.by_id, pk)
+    if currency == None:
+        currency = Currency.objects.get(pk=pk)
+        cache_on_commit(None, currency)
+    return currency
+
+def normalized_price(price, currency_id):
+    rate = get_currency(currency_id).rate
+    return None if rate == None else price * rate
+
+def normalized_price_expression(price, currency):
+    """
+    normalized_price for conditional updates that set the price from a column.
+    """
+    return ExpressionWrapper(price * currency.rate, output_field=FloatField())
+
+def priced_models():
+    """
+    Models with a currency and a normalized_price kept from it.
+    """
+    for model in apps.get_models():
+        fields = {field.name: field for field in model._meta.concrete_fields}
+        if isinstance(fields.get('currency'), CurrencyField) and 'normalized_price' in fields:
+            yield model
+
+def reprice(currency):
+    """
+    Recompute the normalized price of every listing in currency.
+    """
+    for model in priced_models():
+        model.objects.filter(currency=currency).update(normalized_price=ExpressionWrapper(F('price') * currency.rate, output_field=FloatField()))
+
+class CurrencyDescriptor(ForwardManyToOneDescriptor):
+    """
+    Accepts currency text as well as a Currency, and reads currencies through the
+    interned cache instead of a query per instance.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance != None and not self.field.is_cached(instance):
+            currency_id = getattr(instance, self.field.attname)
+            if currency_id != None:
+                self.field.set_cached_value(instance, get_currency(currency_id))
+        return super().__get__(instance, cls)
+
+    def __set__(self, instance, value):
+        if isinstance(value, str):
+            value = intern_currency(value) if value.strip() else None
+        super().__set__(instance, value)
+
+class CurrencyFormField(forms.CharField):
+    """
+    A text input for currencies. Cleans to the text, which CurrencyField interns
+    when the instance is saved.
+    """
+
+    def prepare_value(self, value):
+        if isinstance(value, int):
+            return get_currency(value).code
+        return super().prepare_value(value)
+
+    def clean(self, value):
+        value = super().clean(value)
+        return normalize_code(value) or None
+
+class CurrencyField(models.ForeignKey):
+    forward_related_accessor_class = CurrencyDescriptor
+
+    def __init__(self, to='currencies.Currency', on_delete=models.PROTECT, **kwargs):
+        kwargs.setdefault('related_name', '+')
+        super().__init__(to, on_delete, **kwargs)
+
+    def contribute_to_class(self, cls, name, *args, **kwargs):
+        super().contribute_to_class(cls, name, *args, **kwargs)
+        if not cls._meta.abstract:
+            # Connected as the model is defined, so it runs before the model's own
+            # pre_save receivers, such as those keeping normalized_price.
+            pre_save.connect(self.intern_typed_code, sender=cls, weak=False)
+
+    @property
+    def typed_code_attname(self):
+        return '_%s_typed_code' % self.name
+
+    def save_form_data(self, instance, data):
+        if isinstance(data, str):
+            currency = find_currency(data)
+            if currency == None:
+                instance.__dict__[self.typed_code_attname] = data
+                setattr(instance, self.attname, None)
+                return
+            data = currency
+        instance.__dict__.pop(self.typed_code_attname, None)
+        super().save_form_data(instance, data)
+
+    def validate(self, value, model_instance):
+        if value == None and self.typed_code_attname in model_instance.__dict__:
+            return
+        super().validate(value, model_instance)
+
+    def intern_typed_code(self, sender, instance, **kwargs):
+        code = instance.__dict__.pop(self.typed_code_attname, None)
+        if code != None:
+            setattr(instance, self.name, intern_currency(code))
+
+    def formfield(self, **kwargs):
+        return CurrencyFormField(required=not self.blank, max_length=Currency._meta.get_field('code').max_length, label=self.verbose_name.capitalize())
+
+@receiver(post_save, sender=Currency)
+def reprice_listings(sender, instance, created, **kwargs):
+    currency_cache.clear()
+    if not created:
+        reprice(instance)
+
+@receiver(post_delete, sender=Currency)
+@receiver(post_save, sender=CurrencyAlias)
+@receiver(post_delete, sender=CurrencyAlias)
+def clear_currency_cache(sender, **kwargs):
+    currency_cache.clear()
@@ -0,0 +1,113 @@
+import io
+from django.core.management import call_command
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.urls import reverse
+from classifications.models import Classification
+from crafts.models import Craft
+from carry_services.models import CarryService
+from .models import Currency, CurrencyAlias, currency_cache, intern_currency
+
+def create_user(username, email, password):
+    """
+    Create a user with given username, email and password.
+    """
+    return User.objects.create(username=username, email=email, password=password)
+
+def create_carry_service(seller, price, currency):
+    """
+    Create a carry service with the given seller, price and currency.
+    """
+    return CarryService.objects.create(seller=seller, price=price, currency=currency)
+
+class CurrencyTests(TestCase):
+
+    def setUp(self):
+        currency_cache.clear()
+        self.seller = create_user('seller', 'seller@example.com', 'password')
+        return super().setUp()
+
+    def test_currency_text_is_interned(self):
+        """
+        Spellings of a code and its aliases should intern to one currency.
+        """
+        gold = intern_currency('Gold')
+        CurrencyAlias.objects.create(alias=' G ', currency=gold)
+        self.assertEqual(intern_currency(' gold '), gold)
+        self.assertEqual(intern_currency('g'), gold)
+        self.assertEqual(gold.code, 'gold')
+        self.assertEqual(create_carry_service(self.seller, 1, 'GOLD').currency, gold)
+        self.assertEqual(Currency.objects.count(), 1)
+
+    def test_typed_currency_is_normalized(self):
+        """
+        Listings created from the form should get the normalized currency.
+        """
+        self.client.force_login(self.seller)
+        self.client.post(reverse('carry_services:carry-service-create'), data={'type': 'raid', 'price': 100, 'currency': ' Gold '})
+        self.assertEqual(CarryService.objects.get().currency.code, 'gold')
+
+    def test_rates_sort_across_currencies(self):
+        """
+        Lists sorted by price should compare converted prices, and follow rate changes.
+        """
+        Currency.objects.create(code='gold', rate=1)
+        create_carry_service(self.seller, 5, 'gold')
+        create_carry_service(self.seller, 300, 'silver')
+        silver = Currency.objects.get(code='silver')
+        silver.rate = 0.01
+        silver.save()
+        self.client.force_login(self.seller)
+        url = reverse('carry_services:carry-service-list')
+        self.assertEqual([row.price for row in self.client.get(url, {'sort': 'price'}).context['carry_service_rows']], [300, 5])
+        silver.rate = 1
+        silver.save()
+        self.assertEqual([row.price for row in self.client.get(url, {'sort': 'price'}).context['carry_service_rows']], [5, 300])
+
+    def test_rejected_form_adds_no_currency(self):
+        """
+        A currency typed into a form that is rejected should not be added.
+        """
+        self.client.force_login(self.seller)
+        response = self.client.post(reverse('carry_services:carry-service-create'), data={'type': 'raid', 'price': 0, 'currency': 'Typo Coins'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Currency.objects.exists())
+
+    def test_currencies_without_rate_sort_last(self):
+        """
+        Listings in a currency nobody has set a rate for should come after converted ones.
+        """
+        Currency.objects.create(code='gold', rate=1)
+        create_carry_service(self.seller, 1, 'copper')
+        create_carry_service(self.seller, 5, 'gold')
+        self.assertEqual(Currency.objects.get(code='copper').rate, None)
+        self.client.force_login(self.seller)
+        url = reverse('carry_services:carry-service-list')
+        self.assertEqual([row.price for row in self.client.get(url, {'sort': 'price'}).context['carry_service_rows']], [5, 1])
+
+    def test_auction_close_keeps_normalized_price(self):
+        """
+        The winning bid should be converted like any other price.
+        """
+        gold = Currency.objects.create(code='gold', rate=2)
+        bidder = create_user('bidder', 'bidder@example.com', 'password')
+        classification = Classification.objects.create(name='apple', has_crafts=True)
+        craft = Craft.objects.create(classification=classification, seller=self.seller, amount=1, price=5, currency=gold, is_auction=True, highest_bid=7, highest_bidder=bidder)
+        self.assertEqual(craft.normalized_price, 10)
+        Craft.objects.filter(pk=craft.pk).update(auction_ends_at=craft.created_at)
+        craft.close_auction()
+        self.assertEqual(Craft.objects.get(pk=craft.pk).normalized_price, 14)
+
+    def test_duplicates_are_merged(self):
+        """
+        Currencies that normalize or alias to one code should be merged into it.
+        """
+        gold = Currency.objects.create(code='gold')
+        upper = Currency.objects.create(code='Gold')
+        short = Currency.objects.create(code='g')
+        CurrencyAlias.objects.create(alias='g', currency=gold)
+        for currency in [gold, upper, short]:
+            create_carry_service(self.seller, 1, currency)
+        call_command('dedupe_currencies', stdout=io.StringIO())
+        self.assertEqual(list(Currency.objects.values_list('code', flat=True)), ['gold'])
+        self.assertEqual(list(CarryService.objects.values_list('currency__code', flat=True)), ['gold', 'gold', 'gold'])
@@ -0,0 +1,12 @@
+from django.contrib import admin
+from mysite.admin_utils import LargeTableAdmin
+
+from .models import InboxItem
+
+class InboxItemAdmin(LargeTableAdmin, admin.ModelAdmin):
+    list_display = ('user', 'kind', 'action_required', 'craft', 'carry_service', 'created_at')
+    list_select_related = ('user', 'craft', 'carry_service')
+    search_fields = ['user__username']
+    list_filter = ['kind', 'action_required']
+
+admin.site.register(InboxItem, InboxItemAdmin)
@@ -0,0 +1,10 @@
+from django.utils.functional import SimpleLazyObject
+from .models import action_required_count
+
+def inbox(request):
+    """
+    Number of the user's trades needing action, for the header. It is only looked up when rendered.
+    """
+    if not request.user.is_authenticated:
+        return {}
+    return {'inbox_count': SimpleLazyObject(lambda: action_required_count(request.user))}
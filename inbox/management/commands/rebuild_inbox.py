@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from crafts.models import Craft
+from carry_services.models import CarryService
+from inbox.models import sync_listing
+
+class Command(BaseCommand):
+    help = 'Bring the inbox rows of every open listing in line with its state, for listings created before the inbox existed.'
+
+    def handle(self, *args, **options):
+        count = 0
+        for queryset in [Craft.objects.all(), CarryService.objects.all()]:
+            for listing in queryset.iterator(chunk_size=500):
+                with transaction.atomic():
+                    sync_listing(listing)
+                count += 1
+        self.stdout.write('Synced the inbox of %d listings.' % count)
@@ -0,0 +1,127 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+from django.utils import timezone
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+from django.db.models.signals import post_delete, post_save
+from crafts.models import Craft, CraftPotentialBuyer, craft_updated
+from carry_services.models import CarryService, CarryServicePotentialBuyer
+
+class InboxItem(models.Model):
+    SELLING = 'selling'
+    SELECT_BUYER = 'select_buyer'
+    INTERESTED = 'interested'
+    CLOSE_TRADE = 'close_trade'
+    WAITING = 'waiting'
+    KIND_CHOICES = [
+        (SELLING, 'Selling'),
+        (SELECT_BUYER, 'Select a buyer'),
+        (INTERESTED, 'Waiting for the seller'),
+        (CLOSE_TRADE, 'Close the trade'),
+        (WAITING, 'Waiting for the other party'),
+    ]
+    ACTION_REQUIRED = {SELECT_BUYER, CLOSE_TRADE}
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inbox_items')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    action_required = models.BooleanField(default=False)
+    craft = models.ForeignKey(Craft, default=None, null=True, on_delete=models.CASCADE, related_name='+')
+    carry_service = models.ForeignKey(CarryService, default=None, null=True, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-action_required', '-created_at'], name='inbox_user_items'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'craft'], name='inbox_user_and_craft_must_be_unique'),
+            models.UniqueConstraint(fields=['user', 'carry_service'], name='inbox_user_and_carry_service_must_be_unique'),
+        ]
+
+    @property
+    def listing(self):
+        return self.craft if self.craft_id != None else self.carry_service
+
+def count_cache_key(user_id):
+    return 'inbox-count:%d' % user_id
+
+def action_required_state(user):
+    """
+    Number of the user's inbox items that need action and the time it was counted,
+    cached until one of them changes or for INBOX_COUNT_CACHE_TIMEOUT seconds. The
+    count may have changed any time before then.
+    """
+    key = count_cache_key(user.pk)
+    state = cache.get(key)
+    if state == None:
+        state = (InboxItem.objects.filter(user=user, action_required=True).count(), timezone.now())
+        cache.set(key, state, getattr(settings, 'INBOX_COUNT_CACHE_TIMEOUT', 5 * 60))
+    return state
+
+def action_required_count(user):
+    return action_required_state(user)[0]
+
+def listing_states(listing, potential_buyer_ids):
+    """
+    The inbox kind of every user taking part in a listing, keyed by user id.
+    """
+    if listing.buyer_id == None:
+        states = {user_id: InboxItem.INTERESTED for user_id in potential_buyer_ids if user_id != listing.seller_id}
+        selectable = states and not getattr(listing, 'is_auction', False)
+        states[listing.seller_id] = InboxItem.SELECT_BUYER if selectable else InboxItem.SELLING
+        return states
+    return {
+        listing.seller_id: InboxItem.CLOSE_TRADE if listing.seller_trade_outcome == None else InboxItem.WAITING,
+        listing.buyer_id: InboxItem.CLOSE_TRADE if listing.buyer_trade_outcome == None else InboxItem.WAITING,
+    }
+
+def sync_listing(listing):
+    """
+    Bring the inbox rows of one listing in line with its state, writing only the rows that changed.
+    """
+    field = 'craft' if isinstance(listing, Craft) else 'carry_service'
+    if listing.buyer_id == None:
+        potential_buyers = CraftPotentialBuyer if field == 'craft' else CarryServicePotentialBuyer
+        potential_buyer_ids = potential_buyers.objects.filter(**{field: listing.pk}).values_list('buyer', flat=True)
+    else:
+        potential_buyer_ids = []
+    states = listing_states(listing, potential_buyer_ids)
+    items = {item.user_id: item for item in InboxItem.objects.filter(**{field: listing.pk})}
+    stale = [item.pk for user_id, item in items.items() if user_id not in states]
+    changed = []
+    new = []
+    for user_id, kind in states.items():
+        item = items.get(user_id)
+        if item == None:
+            new.append(InboxItem(user_id=user_id, kind=kind, action_required=kind in InboxItem.ACTION_REQUIRED, **{field: listing}))
+        elif item.kind != kind:
+            item.kind = kind
+            item.action_required = kind in InboxItem.ACTION_REQUIRED
+            changed.append(item)
+    if stale:
+        InboxItem.objects.filter(pk__in=stale).delete()
+    if changed:
+        InboxItem.objects.bulk_update(changed, ['kind', 'action_required'])
+    if new:
+        InboxItem.objects.bulk_create(new)
+    if changed or new:
+        cache.delete_many([count_cache_key(item.user_id) for item in changed + new])
+
+@receiver(post_save, sender=Craft)
+@receiver(post_save, sender=CarryService)
+@receiver(craft_updated, sender=Craft)
+def sync_listing_inbox(sender, instance, **kwargs):
+    sync_listing(instance)
+
+@receiver(post_save, sender=CraftPotentialBuyer)
+@receiver(post_save, sender=CarryServicePotentialBuyer)
+@receiver(post_delete, sender=CraftPotentialBuyer)
+@receiver(post_delete, sender=CarryServicePotentialBuyer)
+def sync_potential_buyer_inbox(sender, instance, origin=None, **kwargs):
+    # Rows removed along with their listing or user are taken care of by that deletion.
+    if origin != None and getattr(origin, 'model', type(origin)) != sender:
+        return
+    sync_listing(instance.craft if sender == CraftPotentialBuyer else instance.carry_service)
+
+@receiver(post_delete, sender=InboxItem)
+def invalidate_inbox_count(sender, instance, **kwargs):
+    cache.delete(count_cache_key(instance.user_id))
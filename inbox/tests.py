@@ -0,0 +1,170 @@
+from datetime import timedelta
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from .models import InboxItem, action_required_count
+from classifications.models import Classification
+from crafts.matching import matching_engine
+from crafts.models import BuyOrder, Craft, CraftPotentialBuyer
+from carry_services.models import CarryService, CarryServicePotentialBuyer
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+def create_classification(name):
+    """
+    Create a classification with name.
+    """
+    return Classification.objects.create(name=name, has_crafts=True)
+
+def create_craft(classification, seller, **kwargs):
+    """
+    Create a craft with the given classification and seller.
+    """
+    return Craft.objects.create(classification=classification, seller=seller, amount=1, price=1, currency="test", **kwargs)
+
+def create_carry_service(seller):
+    """
+    Create a carry service with the given seller.
+    """
+    return CarryService.objects.create(seller=seller, price=1, currency="test")
+
+def create_user(username, email, password):
+    """
+    Create a user with given username, email and password.
+    """
+    return User.objects.create(username=username, email=email, password=password)
+
+def inbox(user):
+    """
+    The user's inbox as a list of (kind, listing) pairs.
+    """
+    return [(item.kind, item.listing) for item in InboxItem.objects.filter(user=user).order_by('created_at')]
+
+class InboxSyncTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        matching_engine.rebuild()
+        self.seller = create_user('seller', 'seller@example.com', 'password')
+        self.buyer = create_user('buyer', 'buyer@example.com', 'password')
+        self.classification = create_classification('apple')
+        return super().setUp()
+
+    def test_new_listing_is_in_sellers_inbox_without_action(self):
+        """
+        A new listing should be listed for the seller without needing action.
+        """
+        craft = create_craft(self.classification, self.seller)
+        self.assertEqual(inbox(self.seller), [(InboxItem.SELLING, craft)])
+        self.assertEqual(action_required_count(self.seller), 0)
+
+    def test_potential_buyer_asks_seller_to_select_buyer(self):
+        """
+        A potential buyer should make the seller select a buyer, and leaving should undo that.
+        """
+        craft = create_craft(self.classification, self.seller)
+        potential_buyer = CraftPotentialBuyer.objects.create(craft=craft, buyer=self.buyer)
+        self.assertEqual(inbox(self.seller), [(InboxItem.SELECT_BUYER, craft)])
+        self.assertEqual(inbox(self.buyer), [(InboxItem.INTERESTED, craft)])
+        self.assertEqual(action_required_count(self.seller), 1)
+        CraftPotentialBuyer.objects.filter(pk=potential_buyer.pk).delete()
+        self.assertEqual(inbox(self.seller), [(InboxItem.SELLING, craft)])
+        self.assertEqual(inbox(self.buyer), [])
+        self.assertEqual(action_required_count(self.seller), 0)
+
+    def test_trade_outcomes(self):
+        """
+        Both parties should have to close a trade until they gave their outcome, and settling should empty the inbox.
+        """
+        other = create_user('other', 'other@example.com', 'password')
+        carry_service = create_carry_service(self.seller)
+        CarryServicePotentialBuyer.objects.create(carry_service=carry_service, buyer=self.buyer)
+        CarryServicePotentialBuyer.objects.create(carry_service=carry_service, buyer=other)
+        carry_service.buyer = self.buyer
+        carry_service.save()
+        self.assertEqual(inbox(self.seller), [(InboxItem.CLOSE_TRADE, carry_service)])
+        self.assertEqual(inbox(self.buyer), [(InboxItem.CLOSE_TRADE, carry_service)])
+        self.assertEqual(inbox(other), [])
+        carry_service.seller_trade_outcome = True
+        carry_service.save()
+        self.assertEqual(inbox(self.seller), [(InboxItem.WAITING, carry_service)])
+        self.assertEqual(action_required_count(self.seller), 0)
+        self.assertEqual(action_required_count(self.buyer), 1)
+        carry_service.buyer_trade_outcome = True
+        carry_service.settle()
+        self.assertEqual(InboxItem.objects.count(), 0)
+        self.assertEqual(action_required_count(self.buyer), 0)
+
+    def test_deleting_listing_with_potential_buyers(self):
+        """
+        Deleting a listing should remove its inbox rows along with its potential buyers.
+        """
+        craft = create_craft(self.classification, self.seller)
+        CraftPotentialBuyer.objects.create(craft=craft, buyer=self.buyer)
+        self.assertEqual(action_required_count(self.seller), 1)
+        craft.delete()
+        self.assertEqual(InboxItem.objects.count(), 0)
+        self.assertEqual(action_required_count(self.seller), 0)
+
+    def test_closed_auction(self):
+        """
+        Closing an auction should ask the seller and the highest bidder to close the trade.
+        """
+        craft = create_craft(self.classification, self.seller, is_auction=True, auction_ends_at=timezone.now() + timedelta(hours=1))
+        self.assertTrue(craft.place_bid(self.buyer, 5))
+        Craft.objects.filter(pk=craft.pk).update(auction_ends_at=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(craft.close_auction())
+        self.assertEqual(inbox(self.seller), [(InboxItem.CLOSE_TRADE, craft)])
+        self.assertEqual(inbox(self.buyer), [(InboxItem.CLOSE_TRADE, craft)])
+
+    def test_buy_order_fill(self):
+        """
+        A listing filled against a buy order should ask both parties to close the trade.
+        """
+        order = BuyOrder.objects.create(buyer=self.buyer, classification=self.classification, currency="test", quantity=1, max_price=1)
+        craft = create_craft(self.classification, self.seller)
+        matching_engine.match_listing(craft)
+        self.assertEqual(Craft.objects.get(pk=craft.pk).buy_order, order)
+        self.assertEqual(action_required_count(self.seller), 1)
+        self.assertEqual(action_required_count(self.buyer), 1)
+
+    def test_rebuild_inbox(self):
+        """
+        The rebuild command should recreate missing inbox rows.
+        """
+        craft = create_craft(self.classification, self.seller)
+        CraftPotentialBuyer.objects.create(craft=craft, buyer=self.buyer)
+        InboxItem.objects.all().delete()
+        call_command('rebuild_inbox', stdout=open('/dev/null', 'w'))
+        self.assertEqual(inbox(self.seller), [(InboxItem.SELECT_BUYER, craft)])
+        self.assertEqual(inbox(self.buyer), [(InboxItem.INTERESTED, craft)])
+
+class MyTradesViewTests(TestCase):
+
+    def test_my_trades_lists_action_required_first(self):
+        """
+        User should see their trades, the ones needing action first, and the count in the header.
+        """
+        cache.clear()
+        seller = create_user('seller', 'seller@example.com', 'password')
+        buyer = create_user('buyer', 'buyer@example.com', 'password')
+        classification = create_classification('apple')
+        waiting = create_craft(classification, seller)
+        selecting = create_craft(classification, seller)
+        CraftPotentialBuyer.objects.create(craft=selecting, buyer=buyer)
+        self.client.force_login(seller)
+        response = self.client.get(reverse('inbox:my-trades'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item.listing for item in response.context['object_list']], [selecting, waiting])
+        self.assertContains(response, 'My Trades (1)')
+
+    def test_count_is_cached(self):
+        """
+        The header count should not query the database once cached.
+        """
+        cache.clear()
+        user = create_user('user', 'user@example.com', 'password')
+        action_required_count(user)
+        with self.assertNumQueries(0):
+            self.assertEqual(action_required_count(user), 0)
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .views import MyTradesView
+
+app_name = 'inbox'
+urlpatterns = [
+    path('', MyTradesView.as_view(), name='my-trades'),
+]
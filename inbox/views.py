@@ -0,0 +1,11 @@
+from django.views.generic import ListView
+from django.contrib.auth.mixins import LoginRequiredMixin
+from .models import InboxItem
+
+class MyTradesView(LoginRequiredMixin, ListView):
+    model = InboxItem
+    template_name = 'inbox/my_trades.html'
+    paginate_by = 50
+
+    def get_queryset(self):
+        return InboxItem.objects.filter(user=self.request.user).select_related('craft__classification', 'carry_service').order_by('-action_required', '-created_at')
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class ListingCacheConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'listing_cache'
+
+    def ready(self):
+        from . import checks
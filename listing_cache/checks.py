@@ -0,0 +1,34 @@
+"""
+Version bumps, inbox counts, sessions, cached users and rate limit buckets are
+kept in the cache, and are only coherent across worker processes when the cache
+is shared. A local memory cache with more than one WEB_CONCURRENCY process
+leaves every worker with its own copy.
+"""
+import logging
+from django.conf import settings
+from django.core import checks
+
+logger = logging.getLogger(__name__)
+
+PROCESS_LOCAL_BACKENDS = {'django.core.cache.backends.locmem.LocMemCache'}
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs=None, **kwargs):
+    if getattr(settings, 'WEB_CONCURRENCY', 1) <= 1:
+        return []
+    aliases = {'default', getattr(settings, 'RATE_LIMIT_CACHE', 'default'), settings.SESSION_CACHE_ALIAS}
+    return [
+        checks.Error(
+            'The %s cache is local to each process, but WEB_CONCURRENCY runs %d processes.' % (alias, settings.WEB_CONCURRENCY),
+            hint='Set REDIS_URL, or point the cache at another backend the processes share.',
+            id='listing_cache.E001',
+        )
+        for alias in sorted(aliases) if settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_BACKENDS
+    ]
+
+def warn_unshared_cache():
+    """
+    Log the errors of check_shared_cache, for servers that start without running the checks.
+    """
+    for error in check_shared_cache():
+        logger.error('%s %s', error.msg, error.hint)
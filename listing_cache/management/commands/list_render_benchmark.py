@@ -0,0 +1,58 @@
+import time
+import tracemalloc
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import Context, Template
+from classifications.models import Classification
+from crafts.models import Craft
+from listing_cache.rows import CraftRow, Rows
+
+# The craft <li> of classification_detail.html.
+ITEM = Template('''{% for craft in crafts %}
+        <li>
+            <a href="{% url 'crafts:craft-detail' craft.pk %}">{{ craft.seller }}</a>
+            <p>Amount: {{ craft.amount }}</p>
+            <p>Price: {{ craft.price }}</p>
+            <p>Currency: {{ craft.currency }}</p>
+            {% if craft.buyer %}
+                <p>Buyer: {{ craft.buyer }}</p>
+            {% endif %}
+        </li>
+{% endfor %}''')
+
+class Command(BaseCommand):
+    help = 'Compare fetching and rendering a craft list from model instances and from projected rows. Test data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            classification = Classification.objects.create(name='list-render-benchmark', has_crafts=True)
+            users = User.objects.bulk_create([User(username='list-render-benchmark-%d' % i) for i in range(20)])
+            Craft.objects.bulk_create([
+                Craft(classification=classification, seller=users[i % 10], buyer=users[10 + i % 10] if i % 2 else None, amount=1, price=i + 1, currency='gold')
+                for i in range(options['rows'])
+            ], batch_size=1000)
+            crafts = Craft.objects.filter(classification=classification)
+            self.measure('Model instances, lazy seller and buyer', lambda: list(crafts.all()))
+            self.measure('Model instances, select_related', lambda: list(crafts.select_related('seller', 'buyer')))
+            self.measure('Projected rows', lambda: Rows(crafts.all(), CraftRow).fetch())
+            transaction.set_rollback(True)
+
+    def measure(self, label, fetch):
+        started = time.perf_counter()
+        rows = fetch()
+        fetched = time.perf_counter()
+        ITEM.render(Context({'crafts': rows}))
+        rendered = time.perf_counter()
+        del rows
+        # Memory is traced on a second fetch, since tracing slows the first one down.
+        tracemalloc.start()
+        rows = fetch()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write('%s: fetch %.0fms, render %.0fms, total %.0fms, fetch peak memory %.1fMB' % (
+            label, (fetched - started) * 1000, (rendered - fetched) * 1000, (rendered - started) * 1000, peak / 2 ** 20
+        ))
@@ -0,0 +1,78 @@
+from django.core.cache import cache
+from django.db.models import Q
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+from django.db.models.signals import post_delete, post_save
+from accounts.models import Profile, users_imported
+from classifications.models import Classification
+from crafts.models import Craft, craft_updated
+from currencies.models import Currency
+from carry_services.models import CarryService
+from .versions import CARRY_SERVICES, CLASSIFICATIONS, bump, version_key
+
+def craft_keys(crafts):
+    keys = set()
+    for pk, classification_id in crafts:
+        keys.add(version_key('craft', pk))
+        keys.add(version_key('classification', classification_id))
+    return keys
+
+def carry_service_keys(carry_service_ids):
+    keys = {version_key('carry_service', pk) for pk in carry_service_ids}
+    if keys:
+        keys.add(version_key(CARRY_SERVICES))
+    return keys
+
+@receiver(post_save, sender=Craft)
+@receiver(post_delete, sender=Craft)
+@receiver(craft_updated, sender=Craft)
+def bump_craft_versions(sender, instance, **kwargs):
+    bump(craft_keys([(instance.pk, instance.classification_id)]))
+
+@receiver(post_save, sender=CarryService)
+@receiver(post_delete, sender=CarryService)
+def bump_carry_service_versions(sender, instance, **kwargs):
+    bump(carry_service_keys([instance.pk]))
+
+@receiver(post_save, sender=Classification)
+@receiver(post_delete, sender=Classification)
+def bump_classification_versions(sender, instance, **kwargs):
+    keys = [version_key(CLASSIFICATIONS), version_key('classification', instance.pk)]
+    if instance.parent_id != None:
+        keys.append(version_key('classification', instance.parent_id))
+    bump(keys)
+
+@receiver(post_save, sender=User)
+def bump_user_listing_versions(sender, instance, created, update_fields=None, **kwargs):
+    # Listings show the usernames of their seller and buyer.
+    if created or (update_fields != None and 'username' not in update_fields):
+        return
+    involved = Q(seller=instance.pk) | Q(buyer=instance.pk)
+    keys = craft_keys(Craft.objects.filter(involved).values_list('pk', 'classification')) | carry_service_keys(CarryService.objects.filter(involved).values_list('pk', flat=True))
+    bump(keys | {version_key('user', instance.pk)})
+
+@receiver(post_save, sender=Profile)
+def bump_profile_versions(sender, instance, **kwargs):
+    # Listing pages show the reputation of everyone taking part, and lists sorted
+    # by seller reputation change order with it.
+    keys = {version_key('user', instance.user_id)}
+    keys |= {version_key('classification', pk) for pk in Craft.objects.filter(seller=instance.user_id).values_list('classification', flat=True).distinct()}
+    if CarryService.objects.filter(seller=instance.user_id).exists():
+        keys.add(version_key(CARRY_SERVICES))
+    bump(keys)
+
+@receiver(users_imported)
+def forget_imported_user_versions(sender, users, **kwargs):
+    # New users appear on no listing yet; only a version left by a deleted user
+    # with the same id could be stale, and a deleted key gets a new version.
+    cache.delete_many([version_key('user', user_id) for user_id, username, character_name in users])
+
+@receiver(post_save, sender=Currency)
+def bump_currency_versions(sender, instance, created, **kwargs):
+    # A new rate reorders the lists sorted by normalized price.
+    if created:
+        return
+    keys = {version_key('classification', pk) for pk in Craft.objects.filter(currency=instance).values_list('classification', flat=True).distinct()}
+    if CarryService.objects.filter(currency=instance).exists():
+        keys.add(version_key(CARRY_SERVICES))
+    bump(keys)
@@ -0,0 +1,42 @@
+"""
+Read-only rows for rendering listing lists. Only the displayed columns are
+fetched, joined to the seller and buyer usernames, into tuples with no
+per-instance dict instead of full model instances.
+"""
+from collections import namedtuple
+from carry_services.models import CarryService
+
+TYPE_LABELS = dict(CarryService.TYPE_CHOICES)
+
+class CraftRow(namedtuple('CraftRow', ['pk', 'seller', 'buyer', 'amount', 'price', 'currency'])):
+    __slots__ = ()
+    fields = ('pk', 'seller__username', 'buyer__username', 'amount', 'price', 'currency__code')
+
+class CarryServiceRow(namedtuple('CarryServiceRow', ['pk', 'seller', 'buyer', 'type', 'price', 'currency'])):
+    __slots__ = ()
+    fields = ('pk', 'seller__username', 'buyer__username', 'type', 'price', 'currency__code')
+
+    def get_type_display(self):
+        return TYPE_LABELS[self.type]
+
+class Rows:
+    """
+    Lazily evaluated projection of a queryset into rows, so a list whose fragment
+    is cached never runs its query.
+    """
+
+    def __init__(self, queryset, row_class):
+        self.queryset = queryset
+        self.row_class = row_class
+        self.rows = None
+
+    def fetch(self):
+        if self.rows == None:
+            self.rows = list(map(self.row_class._make, self.queryset.values_list(*self.row_class.fields)))
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.fetch())
+
+    def __len__(self):
+        return len(self.fetch())
@@ -0,0 +1,13 @@
+from django import template
+from listing_cache.versions import get_versions, version_key
+
+register = template.Library()
+
+@register.simple_tag
+def with_versions(listings, kind):
+    """
+    Pair every listing with its cache version, looked up in one cache round trip.
+    """
+    listings = list(listings)
+    versions = get_versions([version_key(kind, listing.pk) for listing in listings])
+    return [(listing, versions[version_key(kind, listing.pk)]) for listing in listings]
@@ -0,0 +1,300 @@
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from .checks import check_shared_cache
+from .rows import CraftRow, Rows
+from trending.counters import view_counter
+from trending.models import ListingPopularity
+from .versions import CARRY_SERVICES, bump, get_version, version_key
+from accounts.models import Profile
+from classifications.models import Classification
+from crafts.models import Craft
+from carry_services.models import CarryService, CarryServicePotentialBuyer
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+def create_classification(name, parent=None):
+    """
+    Create a classification with name.
+    """
+    return Classification.objects.create(name=name, parent=parent, has_crafts=True)
+
+def create_craft(classification, seller, price=1):
+    """
+    Create a craft with the given classification, seller and price.
+    """
+    return Craft.objects.create(classification=classification, seller=seller, amount=1, price=price, currency="test")
+
+def create_carry_service(seller, price=1):
+    """
+    Create a carry service with the given seller and price.
+    """
+    return CarryService.objects.create(seller=seller, price=price, currency="test")
+
+def create_user(username, email, password):
+    """
+    Create a user with given username, email and password.
+    """
+    return User.objects.create(username=username, email=email, password=password)
+
+class VersionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        return super().setUp()
+
+    def test_version_is_stable_until_bumped(self):
+        """
+        A version should stay the same until it is bumped.
+        """
+        version = get_version(version_key('test'))
+        self.assertEqual(get_version(version_key('test')), version)
+        bump([version_key('test')])
+        self.assertNotEqual(get_version(version_key('test')), version)
+
+    def test_listing_changes_bump_versions(self):
+        """
+        Saving or deleting a carry service should bump its own and the list version.
+        """
+        seller = create_user('seller', 'seller@example.com', 'password')
+        carry_service = create_carry_service(seller)
+        listing_version = get_version(version_key('carry_service', carry_service.pk))
+        list_version = get_version(version_key(CARRY_SERVICES))
+        carry_service.price = 2
+        carry_service.save()
+        self.assertNotEqual(get_version(version_key('carry_service', carry_service.pk)), listing_version)
+        self.assertNotEqual(get_version(version_key(CARRY_SERVICES)), list_version)
+        list_version = get_version(version_key(CARRY_SERVICES))
+        carry_service.delete()
+        self.assertNotEqual(get_version(version_key(CARRY_SERVICES)), list_version)
+
+class RowsTests(TestCase):
+
+    def test_rows_are_projected_lazily(self):
+        """
+        Rows should only be fetched when iterated, in one query joined to the usernames.
+        """
+        seller = create_user('seller', 'seller@example.com', 'password')
+        buyer = create_user('buyer', 'buyer@example.com', 'password')
+        classification = create_classification('apple')
+        craft = Craft.objects.create(classification=classification, seller=seller, buyer=buyer, amount=2, price=3, currency="test")
+        with self.assertNumQueries(0):
+            rows = Rows(Craft.objects.all(), CraftRow)
+        with self.assertNumQueries(1):
+            self.assertEqual(list(rows), [CraftRow(craft.pk, 'seller', 'buyer', 2, 3, 'test')])
+            self.assertEqual(len(rows), 1)
+        with self.assertRaises(AttributeError):
+            rows.fetch()[0].price = 4
+
+class FragmentCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user('test_user', 'test_user@example.com', 'password')
+        self.seller = create_user('seller', 'seller@example.com', 'password')
+        self.classification = create_classification('apple')
+        self.client.force_login(self.user)
+        return super().setUp()
+
+    def test_crafts_are_served_from_cache_until_changed(self):
+        """
+        The craft list should be cached until a craft in the classification changes.
+        """
+        craft = create_craft(self.classification, self.seller, price=3)
+        url = reverse('classifications:classification-detail', kwargs={'pk': self.classification.pk})
+        self.assertContains(self.client.get(url), 'Price: 3')
+        Craft.objects.filter(pk=craft.pk).update(price=4)
+        self.assertContains(self.client.get(url), 'Price: 3')
+        craft.price = 5
+        craft.save()
+        self.assertContains(self.client.get(url), 'Price: 5')
+        create_craft(self.classification, self.seller, price=6)
+        self.assertContains(self.client.get(url), 'Price: 6')
+
+    def test_search_is_part_of_the_key(self):
+        """
+        Different searches should not share a cached list.
+        """
+        create_craft(self.classification, self.seller, price=3)
+        url = reverse('classifications:classification-detail', kwargs={'pk': self.classification.pk})
+        self.assertContains(self.client.get(url), 'Price: 3')
+        self.assertNotContains(self.client.get(url, {'searchby': 'seller', 'search': 'nobody'}), 'Price: 3')
+
+    def test_per_user_header_is_not_cached(self):
+        """
+        Users should share cached lists but see their own header.
+        """
+        create_carry_service(self.seller, price=3)
+        url = reverse('carry_services:carry-service-list')
+        self.assertContains(self.client.get(url), 'test_user')
+        self.client.force_login(self.seller)
+        response = self.client.get(url)
+        self.assertContains(response, 'Price: 3')
+        self.assertNotContains(response, 'test_user')
+
+    def test_username_change_updates_listings(self):
+        """
+        Renaming a seller should refresh the cached lists showing their listings.
+        """
+        create_carry_service(self.seller)
+        url = reverse('carry_services:carry-service-list')
+        self.assertContains(self.client.get(url), 'seller')
+        self.seller.username = 'renamed'
+        self.seller.save()
+        self.assertContains(self.client.get(url), 'renamed')
+
+    def test_reputation_change_updates_sorted_lists(self):
+        """
+        A seller's reputation changing should refresh lists sorted by reputation.
+        """
+        other = create_user('other', 'other@example.com', 'password')
+        create_carry_service(self.seller, price=3)
+        create_carry_service(other, price=4)
+        url = reverse('carry_services:carry-service-list')
+        self.assertEqual(list(self.client.get(url, {'sort': 'reputation'}).context['object_list'].values_list('price', flat=True)), [3, 4])
+        profile = Profile.objects.get(user=other)
+        profile.reputation = 10
+        profile.save()
+        content = self.client.get(url, {'sort': 'reputation'}).content.decode()
+        self.assertLess(content.index('Price: 4'), content.index('Price: 3'))
+
+    def test_new_classification_updates_classification_list(self):
+        """
+        A new root classification should show up on the cached classification list.
+        """
+        url = reverse('classifications:classification-list')
+        self.assertContains(self.client.get(url), 'apple')
+        create_classification('kiwi')
+        self.assertContains(self.client.get(url), 'kiwi')
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user('test_user', 'test_user@example.com', 'password')
+        self.seller = create_user('seller', 'seller@example.com', 'password')
+        self.client.force_login(self.user)
+        return super().setUp()
+
+    def test_unchanged_list_is_not_modified_before_listing_queries(self):
+        """
+        A list with a matching ETag should get 304 without querying listings.
+        """
+        create_carry_service(self.seller)
+        url = reverse('carry_services:carry-service-list')
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([query for query in queries if 'carry_services_carryservice' in query['sql']])
+        create_carry_service(self.seller)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_query_string_and_user_are_part_of_the_etag(self):
+        """
+        Other searches and other users should not share an ETag.
+        """
+        url = reverse('carry_services:carry-service-list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, {'sort': 'reputation'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.client.force_login(self.seller)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_changes_with_potential_buyers(self):
+        """
+        A listing page should change when a potential buyer leaves.
+        """
+        carry_service = create_carry_service(self.seller)
+        potential_buyer = CarryServicePotentialBuyer.objects.create(carry_service=carry_service, buyer=self.user)
+        url = reverse('carry_services:carry-service-detail', kwargs={'pk': carry_service.pk})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        CarryService.objects.filter(pk=carry_service.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        potential_buyer.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertGreater(CarryService.objects.get(pk=carry_service.pk).updated_at, timezone.now() - timedelta(minutes=1))
+
+    def test_detail_if_modified_since(self):
+        """
+        A listing page should be not modified since its Last-Modified time.
+        """
+        carry_service = create_carry_service(self.seller)
+        url = reverse('carry_services:carry-service-detail', kwargs={'pk': carry_service.pk})
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        earlier = http_date((timezone.now() - timedelta(hours=1)).timestamp())
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=earlier).status_code, 200)
+
+    def test_inbox_count_changes_the_page(self):
+        """
+        The page should change when the user's header count does.
+        """
+        classification = create_classification('apple')
+        carry_service = create_carry_service(self.user)
+        url = reverse('classifications:classification-detail', kwargs={'pk': classification.pk})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        CarryServicePotentialBuyer.objects.create(carry_service=carry_service, buyer=self.seller)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_logging_in_again_changes_the_page(self):
+        """
+        A page cached before logging out carries a CSRF token that no longer works.
+        """
+        carry_service = create_carry_service(self.seller)
+        url = reverse('carry_services:carry-service-detail', kwargs={'pk': carry_service.pk})
+        etag = self.client.get(url)['ETag']
+        self.client.logout()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_missing_listing_has_no_validators(self):
+        """
+        A 404 should not be tagged with an ETag or Last-Modified.
+        """
+        response = self.client.get(reverse('classifications:classification-detail', kwargs={'pk': 0}))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_missing_classification_creates_no_version(self):
+        """
+        A classification that does not exist should not get a version key.
+        """
+        self.client.get(reverse('classifications:classification-detail', kwargs={'pk': 12345}))
+        self.assertEqual(cache.get(version_key('classification', 12345)), None)
+
+    def test_not_modified_still_counts_a_view(self):
+        """
+        A revalidated listing page should count toward trending.
+        """
+        carry_service = create_carry_service(self.seller)
+        url = reverse('carry_services:carry-service-detail', kwargs={'pk': carry_service.pk})
+        view_counter.flush()
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        view_counter.flush()
+        self.assertEqual(ListingPopularity.objects.get(carry_service=carry_service).views, 2)
+
+class SharedCacheCheckTests(TestCase):
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_local_cache_fails_with_several_processes(self):
+        """
+        A local memory cache should only pass the checks with a single process.
+        """
+        with self.settings(WEB_CONCURRENCY=1):
+            self.assertEqual(check_shared_cache(), [])
+        with self.settings(WEB_CONCURRENCY=4):
+            self.assertEqual([error.id for error in check_shared_cache()], ['listing_cache.E001'])
+
+    @override_settings(WEB_CONCURRENCY=4, CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}})
+    def test_shared_cache_passes(self):
+        """
+        A shared cache should pass whatever the number of processes.
+        """
+        self.assertEqual(check_shared_cache(), [])
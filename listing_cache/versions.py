@@ -0,0 +1,60 @@
+"""
+Version keys for cached page fragments. A fragment is cached under the versions
+of what it shows, and changing a listing or classification replaces those
+versions, so stale fragments are never read again and simply expire. Versions
+expire too, after LISTING_VERSION_TIMEOUT seconds; a key read after that gets a
+new version, which only costs rendering its fragments again.
+
+A version starts with the time it was made, which gives pages built from
+versions their Last-Modified time.
+"""
+import time
+import uuid
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CLASSIFICATIONS = 'classifications'
+CARRY_SERVICES = 'carry_services'
+TRENDING = 'trending'
+TRUST = 'trust'
+
+def version_timeout():
+    return getattr(settings, 'LISTING_VERSION_TIMEOUT', 24 * 60 * 60)
+
+def version_key(*parts):
+    return 'version:' + ':'.join(str(part) for part in parts)
+
+def new_version():
+    return '%d-%s' % (time.time_ns(), uuid.uuid4().hex[:8])
+
+def version_time(version):
+    return datetime.fromtimestamp(int(version.split('-')[0]) / 1e9, timezone.utc)
+
+def get_versions(keys):
+    """
+    Return the current version of each key, creating the ones not set yet.
+    """
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, version_timeout())
+        versions.update(missing)
+    return versions
+
+def get_version(key):
+    return get_versions([key])[key]
+
+def bump(keys):
+    """
+    Give the keys new versions now and again once the transaction commits, so a
+    reader in another transaction can not cache data from before the commit under
+    the new versions.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    new_versions = lambda: cache.set_many({key: new_version() for key in keys}, version_timeout())
+    new_versions()
+    transaction.on_commit(new_versions)
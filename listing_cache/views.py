@@ -0,0 +1,60 @@
+from hashlib import md5
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from inbox.models import action_required_state
+from .versions import TRUST, get_versions, version_key, version_time
+
+class ConditionalGetMixin:
+    """
+    Answer GETs with 304 Not Modified when the page has not changed, before the
+    view runs its own queries or renders. get_validators() returns what the page
+    shows as a tuple of hashable parts plus when it last changed, or None when the
+    page can not be checked cheaply. The user's header and the session, whose
+    CSRF token the page's forms carry, are added here.
+    """
+
+    def get_validators(self):
+        return None
+
+    def record_view(self):
+        """
+        Called for every GET of the page, including those answered with 304.
+        """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not request.user.is_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+        validators = self.get_validators()
+        if validators == None:
+            return super().dispatch(request, *args, **kwargs)
+        self.record_view()
+        parts, last_modified = validators
+        count, counted_at = action_required_state(request.user)
+        # Logging in again cycles the session key along with the CSRF secret, which
+        # a cached page would otherwise keep posting.
+        etag = quote_etag(md5(repr((parts, request.user.pk, request.session.session_key, count, request.GET.urlencode())).encode()).hexdigest())
+        last_modified = int(max(last_modified, counted_at).timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response != None:
+            return response
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200:
+            response.headers.setdefault('ETag', etag)
+            response.headers.setdefault('Last-Modified', http_date(last_modified))
+        return response
+
+def version_validators(*keys):
+    """
+    Validators for a page built from the given version keys.
+    """
+    versions = get_versions([version_key(*key) for key in keys])
+    return tuple(sorted(versions.items())), max(version_time(version) for version in versions.values())
+
+def listing_validators(updated_at, user_ids, potential_buyers):
+    """
+    Validators for a listing page from its updated_at, the users shown on it and
+    the (buyer, updated_at) rows of its potential buyers.
+    """
+    user_ids = (set(user_ids) | {buyer for buyer, _ in potential_buyers}) - {None}
+    parts, last_modified = version_validators((TRUST,), *[('user', pk) for pk in sorted(user_ids)])
+    return (updated_at, tuple(potential_buyers), parts), max([updated_at, last_modified] + [modified for _, modified in potential_buyers])
@@ -0,0 +1,113 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q, Sum
+from django.dispatch import receiver
+from django.utils import timezone
+from classifications.models import Classification
+from crafts.models import Craft, craft_settled
+from currencies.models import CurrencyField
+from .sketch import bin_of, quantiles
+
+# Settlements are counted in buckets of BUCKET_SECONDS, so a window starts at the
+# beginning of the bucket it falls in and may cover up to one bucket more.
+BUCKET_SECONDS = 10 * 60
+WINDOWS = [('1h', timedelta(hours=1)), ('24h', timedelta(days=1)), ('7d', timedelta(days=7))]
+PERCENTILES = [('p10', 0.1), ('p25', 0.25), ('median', 0.5), ('p75', 0.75), ('p90', 0.9)]
+
+class SettledPrice(models.Model):
+    classification = models.ForeignKey(Classification, on_delete=models.CASCADE, related_name='+')
+    currency = CurrencyField()
+    amount = models.IntegerField()
+    price = models.IntegerField()
+    settled_at = models.DateTimeField(default=timezone.now)
+    class Meta:
+        indexes = [
+            models.Index(fields=['classification', 'currency', '-settled_at'], name='settled_price_history'),
+        ]
+
+class PriceBucket(models.Model):
+    """
+    Settlements of a classification in one currency and time bucket whose unit
+    price fell in one sketch bin.
+    """
+    classification = models.ForeignKey(Classification, on_delete=models.CASCADE, related_name='+')
+    currency = CurrencyField()
+    bucket = models.DateTimeField()
+    bin = models.IntegerField()
+    trades = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['classification', 'currency', 'bucket', 'bin'], name='price_bucket_unique'),
+        ]
+
+def bucket_start(when):
+    return datetime.fromtimestamp(when.timestamp() // BUCKET_SECONDS * BUCKET_SECONDS, dt_timezone.utc)
+
+def record_price(classification_id, currency_id, amount, price, settled_at=None):
+    """
+    Record a settled trade: one history row and one counter increment, however
+    much history there is.
+    """
+    settled_at = settled_at or timezone.now()
+    SettledPrice.objects.create(classification_id=classification_id, currency_id=currency_id, amount=amount, price=price, settled_at=settled_at)
+    key = {'classification_id': classification_id, 'currency_id': currency_id, 'bucket': bucket_start(settled_at), 'bin': bin_of(price / amount)}
+    increment = {'trades': F('trades') + 1, 'units': F('units') + amount}
+    if PriceBucket.objects.filter(**key).update(**increment):
+        return
+    try:
+        with transaction.atomic():
+            PriceBucket.objects.create(trades=1, units=amount, **key)
+    except IntegrityError:
+        # Another settlement created the bucket first.
+        PriceBucket.objects.filter(**key).update(**increment)
+
+def rebuild_price_buckets(batch_size=1000):
+    """
+    Recount every bucket from the price history.
+    """
+    counts = defaultdict(lambda: [0, 0])
+    for classification_id, currency_id, amount, price, settled_at in SettledPrice.objects.values_list('classification', 'currency', 'amount', 'price', 'settled_at').iterator():
+        bucket = counts[(classification_id, currency_id, bucket_start(settled_at), bin_of(price / amount))]
+        bucket[0] += 1
+        bucket[1] += amount
+    with transaction.atomic():
+        PriceBucket.objects.all().delete()
+        PriceBucket.objects.bulk_create([
+            PriceBucket(classification_id=classification_id, currency_id=currency_id, bucket=bucket, bin=bin, trades=trades, units=units)
+            for (classification_id, currency_id, bucket, bin), (trades, units) in counts.items()
+        ], batch_size=batch_size)
+
+def market_stats(classification, now=None):
+    """
+    Trades, units and unit price percentiles of a classification over the last
+    hour, day and week, per currency, summed from the buckets by one query.
+    """
+    now = now or timezone.now()
+    starts = {name: bucket_start(now - length) for name, length in WINDOWS}
+    sums = {}
+    for name, start in starts.items():
+        sums['trades_' + name] = Sum('trades', filter=Q(bucket__gte=start))
+        sums['units_' + name] = Sum('units', filter=Q(bucket__gte=start))
+    rows = PriceBucket.objects.filter(classification=classification, bucket__gte=min(starts.values())).values('currency__code', 'bin').annotate(**sums).order_by()
+    counts = defaultdict(lambda: {name: {} for name in starts})
+    units = defaultdict(lambda: dict.fromkeys(starts, 0))
+    for row in rows:
+        for name in starts:
+            if row['trades_' + name]:
+                counts[row['currency__code']][name][row['bin']] = row['trades_' + name]
+                units[row['currency__code']][name] += row['units_' + name]
+    stats = {}
+    for currency in sorted(counts):
+        stats[currency] = {}
+        for name in starts:
+            window = {'trades': sum(counts[currency][name].values()), 'units': units[currency][name]}
+            for (label, _), value in zip(PERCENTILES, quantiles(counts[currency][name], [q for _, q in PERCENTILES])):
+                window[label] = None if value == None else round(value, 2)
+            stats[currency][name] = window
+    return stats
+
+@receiver(craft_settled, sender=Craft)
+def record_settled_craft(sender, instance, **kwargs):
+    record_price(instance.classification_id, instance.currency_id, instance.amount, instance.price)
@@ -0,0 +1,37 @@
+"""
+Log-binned quantile sketch. A positive value falls in bin ceil(log(value, GAMMA)),
+and every value in a bin is within ACCURACY of the bin's representative value,
+so a quantile read from bin counts is within ACCURACY of the true quantile
+relative to its size. Sketches merge by adding the counts of equal bins, which
+lets the database sum them over any range of time buckets.
+"""
+import math
+
+ACCURACY = 0.01
+GAMMA = (1 + ACCURACY) / (1 - ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+def bin_of(value):
+    return math.ceil(math.log(value) / LOG_GAMMA)
+
+def bin_value(bin):
+    return 2 * GAMMA ** bin / (GAMMA + 1)
+
+def quantiles(counts, qs):
+    """
+    Estimate the quantiles qs, each between 0 and 1, from a mapping of bin to
+    count. Returns None for each when counts is empty.
+    """
+    total = sum(counts.values())
+    if total == 0:
+        return [None for _ in qs]
+    bins = sorted(counts.items())
+    estimates = []
+    for q in qs:
+        rank, seen = q * (total - 1), 0
+        for bin, count in bins:
+            seen += count
+            if seen > rank:
+                break
+        estimates.append(bin_value(bin))
+    return estimates
@@ -0,0 +1,85 @@
+import random
+from datetime import timedelta
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+from classifications.models import Classification
+from currencies.models import intern_currency
+from crafts.models import Craft
+from .models import PriceBucket, SettledPrice, market_stats, record_price
+from .sketch import ACCURACY, bin_of, quantiles
+
+def create_classification(name):
+    """
+    Create a classification with name.
+    """
+    return Classification.objects.create(name=name, has_crafts=True)
+
+def create_user(username, email, password):
+    """
+    Create a user with given username, email and password.
+    """
+    return User.objects.create(username=username, email=email, password=password)
+
+class SketchTests(TestCase):
+
+    def test_quantiles_are_within_accuracy(self):
+        """
+        Estimated quantiles should be within the sketch accuracy of the exact ones.
+        """
+        rng = random.Random(0)
+        values = sorted(rng.lognormvariate(3, 1) for _ in range(10000))
+        counts = {}
+        for value in values:
+            counts[bin_of(value)] = counts.get(bin_of(value), 0) + 1
+        for q, estimate in zip([0.1, 0.5, 0.9], quantiles(counts, [0.1, 0.5, 0.9])):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertLessEqual(abs(estimate - exact) / exact, ACCURACY)
+
+class MarketStatsTests(TestCase):
+
+    def setUp(self):
+        self.classification = create_classification('apple')
+        self.gold = intern_currency('gold')
+        return super().setUp()
+
+    def test_windows_and_percentiles(self):
+        """
+        Each window should only count the settlements made within it.
+        """
+        now = timezone.now()
+        record_price(self.classification.pk, self.gold.pk, 1, 10, now - timedelta(minutes=1))
+        record_price(self.classification.pk, self.gold.pk, 2, 40, now - timedelta(hours=3))
+        record_price(self.classification.pk, self.gold.pk, 1, 30, now - timedelta(days=3))
+        record_price(self.classification.pk, self.gold.pk, 1, 30, now - timedelta(days=30))
+        stats = market_stats(self.classification, now)['gold']
+        self.assertEqual([stats[window]['trades'] for window in ['1h', '24h', '7d']], [1, 2, 3])
+        self.assertEqual([stats[window]['units'] for window in ['1h', '24h', '7d']], [1, 3, 4])
+        self.assertAlmostEqual(stats['1h']['median'], 10, delta=10 * ACCURACY)
+        self.assertAlmostEqual(stats['7d']['median'], 20, delta=20 * ACCURACY)
+        self.assertEqual(SettledPrice.objects.count(), 4)
+
+    def test_recording_is_one_counter_per_bucket_and_bin(self):
+        """
+        Repeated prices should increment the same counter instead of adding rows.
+        """
+        for _ in range(5):
+            record_price(self.classification.pk, self.gold.pk, 1, 10)
+        with self.assertNumQueries(2):
+            record_price(self.classification.pk, self.gold.pk, 1, 10)
+        self.assertEqual(list(PriceBucket.objects.values_list('trades', 'units')), [(6, 6)])
+
+    def test_settled_craft_is_recorded(self):
+        """
+        Settling a craft should record its price.
+        """
+        seller = create_user('seller', 'seller@example.com', 'password')
+        buyer = create_user('buyer', 'buyer@example.com', 'password')
+        craft = Craft.objects.create(classification=self.classification, seller=seller, buyer=buyer, amount=2, price=8, currency='gold', seller_trade_outcome=True)
+        self.client.force_login(buyer)
+        self.client.post(reverse('crafts:craft-buyer-outcome', kwargs={'pk': craft.pk}), data={'outcome': 'True'})
+        self.assertEqual(list(SettledPrice.objects.values_list('currency__code', 'amount', 'price')), [('gold', 2, 8)])
+        response = self.client.get(reverse('market:market-stats', kwargs={'pk': self.classification.pk}))
+        self.assertEqual(response.json()['currencies']['gold']['24h']['trades'], 1)
+        self.assertContains(self.client.get(reverse('classifications:classification-detail', kwargs={'pk': self.classification.pk})), 'Unit prices in gold')
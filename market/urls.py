@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .views import MarketStatsView
+
+app_name = 'market'
+urlpatterns = [
+    path('<str:pk>/', MarketStatsView.as_view(), name='market-stats'),
+]
@@ -0,0 +1,16 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views import View
+from classifications.models import Classification
+from .models import market_stats
+
+class MarketStatsView(LoginRequiredMixin, View):
+    """
+    Recent trades of a classification as JSON: per currency and window, the
+    number of trades, the units traded and unit price percentiles.
+    """
+
+    def get(self, request, *args, **kwargs):
+        classification = get_object_or_404(Classification, pk=kwargs['pk'])
+        return JsonResponse({'classification': classification.pk, 'currencies': market_stats(classification)})
@@ -0,0 +1,36 @@
+import time
+from .registry import registry
+
+requests_total = registry.counter('http_requests_total', 'HTTP requests by view, method and status.', ['view', 'method', 'status'])
+request_duration = registry.histogram('http_request_duration_seconds', 'Time spent answering HTTP requests, by view.', ['view', 'method'])
+requests_in_progress = registry.gauge('http_requests_in_progress', 'HTTP requests being answered.')
+exceptions_total = registry.counter('http_exceptions_total', 'Requests whose view raised an exception, by view and exception type.', ['view', 'type'])
+
+def view_label(request):
+    # URL names rather than paths, so that listing ids do not become label values.
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match != None else 'unresolved'
+
+class MetricsMiddleware:
+    """
+    Counts and times every request by the URL name of its view. Placed first,
+    so the time includes the other middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        requests_in_progress.inc()
+        try:
+            response = self.get_response(request)
+        finally:
+            requests_in_progress.dec()
+        view = view_label(request)
+        request_duration.observe(time.perf_counter() - started, view=view, method=request.method)
+        requests_total.inc(view=view, method=request.method, status=response.status_code)
+        return response
+
+    def process_exception(self, request, exception):
+        exceptions_total.inc(view=view_label(request), type=type(exception).__name__)
@@ -0,0 +1,46 @@
+from django.dispatch import receiver
+from django.db.models.signals import post_delete, post_save
+from carry_services.models import CarryService, CarryServicePotentialBuyer, carry_service_settled
+from crafts.models import Craft, CraftBid, CraftPotentialBuyer, craft_settled
+from .registry import registry
+
+listings_created = registry.counter('marketplace_listings_created_total', 'Listings put up for sale, by kind.', ['kind'])
+settlements = registry.counter('marketplace_settlements_total', 'Trades settled, by kind and by whether both sides reported it went well.', ['kind', 'outcome'])
+potential_buyers_added = registry.counter('marketplace_potential_buyers_added_total', 'Users who said they want a listing, by kind.', ['kind'])
+potential_buyers_removed = registry.counter('marketplace_potential_buyers_removed_total', 'Users who took back their interest in a listing, by kind.', ['kind'])
+bids = registry.counter('marketplace_bids_total', 'Accepted auction bids.')
+
+def kind(sender):
+    return 'craft' if sender in (Craft, CraftPotentialBuyer) else 'carry_service'
+
+@receiver(post_save, sender=Craft)
+@receiver(post_save, sender=CarryService)
+def count_listing(sender, instance, created, **kwargs):
+    if created:
+        listings_created.inc(kind=kind(sender))
+
+@receiver(craft_settled, sender=Craft)
+@receiver(carry_service_settled, sender=CarryService)
+def count_settlement(sender, instance, **kwargs):
+    outcomes = {instance.seller_trade_outcome, instance.buyer_trade_outcome}
+    outcome = 'positive' if outcomes == {True} else 'negative' if outcomes == {False} else 'mixed'
+    settlements.inc(kind=kind(sender), outcome=outcome)
+
+@receiver(post_save, sender=CraftPotentialBuyer)
+@receiver(post_save, sender=CarryServicePotentialBuyer)
+def count_potential_buyer(sender, instance, created, **kwargs):
+    if created:
+        potential_buyers_added.inc(kind=kind(sender))
+
+@receiver(post_delete, sender=CraftPotentialBuyer)
+@receiver(post_delete, sender=CarryServicePotentialBuyer)
+def count_removed_potential_buyer(sender, instance, origin=None, **kwargs):
+    # Rows removed along with their listing, such as on settlement, are not churn.
+    if origin != None and getattr(origin, 'model', type(origin)) != sender:
+        return
+    potential_buyers_removed.inc(kind=kind(sender))
+
+@receiver(post_save, sender=CraftBid)
+def count_bid(sender, instance, created, **kwargs):
+    if created:
+        bids.inc()
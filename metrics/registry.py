@@ -0,0 +1,292 @@
+"""
+In-process metrics in the Prometheus text exposition format. Counters, gauges
+and histograms keep their samples per label values under a lock, so they can be
+updated from any thread.
+
+With METRICS_DIRECTORY set, every process writes a snapshot of its metrics to
+that directory every METRICS_FLUSH_INTERVAL seconds and at exit, and /metrics
+adds up the snapshots of all processes: counters and histograms over every
+process that ever wrote one, gauges over the processes still running. Snapshot
+files are named by pid and a random id, so a worker that reuses the pid of an
+exited one does not overwrite its counts. The counters and histograms of exited
+processes are folded into one archive snapshot and their files removed.
+"""
+import atexit
+import bisect
+import fcntl
+import json
+import logging
+import math
+import os
+import secrets
+import threading
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE = 'archive.json'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError('%s takes the labels %s, not %s.' % (self.name, ', '.join(self.labelnames), ', '.join(sorted(labels))))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(key), value] for key, value in self.samples.items()]
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError('Counters can only go up.')
+        key = self.key(labels)
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.samples[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    """
+    Observations counted in buckets of upper bounds, with their sum. A sample is
+    the list of counts per bucket, made cumulative when rendered, followed by the sum.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            sample = self.samples.get(key)
+            if sample == None:
+                sample = self.samples[key] = [0] * len(self.buckets) + [0.0]
+            sample[bisect.bisect_left(self.buckets, value)] += 1
+            sample[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(key), list(sample)] for key, sample in self.samples.items()]
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.process = None
+
+    def register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing != None:
+                if type(existing) != type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError('A different metric is already registered as %s.' % metric.name)
+                return existing
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def snapshot(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {
+            metric.name: {
+                'type': metric.type, 'help': metric.help, 'labelnames': list(metric.labelnames),
+                'buckets': [repr(bound) for bound in getattr(metric, 'buckets', [])], 'samples': metric.snapshot(),
+            }
+            for metric in metrics
+        }
+
+    def directory(self):
+        return getattr(settings, 'METRICS_DIRECTORY', None)
+
+    def snapshot_name(self):
+        # A forked child gets a name of its own.
+        if self.process == None or self.process[0] != os.getpid():
+            self.process = (os.getpid(), secrets.token_hex(8))
+        return '%d-%s.json' % self.process
+
+    def write(self):
+        """
+        Write this process's snapshot to METRICS_DIRECTORY, replacing the last one.
+        """
+        directory = self.directory()
+        if not directory:
+            return
+        path = os.path.join(directory, self.snapshot_name())
+        write_snapshot(path, {'pid': os.getpid(), 'metrics': self.snapshot()})
+
+    def collect(self):
+        """
+        The snapshot of this process, or the sum of all processes with METRICS_DIRECTORY.
+        """
+        if not self.directory():
+            return self.snapshot()
+        self.write()
+        directory = self.directory()
+        with open(os.path.join(directory, '.lock'), 'w') as lock:
+            # Only one process folds exited snapshots into the archive at a time.
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshots = read_snapshots(directory)
+            exited = [name for name, snapshot in snapshots.items() if name != ARCHIVE and not running(snapshot['pid'])]
+            if exited:
+                archive = merge([snapshots.pop(name) for name in [ARCHIVE, *exited] if name in snapshots])
+                snapshots[ARCHIVE] = {'pid': None, 'metrics': archive}
+                write_snapshot(os.path.join(directory, ARCHIVE), snapshots[ARCHIVE])
+                for name in exited:
+                    os.remove(os.path.join(directory, name))
+        return merge(snapshots.values())
+
+    def start(self):
+        """
+        Start writing snapshots in the background when METRICS_DIRECTORY is set.
+        Called from the WSGI and ASGI entry points, like the view counter.
+        """
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+        if self.thread != None or not self.directory() or not interval:
+            return
+        os.makedirs(self.directory(), exist_ok=True)
+        self.thread = threading.Thread(target=self.run, args=(interval,), name='metrics-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self.stopped.set()
+        self.write()
+
+    def run(self, interval):
+        while not self.stopped.wait(interval):
+            try:
+                self.write()
+            except OSError:
+                logger.exception('Could not write the metrics snapshot.')
+
+def write_snapshot(path, snapshot):
+    with open(path + '.tmp', 'w') as stream:
+        json.dump(snapshot, stream)
+    os.replace(path + '.tmp', path)
+
+def read_snapshots(directory):
+    snapshots = {}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as stream:
+                snapshots[name] = json.load(stream)
+        except (OSError, ValueError):
+            logger.warning('Could not read the metrics snapshot %s.', name)
+    return snapshots
+
+def running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def merge(snapshots):
+    """
+    Add up process snapshots. Gauges of processes that have exited are left out,
+    since their values no longer describe anything, and so is every gauge of the
+    archive, which has no pid.
+    """
+    merged = {}
+    for snapshot in snapshots:
+        alive = None
+        for name, metric in snapshot['metrics'].items():
+            if metric['type'] == 'gauge':
+                if alive == None:
+                    alive = snapshot['pid'] != None and running(snapshot['pid'])
+                if not alive:
+                    continue
+            target = merged.setdefault(name, dict(metric, samples={}))
+            samples = target['samples']
+            for labels, value in metric['samples']:
+                key = tuple(labels)
+                if metric['type'] == 'histogram':
+                    previous = samples.get(key)
+                    samples[key] = value if previous == None else [a + b for a, b in zip(previous, value)]
+                else:
+                    samples[key] = samples.get(key, 0) + value
+    for metric in merged.values():
+        metric['samples'] = [[list(key), value] for key, value in metric['samples'].items()]
+    return merged
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, escape(value)) for name, value in pairs)
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+def render(metrics):
+    """
+    Metrics as collected, in the Prometheus text format.
+    """
+    lines = []
+    for name in sorted(metrics):
+        metric = metrics[name]
+        lines.append('# HELP %s %s' % (name, metric['help'].replace('\\', '\\\\').replace('\n', '\\n')))
+        lines.append('# TYPE %s %s' % (name, metric['type']))
+        for labels, value in sorted(metric['samples']):
+            if metric['type'] == 'histogram':
+                count = 0
+                for bound, in_bucket in zip(metric['buckets'], value):
+                    count += in_bucket
+                    le = '+Inf' if bound == 'inf' else format_value(float(bound))
+                    lines.append('%s_bucket%s %s' % (name, format_labels(metric['labelnames'], labels, [('le', le)]), format_value(count)))
+                lines.append('%s_sum%s %s' % (name, format_labels(metric['labelnames'], labels), format_value(value[-1])))
+                lines.append('%s_count%s %s' % (name, format_labels(metric['labelnames'], labels), format_value(count)))
+            else:
+                lines.append('%s%s %s' % (name, format_labels(metric['labelnames'], labels), format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+registry = Registry()
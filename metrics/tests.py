@@ -0,0 +1,154 @@
+import json
+import os
+import tempfile
+import threading
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from classifications.models import Classification
+from crafts.models import Craft, CraftPotentialBuyer
+from .models import listings_created, potential_buyers_added, potential_buyers_removed, settlements
+from .registry import Counter, Registry, render
+
+def create_user(username, email, password):
+    """
+    Create a user with given username, email and password.
+    """
+    return User.objects.create(username=username, email=email, password=password)
+
+def value(metric, **labels):
+    """
+    The current value of metric for labels, 0 before it is first counted.
+    """
+    return metric.samples.get(metric.key(labels), 0)
+
+class RegistryTests(TestCase):
+
+    def test_text_format(self):
+        """
+        Metrics should be rendered in the Prometheus text format.
+        """
+        registry = Registry()
+        registry.counter('jobs_total', 'Jobs run.', ['queue']).inc(2, queue='a"b')
+        registry.gauge('workers', 'Workers running.').set(3)
+        registry.histogram('job_seconds', 'Job time.', buckets=[0.1, 1]).observe(0.5)
+        self.assertEqual(render(registry.collect()), '\n'.join([
+            '# HELP job_seconds Job time.',
+            '# TYPE job_seconds histogram',
+            'job_seconds_bucket{le="0.1"} 0.0',
+            'job_seconds_bucket{le="1.0"} 1.0',
+            'job_seconds_bucket{le="+Inf"} 1.0',
+            'job_seconds_sum 0.5',
+            'job_seconds_count 1.0',
+            '# HELP jobs_total Jobs run.',
+            '# TYPE jobs_total counter',
+            'jobs_total{queue="a\\"b"} 2.0',
+            '# HELP workers Workers running.',
+            '# TYPE workers gauge',
+            'workers 3.0',
+        ]) + '\n')
+
+    def test_counting_from_threads(self):
+        """
+        Increments from several threads should all be counted.
+        """
+        counter = Counter('hits_total', 'Hits.')
+        threads = [threading.Thread(target=lambda: [counter.inc() for _ in range(10000)]) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(value(counter), 80000)
+
+    def test_processes_are_added_up(self):
+        """
+        Counters should be added up over every process that wrote a snapshot and
+        gauges only over the processes still running.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            exited = {'pid': 2 ** 22 + 1, 'metrics': {
+                'jobs_total': {'type': 'counter', 'help': 'Jobs run.', 'labelnames': [], 'buckets': [], 'samples': [[[], 5]]},
+                'workers': {'type': 'gauge', 'help': 'Workers running.', 'labelnames': [], 'buckets': [], 'samples': [[[], 7]]},
+            }}
+            with open(os.path.join(directory, 'exited.json'), 'w') as stream:
+                json.dump(exited, stream)
+            registry = Registry()
+            registry.counter('jobs_total', 'Jobs run.').inc(2)
+            registry.gauge('workers', 'Workers running.').set(1)
+            with override_settings(METRICS_DIRECTORY=directory):
+                collected = registry.collect()
+            self.assertEqual(collected['jobs_total']['samples'], [[[], 7]])
+            self.assertEqual(collected['workers']['samples'], [[[], 1]])
+            self.assertEqual(sorted(os.listdir(directory)), sorted(['.lock', 'archive.json', registry.snapshot_name()]))
+            self.assertTrue(registry.snapshot_name().startswith('%d-' % os.getpid()))
+            # The exited process is counted once its snapshot is folded into the archive.
+            with override_settings(METRICS_DIRECTORY=directory):
+                self.assertEqual(registry.collect()['jobs_total']['samples'], [[[], 7]])
+
+    def test_reused_pid_does_not_overwrite_counts(self):
+        """
+        A registry in a process with the pid of an earlier one should write a snapshot of its own.
+        """
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIRECTORY=directory):
+            earlier, later = Registry(), Registry()
+            earlier.counter('jobs_total', 'Jobs run.').inc(5)
+            earlier.write()
+            later.counter('jobs_total', 'Jobs run.').inc(1)
+            self.assertEqual(later.collect()['jobs_total']['samples'], [[[], 6]])
+
+class MetricsInstrumentationTests(TestCase):
+
+    def setUp(self):
+        self.seller = create_user('seller', 'seller@example.com', 'password')
+        self.buyer = create_user('buyer', 'buyer@example.com', 'password')
+        self.classification = Classification.objects.create(name='test', has_crafts=True)
+        return super().setUp()
+
+    def test_requests_are_timed_by_view(self):
+        """
+        The metrics page should show the requests of each view.
+        """
+        self.seller.is_staff = True
+        self.seller.save()
+        self.client.force_login(self.seller)
+        self.client.get(reverse('crafts:buy-order-list'))
+        response = self.client.get(reverse('metrics:metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertContains(response, 'http_requests_total{view="crafts:buy-order-list",method="GET",status="200"}')
+        self.assertContains(response, 'http_request_duration_seconds_count{view="crafts:buy-order-list",method="GET"}')
+
+    @override_settings(METRICS_ALLOWED_IPS=['203.0.113.7'], METRICS_TOKEN='secret', TRUSTED_PROXIES=['10.0.0.0/8'])
+    def test_access(self):
+        """
+        Only staff, the token and allowed clients behind the load balancer should see the metrics.
+        """
+        url = reverse('metrics:metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.1').status_code, 403)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.7').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        self.client.force_login(self.seller)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_marketplace_counters(self):
+        """
+        Listings, interest and settlements should be counted, but interest removed
+        by the settlement should not count as churn.
+        """
+        created = value(listings_created, kind='craft')
+        added = value(potential_buyers_added, kind='craft')
+        removed = value(potential_buyers_removed, kind='craft')
+        settled = value(settlements, kind='craft', outcome='mixed')
+        craft = Craft.objects.create(classification=self.classification, seller=self.seller, amount=1, price=1, currency='gold')
+        CraftPotentialBuyer.objects.create(craft=craft, buyer=self.buyer)
+        CraftPotentialBuyer.objects.create(craft=craft, buyer=create_user('other', 'other@example.com', 'password')).delete()
+        craft.buyer = self.buyer
+        craft.seller_trade_outcome = True
+        craft.buyer_trade_outcome = False
+        craft.save()
+        craft.settle()
+        self.assertEqual(value(listings_created, kind='craft'), created + 1)
+        self.assertEqual(value(potential_buyers_added, kind='craft'), added + 2)
+        self.assertEqual(value(potential_buyers_removed, kind='craft'), removed + 1)
+        self.assertEqual(value(settlements, kind='craft', outcome='mixed'), settled + 1)
@@ -0,0 +1,27 @@
+import hmac
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views import View
+from mysite.proxies import client_ip
+from .registry import registry, render
+
+class MetricsView(View):
+    """
+    All metrics in the Prometheus text format, for staff users, scrapers sending
+    METRICS_TOKEN as a bearer token and clients in METRICS_ALLOWED_IPS. Anyone
+    else is refused.
+    """
+
+    def allowed(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        if token and authorization.startswith('Bearer ') and hmac.compare_digest(authorization[len('Bearer '):].encode(), token.encode()):
+            return True
+        if client_ip(request) in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+            return True
+        return request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        if not self.allowed(request):
+            return HttpResponseForbidden()
+        return HttpResponse(render(registry.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
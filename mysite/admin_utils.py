@@ -0,0 +1,98 @@
+"""
+Shared pieces for admin changelists of large tables.
+"""
+from django.contrib import admin, messages
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+def estimated_row_count(model, using='default'):
+    """
+    An estimate of how many rows the table of model has, read from the database
+    statistics instead of counted, or None where the database has none.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+        elif connection.vendor == 'sqlite':
+            row = None
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone() != None:
+                # Left by ANALYZE; the first number is the row count of the table.
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s AND idx IS NULL', [table])
+                row = cursor.fetchone()
+                row = None if row == None else (int(row[0].split()[0]),)
+            if row == None:
+                # The last rowid, read from the end of the table. Rows deleted
+                # since make it an overestimate.
+                cursor.execute('SELECT MAX(rowid) FROM %s' % connection.ops.quote_name(table))
+                row = cursor.fetchone()
+        else:
+            return None
+    if row == None or row[0] == None or row[0] < 0:
+        return None
+    return int(row[0])
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts at most exact_count_limit rows. A list with more rows than that is
+    counted from the table size estimate when it is unfiltered, and otherwise
+    stops at the limit, so no page view runs a COUNT(*) over a whole large table.
+    """
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        counted = queryset.order_by()[:self.exact_count_limit + 1].count()
+        if counted <= self.exact_count_limit or queryset.query.where:
+            return counted
+        estimate = estimated_row_count(queryset.model, queryset.db)
+        return counted if estimate == None else max(estimate, counted)
+
+class LargeTableAdmin:
+    """
+    ModelAdmin mixin for large tables: estimated counts, no second count of the
+    whole table, and search fields that all end in __username searched by
+    username prefix. The prefix is looked up as a range, which uses the
+    username index where the case-insensitive LIKE of the admin search does not.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        fields = self.get_search_fields(request)
+        if not fields or not all(field.endswith('__username') for field in fields):
+            return super().get_search_results(request, queryset, search_term)
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        users = User.objects.filter(username__gte=search_term, username__lt=search_term + chr(0x10ffff)).values('pk')
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{field[:-len('__username')] + '__in': users})
+        return queryset.filter(condition), False
+
+@admin.action(description='Expire selected listings that have no buyer')
+def expire_listings(modeladmin, request, queryset, batch_size=100):
+    pks = list(queryset.filter(buyer=None).values_list('pk', flat=True))
+    for start in range(0, len(pks), batch_size):
+        with transaction.atomic():
+            queryset.model.objects.filter(pk__in=pks[start:start + batch_size], buyer=None).delete()
+    modeladmin.message_user(request, 'Expired %d listings; listings with a buyer were left as they are.' % len(pks), messages.SUCCESS)
+
+@admin.action(description='Settle selected trades, counting outcomes not given yet as positive')
+def force_settle_listings(modeladmin, request, queryset):
+    listings = list(queryset.exclude(buyer=None))
+    for listing in listings:
+        if listing.seller_trade_outcome == None:
+            listing.seller_trade_outcome = True
+        if listing.buyer_trade_outcome == None:
+            listing.buyer_trade_outcome = True
+        listing.settle()
+    modeladmin.message_user(request, 'Settled %d trades; listings without a buyer were left as they are.' % len(listings), messages.SUCCESS)
@@ -14,3 +14,15 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
 
 application = get_asgi_application()
+
+from trending.counters import view_counter
+view_counter.start()
+
+from metrics.registry import registry
+registry.start()
+
+from autocomplete.index import rebuilder
+rebuilder.start()
+
+from listing_cache.checks import warn_unshared_cache
+warn_unshared_cache()
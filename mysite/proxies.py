@@ -0,0 +1,29 @@
+"""
+The address of the client behind the load balancer. REMOTE_ADDR is the address
+of the last proxy, so the client is read from X-Forwarded-For, right to left,
+skipping the TRUSTED_PROXIES. Addresses further left were set by the client and
+can not be trusted.
+"""
+import functools
+import ipaddress
+from django.conf import settings
+
+@functools.lru_cache(maxsize=8)
+def parse_networks(proxies):
+    return tuple(ipaddress.ip_network(proxy, strict=False) for proxy in proxies)
+
+def is_trusted_proxy(address):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in parse_networks(tuple(getattr(settings, 'TRUSTED_PROXIES', ()))))
+
+def client_ip(request):
+    address = request.META.get('REMOTE_ADDR')
+    if not is_trusted_proxy(address):
+        return address
+    forwarded = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+    while forwarded and is_trusted_proxy(address):
+        address = forwarded.pop()
+    return address
@@ -40,6 +40,16 @@ INSTALLED_APPS = [
     'crafts.apps.CraftsConfig',
     'classifications.apps.ClassificationsConfig',
     'accounts.apps.AccountsConfig',
+    'saved_searches.apps.SavedSearchesConfig',
+    'trending.apps.TrendingConfig',
+    'inbox.apps.InboxConfig',
+    'ratelimit.apps.RatelimitConfig',
+    'listing_cache.apps.ListingCacheConfig',
+    'profiling.apps.ProfilingConfig',
+    'autocomplete.apps.AutocompleteConfig',
+    'market.apps.MarketConfig',
+    'currencies.apps.CurrenciesConfig',
+    'metrics.apps.MetricsConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -49,11 +59,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'metrics.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'ratelimit.middleware.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -71,6 +83,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'inbox.context_processors.inbox',
             ],
         },
     },
@@ -90,6 +103,52 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Rendered page fragments, rate limit buckets and inbox counts are kept here. Set
+# REDIS_URL to share them between worker processes; the local memory fallback is
+# only coherent within a single process, and the checks fail when WEB_CONCURRENCY,
+# the number of worker processes, is more than one without a shared cache.
+
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Versions of listing pages, which cached fragments and ETags are built from, expire after
+# LISTING_VERSION_TIMEOUT seconds, so keys of pages nobody views again do not pile up.
+
+LISTING_VERSION_TIMEOUT = 24 * 60 * 60
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+
+# Sessions and the user of each request are read from the cache, so a warm
+# authenticated request makes no queries before the view runs. Cached users are
+# dropped when they or their profile are saved, and expire after AUTH_USER_CACHE_TIMEOUT seconds.
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+AUTHENTICATION_BACKENDS = ['accounts.backends.CachedModelBackend']
+
+AUTH_USER_CACHE_TIMEOUT = 5 * 60
+
+# The number of inbox items needing action shown in the header is cached until one of
+# them changes, and at most INBOX_COUNT_CACHE_TIMEOUT seconds.
+
+INBOX_COUNT_CACHE_TIMEOUT = 5 * 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -135,3 +194,76 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+
+# Listing view counters are written to the database in batches every
+# TRENDING_FLUSH_INTERVAL seconds. Trending scores halve every TRENDING_HALF_LIFE seconds.
+
+TRENDING_FLUSH_INTERVAL = 10
+
+TRENDING_HALF_LIFE = 24 * 60 * 60
+
+
+# Search box completions are answered from in-process indexes, which are built when
+# the process starts, kept current by signals and rebuilt from the database in the
+# background every AUTOCOMPLETE_REBUILD_INTERVAL seconds to pick up changes made by
+# other processes.
+
+AUTOCOMPLETE_REBUILD_INTERVAL = 5 * 60
+
+
+# Request and marketplace metrics are served at /metrics/ in the Prometheus text format,
+# only to staff users, to scrapers sending METRICS_TOKEN as a bearer token and to the
+# client addresses in METRICS_ALLOWED_IPS. With several worker processes, set
+# METRICS_DIRECTORY to a directory they share: each writes its metrics there every
+# METRICS_FLUSH_INTERVAL seconds and a scrape of any of them adds up all of them.
+
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '').split()
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+METRICS_DIRECTORY = os.environ.get('METRICS_DIRECTORY')
+
+METRICS_FLUSH_INTERVAL = 5
+
+# Statements slower than SLOW_QUERY_THRESHOLD seconds are logged with their call site and
+# plan, and the SLOW_QUERY_REPORT_SIZE slowest statement shapes of the last SLOW_QUERY_WINDOW
+# seconds are kept in the default cache for the slow_queries command and /profiling/slow-queries/.
+# Set SLOW_QUERY_THRESHOLD to None to time nothing.
+
+SLOW_QUERY_THRESHOLD = 0.1
+
+SLOW_QUERY_REPORT_SIZE = 50
+
+SLOW_QUERY_WINDOW = 24 * 60 * 60
+
+# Auction bids must beat the highest bid by AUCTION_MIN_INCREMENT. A bid placed in the
+# last AUCTION_SOFT_CLOSE seconds extends the auction to AUCTION_SOFT_CLOSE seconds from then.
+
+AUCTION_MIN_INCREMENT = 1
+
+AUCTION_SOFT_CLOSE = 5 * 60
+
+
+# Token bucket rate limits per URL name. 'user' and 'ip' are (capacity, period): at most
+# capacity requests in a burst, refilled over period seconds. 'methods' restricts the limit
+# to some HTTP methods. Buckets live in the RATE_LIMIT_CACHE cache, which must be shared by
+# all worker processes for the limits to hold across them.
+
+RATE_LIMIT_CACHE = 'default'
+
+# Addresses or networks of the load balancers in front of the site, separated by spaces.
+# Requests from them are attributed to the client address in X-Forwarded-For, for rate
+# limits by IP and the metrics allowlist.
+
+TRUSTED_PROXIES = os.environ.get('TRUSTED_PROXIES', '').split()
+
+POTENTIAL_BUYER_RATE_LIMIT = {'user': (20, 60), 'ip': (60, 60), 'methods': ['POST']}
+
+RATE_LIMITS = {
+    'crafts:craft-add-potential-buyer': POTENTIAL_BUYER_RATE_LIMIT,
+    'crafts:craft-remove-potential-buyer': POTENTIAL_BUYER_RATE_LIMIT,
+    'carry_services:carry-service-add-potential-buyer': POTENTIAL_BUYER_RATE_LIMIT,
+    'carry_services:carry-service-remove-potential-buyer': POTENTIAL_BUYER_RATE_LIMIT,
+    'accounts:registration': {'ip': (5, 60 * 60), 'methods': ['POST']},
+    'carry_services:carry-service-list': {'user': (60, 60), 'ip': (120, 60)},
+}
@@ -24,6 +24,12 @@ urlpatterns = [
     path('carry_services/', include('carry_services.urls')),
     path('classifications/', include('classifications.urls')),
     path('accounts/', include('accounts.urls')),
+    path('saved_searches/', include('saved_searches.urls')),
+    path('my_trades/', include('inbox.urls')),
+    path('autocomplete/', include('autocomplete.urls')),
+    path('market/', include('market.urls')),
+    path('metrics/', include('metrics.urls')),
+    path('profiling/', include('profiling.urls')),
     path('', HomePageView.as_view(), name='home'),
     path('admin/', admin.site.urls)
 ]
@@ -0,0 +1,153 @@
+import cProfile
+import json
+import os
+import pstats
+import re
+import statistics
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from profiling.render import timed_templates
+from profiling.sql import normalize_sql
+
+ADDRESS = re.compile(r' at 0x[0-9a-f]+')
+
+def function_name(function):
+    """
+    A pstats function key as path:line(name), with paths made relative so reports
+    from different checkouts diff cleanly.
+    """
+    filename, line, name = function
+    name = ADDRESS.sub('', name)
+    if filename.startswith(str(settings.BASE_DIR)):
+        filename = os.path.relpath(filename, settings.BASE_DIR)
+    elif 'site-packages' + os.sep in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    return '%s:%d(%s)' % (filename, line, name)
+
+class Command(BaseCommand):
+    help = 'Replay GET requests to a URL in-process and report the hot functions, SQL and template render times.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to request, with any query string.')
+        parser.add_argument('--as', dest='username', help='Log in as this user.')
+        parser.add_argument('-n', '--requests', type=int, default=50, help='Number of profiled requests.')
+        parser.add_argument('--sort', choices=['tottime', 'cumtime'], default='tottime')
+        parser.add_argument('--limit', type=int, default=25, help='Number of hot functions to show.')
+        parser.add_argument('--output', help='Also write the report as JSON to this file. Entries are sorted by name so reports diff across commits.')
+
+    def handle(self, *args, **options):
+        client = Client()
+        if options['username']:
+            try:
+                client.force_login(User.objects.get(username=options['username']))
+            except User.DoesNotExist:
+                raise CommandError('User "%s" does not exist.' % options['username'])
+        # The replayed requests should neither be throttled nor refused for the test client's host.
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], RATE_LIMITS={}):
+            response = client.get(options['path'])
+            if response.status_code >= 400:
+                raise CommandError('%s answered %d.' % (options['path'], response.status_code))
+            report = {'path': options['path'], 'user': options['username'], 'status': response.status_code, 'requests': options['requests']}
+            report.update(self.profile(client, options))
+            report.update(self.queries(client, options['path']))
+            report.update(self.templates(client, options['path']))
+        self.write_report(report, options)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+                output.write('\n')
+
+    def profile(self, client, options):
+        profiler = cProfile.Profile()
+        durations = []
+        for _ in range(options['requests']):
+            started = time.perf_counter()
+            profiler.runcall(client.get, options['path'])
+            durations.append(time.perf_counter() - started)
+        stats = pstats.Stats(profiler).stats
+        column = 2 if options['sort'] == 'tottime' else 3
+        hot = sorted(stats.items(), key=lambda item: item[1][column], reverse=True)[:options['limit']]
+        durations.sort()
+        return {
+            'latency_ms': {
+                'mean': round(statistics.mean(durations) * 1000, 2),
+                'p50': round(durations[len(durations) // 2] * 1000, 2),
+                'p95': round(durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000, 2),
+            },
+            'functions': {
+                function_name(function): {
+                    'calls': calls // options['requests'],
+                    'tottime_ms': round(tottime / options['requests'] * 1000, 3),
+                    'cumtime_ms': round(cumtime / options['requests'] * 1000, 3),
+                }
+                for function, (_, calls, tottime, cumtime, _) in hot
+            },
+        }
+
+    def queries(self, client, path):
+        captured = []
+
+        def timed_execute(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                elapsed = time.perf_counter() - started
+                text = sql if many else connection.ops.last_executed_query(context['cursor'], sql, params)
+                captured.append({'sql': text, 'time_ms': round(elapsed * 1000, 3)})
+
+        with connection.execute_wrapper(timed_execute):
+            client.get(path)
+        shapes = defaultdict(lambda: {'count': 0, 'time_ms': 0.0})
+        exact = defaultdict(int)
+        for query in captured:
+            shape = shapes[normalize_sql(query['sql'])]
+            shape['count'] += 1
+            shape['time_ms'] = round(shape['time_ms'] + query['time_ms'], 3)
+            exact[query['sql']] += 1
+        return {
+            'queries': captured,
+            'query_shapes': dict(shapes),
+            'duplicate_queries': {sql: count for sql, count in exact.items() if count > 1},
+        }
+
+    def templates(self, client, path):
+        with timed_templates() as timings:
+            client.get(path)
+        return {
+            'templates': {
+                name: {'renders': timings.counts[name], 'total_ms': round(timings.total[name] * 1000, 3), 'self_ms': round(timings.own[name] * 1000, 3)}
+                for name in timings.counts
+            },
+        }
+
+    def write_report(self, report, options):
+        latency = report['latency_ms']
+        self.stdout.write('%s as %s: %d requests, mean %.2fms, p50 %.2fms, p95 %.2fms' % (
+            report['path'], report['user'] or 'anonymous', report['requests'], latency['mean'], latency['p50'], latency['p95']
+        ))
+        self.stdout.write('\nHot functions per request, by %s:' % options['sort'])
+        self.stdout.write('%8s %12s %12s  %s' % ('calls', 'tottime ms', 'cumtime ms', 'function'))
+        for name, function in report['functions'].items():
+            self.stdout.write('%8d %12.3f %12.3f  %s' % (function['calls'], function['tottime_ms'], function['cumtime_ms'], name))
+        self.stdout.write('\nSQL (%d statements, %.3fms):' % (len(report['queries']), sum(query['time_ms'] for query in report['queries'])))
+        for query in report['queries']:
+            self.stdout.write('%10.3fms  %s' % (query['time_ms'], query['sql']))
+        repeated = {sql: shape for sql, shape in report['query_shapes'].items() if shape['count'] > 1}
+        if repeated:
+            self.stdout.write('\nRepeated query shapes (possible N+1):')
+            for sql, shape in sorted(repeated.items(), key=lambda item: -item[1]['count']):
+                self.stdout.write('%6dx %10.3fms  %s' % (shape['count'], shape['time_ms'], sql))
+        if report['duplicate_queries']:
+            self.stdout.write('\nExact duplicate queries:')
+            for sql, count in report['duplicate_queries'].items():
+                self.stdout.write('%6dx  %s' % (count, sql))
+        self.stdout.write('\nTemplates:')
+        self.stdout.write('%8s %12s %12s  %s' % ('renders', 'total ms', 'self ms', 'template'))
+        for name, template in sorted(report['templates'].items(), key=lambda item: -item[1]['total_ms']):
+            self.stdout.write('%8d %12.3f %12.3f  %s' % (template['renders'], template['total_ms'], template['self_ms'], name))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from profiling.slow_queries import reset_slow_queries, slow_queries
+
+class Command(BaseCommand):
+    help = 'Show the statement shapes slower than SLOW_QUERY_THRESHOLD, most total time first, with their call sites and plans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help='Number of statement shapes to show.')
+        parser.add_argument('--reset', action='store_true', help='Forget the recorded statements after showing them.')
+
+    def handle(self, *args, **options):
+        entries = slow_queries(options['limit'])
+        if not entries:
+            self.stdout.write('No slow queries recorded.')
+        for entry in entries:
+            self.stdout.write('%10.1fms total %6d calls %10.1fms max  %s (%s)' % (
+                entry['total'] * 1000, entry['count'], entry['max'] * 1000, entry['site'] or 'unknown', entry['view'] or 'no view'
+            ))
+            self.stdout.write('    ' + entry['shape'])
+            for line in (entry['plan'] or '').splitlines():
+                self.stdout.write('        ' + line)
+        if options['reset']:
+            reset_slow_queries()
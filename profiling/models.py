@@ -0,0 +1,9 @@
+from django.dispatch import receiver
+from django.db.backends.signals import connection_created
+from .slow_queries import log_slow_queries
+
+@receiver(connection_created)
+def install_slow_query_log(sender, connection, **kwargs):
+    # A connection object is reopened many times over, but needs the wrapper once.
+    if log_slow_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(log_slow_queries)
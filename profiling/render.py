@@ -0,0 +1,45 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from django.template.base import Template
+
+class TemplateTimings:
+    """
+    Render count, total and self time per template name. Self time leaves out
+    the templates included or extended from it.
+    """
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.total = defaultdict(float)
+        self.own = defaultdict(float)
+        self.stack = []
+
+@contextmanager
+def timed_templates():
+    """
+    Time every template rendered inside the block.
+    """
+    timings = TemplateTimings()
+    render = Template._render
+
+    def timed_render(template, context):
+        name = template.origin.template_name or '<string>'
+        timings.stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return render(template, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = timings.stack.pop()
+            if timings.stack:
+                timings.stack[-1] += elapsed
+            timings.counts[name] += 1
+            timings.total[name] += elapsed
+            timings.own[name] += elapsed - children
+
+    Template._render = timed_render
+    try:
+        yield timings
+    finally:
+        Template._render = render
@@ -0,0 +1,134 @@
+"""
+Slow query log. Every database connection gets an execute wrapper that times
+each statement. Statements slower than SLOW_QUERY_THRESHOLD seconds are logged
+with their call site: the innermost line of project code that ran them, and the
+view class they ran under. The first time a statement shape is seen, its plan is
+captured with EXPLAIN, which is EXPLAIN QUERY PLAN on SQLite.
+
+Statements are grouped by their normalized shape. Each shape is kept in the
+default cache, so a report covers every worker process when the cache is shared.
+A shape not seen for SLOW_QUERY_WINDOW seconds expires, and only the
+SLOW_QUERY_REPORT_SIZE shapes with the most total time are kept. Counts from
+processes recording the same shape at the same moment may be lost, since the
+cache entries are read and written without a lock.
+"""
+import hashlib
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpRequest
+from django.utils import timezone
+from django.views import View
+from .sql import normalize_sql
+
+logger = logging.getLogger(__name__)
+
+INDEX_KEY = 'slow-queries'
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+local = threading.local()
+
+def entry_key(shape):
+    return 'slow-query:' + hashlib.md5(shape.encode()).hexdigest()
+
+def call_site(frame):
+    """
+    The innermost line of project code on the stack, and the view class of the
+    request it runs for. A statement run by generic view code, such as the list
+    of a ListView, is placed at the definition of the view class.
+    """
+    site = view = None
+    base = str(settings.BASE_DIR) + os.sep
+    project_code = lambda filename: filename.startswith(base) and 'site-packages' + os.sep not in filename
+    while frame != None and view == None:
+        code = frame.f_code
+        if site == None and project_code(code.co_filename) and code.co_filename != __file__:
+            site = '%s:%d in %s' % (os.path.relpath(code.co_filename, base), frame.f_lineno, getattr(code, 'co_qualname', code.co_name))
+        if isinstance(frame.f_locals.get('self'), View):
+            view = type(frame.f_locals['self'])
+        elif isinstance(frame.f_locals.get('request'), HttpRequest) and frame.f_locals['request'].resolver_match != None:
+            # Rendering a template response happens after the view has returned.
+            func = frame.f_locals['request'].resolver_match.func
+            view = getattr(func, 'view_class', func)
+        frame = frame.f_back
+    if site == None and view != None:
+        try:
+            filename = inspect.getsourcefile(view)
+            if project_code(filename):
+                site = '%s:%d in %s' % (os.path.relpath(filename, base), inspect.getsourcelines(view)[1], view.__qualname__)
+        except (OSError, TypeError):
+            pass
+    return site, None if view == None else view.__name__
+
+def explain(connection, sql, params):
+    """
+    The plan of a statement, read on a cursor of its own so the results of the
+    statement are left alone and the EXPLAIN is neither timed nor logged itself.
+    """
+    if not sql.lstrip().upper().startswith(EXPLAINABLE) or not connection.features.supports_explaining_query_execution:
+        return None
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute('%s %s' % (connection.ops.explain_query_prefix(), sql), params)
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+    except Exception:
+        logger.exception('Could not explain a slow query.')
+        return None
+    finally:
+        cursor.close()
+
+def record(connection, sql, params, many, duration, frame):
+    shape = normalize_sql(sql)
+    key = entry_key(shape)
+    site, view = call_site(frame)
+    window = getattr(settings, 'SLOW_QUERY_WINDOW', 24 * 60 * 60)
+    entry = cache.get(key)
+    if entry == None:
+        # Statements run with executemany have no single set of parameters to explain.
+        entry = {'shape': shape, 'count': 0, 'total': 0.0, 'max': 0.0, 'plan': None if many else explain(connection, sql, params)}
+    entry['count'] += 1
+    entry['total'] += duration
+    entry['last_seen'] = timezone.now()
+    if duration >= entry['max']:
+        entry.update(max=duration, example=sql, site=site, view=view)
+    cache.set(key, entry, window)
+    index = cache.get(INDEX_KEY) or []
+    if key not in index:
+        index.append(key)
+        size = getattr(settings, 'SLOW_QUERY_REPORT_SIZE', 50)
+        if len(index) > size:
+            entries = cache.get_many(index)
+            index = sorted(entries, key=lambda other: entries[other]['total'], reverse=True)[:size]
+        cache.set(INDEX_KEY, index, window)
+    logger.warning('Slow query (%.1fms) at %s in %s: %s', duration * 1000, site, view, sql)
+
+def log_slow_queries(execute, sql, params, many, context):
+    threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD', None)
+    if threshold == None or getattr(local, 'recording', False):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration = time.perf_counter() - started
+    if duration >= threshold:
+        # Guards against the cache being a database cache.
+        local.recording = True
+        try:
+            record(context['connection'], sql, params, many, duration, sys._getframe(1))
+        finally:
+            local.recording = False
+    return result
+
+def slow_queries(limit=None):
+    """
+    The recorded statement shapes, most total time first.
+    """
+    entries = cache.get_many(cache.get(INDEX_KEY) or [])
+    return sorted(entries.values(), key=lambda entry: entry['total'], reverse=True)[:limit]
+
+def reset_slow_queries():
+    cache.delete_many((cache.get(INDEX_KEY) or []) + [INDEX_KEY])
@@ -0,0 +1,14 @@
+import re
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST = re.compile(r'\bIN \((?:\?, )*\?\)')
+
+def normalize_sql(sql):
+    """
+    The shape of a statement with its literals replaced by ?, so the same query
+    run with different parameters, as in an N+1 loop, normalizes to the same text.
+    """
+    sql = STRING.sub('?', sql)
+    sql = NUMBER.sub('?', sql)
+    return IN_LIST.sub('IN (...)', sql)
@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import tempfile
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from .render import timed_templates
+from .slow_queries import reset_slow_queries, slow_queries
+from .sql import normalize_sql
+from carry_services.models import CarryService
+from django.contrib.auth.models import User
+
+def create_user(username, email, password):
+    """
+    Create a user with given username, email and password.
+    """
+    return User.objects.create(username=username, email=email, password=password)
+
+class NormalizeSqlTests(TestCase):
+
+    def test_literals_are_replaced(self):
+        """
+        Statements differing only in their literals should normalize to the same text.
+        """
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE a = 'x' AND b = 12 AND c IN (1, 2, 3)"),
+            normalize_sql("SELECT * FROM t WHERE a = 'it''s' AND b = 3.5 AND c IN (4)"),
+        )
+
+class TimedTemplatesTests(TestCase):
+
+    def test_templates_are_counted(self):
+        """
+        Rendered templates should be counted and timed.
+        """
+        with timed_templates() as timings:
+            Template('{% for i in items %}{{ i }}{% endfor %}').render(Context({'items': [1, 2]}))
+        self.assertEqual(sum(timings.counts.values()), 1)
+        self.assertGreaterEqual(sum(timings.total.values()), 0)
+
+class ProfileUrlTests(TestCase):
+
+    def test_report(self):
+        """
+        The command should report functions, SQL and templates, and save them as JSON.
+        """
+        user = create_user('test_user', 'test_user@example.com', 'password')
+        carry_service = CarryService.objects.create(seller=user, price=1, currency="test")
+        stdout = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'report.json')
+            call_command('profile_url', '/carry_services/%s/' % carry_service.pk, username='test_user', requests=3, output=output, stdout=stdout)
+            with open(output) as report_file:
+                report = json.load(report_file)
+        self.assertEqual(report['status'], 200)
+        self.assertTrue(report['functions'])
+        self.assertTrue(report['queries'])
+        self.assertIn('carry_services/carryservice_detail.html', report['templates'])
+        self.assertIn('Hot functions per request', stdout.getvalue())
+
+    def test_unknown_user(self):
+        """
+        An unknown user should be an error.
+        """
+        with self.assertRaises(CommandError):
+            call_command('profile_url', '/', username='nobody', stdout=StringIO())
+
+@override_settings(SLOW_QUERY_THRESHOLD=0)
+class SlowQueryLogTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Every statement is slow here, so the log is silenced.
+        logger = logging.getLogger('profiling.slow_queries')
+        cls.addClassCleanup(setattr, logger, 'disabled', logger.disabled)
+        logger.disabled = True
+        return super().setUpClass()
+
+    def setUp(self):
+        reset_slow_queries()
+        self.user = create_user('test_user', 'test_user@example.com', 'password')
+        return super().setUp()
+
+    def tearDown(self):
+        reset_slow_queries()
+        return super().tearDown()
+
+    def shape(self, table):
+        return [entry for entry in slow_queries() if entry['shape'].startswith('SELECT') and 'FROM "%s"' % table in entry['shape']]
+
+    def test_statements_are_grouped_with_site_and_plan(self):
+        """
+        The same statement run with different parameters should be recorded once
+        with its call site, view and query plan.
+        """
+        CarryService.objects.create(seller=self.user, price=1, currency="test")
+        self.client.force_login(self.user)
+        self.client.get(reverse('carry_services:carry-service-list'), {'searchby': 'seller', 'search': 'test'})
+        self.client.get(reverse('carry_services:carry-service-list'), {'searchby': 'seller', 'search': 'other'})
+        [entry] = [entry for entry in self.shape('carry_services_carryservice') if 'LIKE' in entry['shape'] and 'COUNT' not in entry['shape']]
+        self.assertEqual(entry['count'], 2)
+        self.assertEqual(entry['view'], 'CarryServiceListView')
+        # The list is read when the template renders its rows.
+        self.assertTrue(entry['site'].startswith('listing_cache/rows.py:'))
+        self.assertIn('SCAN', entry['plan'])
+
+    def test_statements_outside_views(self):
+        """
+        Statements run outside a view should be placed at the project line that ran them.
+        """
+        list(User.objects.filter(username='test_user'))
+        [entry] = self.shape('auth_user')
+        self.assertEqual(entry['view'], None)
+        self.assertIn('profiling/tests.py:', entry['site'])
+        self.assertIn('USING INDEX', entry['plan'])
+
+    @override_settings(SLOW_QUERY_REPORT_SIZE=3)
+    def test_report_keeps_the_slowest(self):
+        """
+        Only the statement shapes with the most total time should be kept.
+        """
+        for i in range(10):
+            list(User.objects.filter(pk__in=[1] * (i + 1)).values_list('pk')[:i + 1])
+        self.assertLessEqual(len(slow_queries()), 3)
+
+    def test_report_page_and_command(self):
+        """
+        The report should be shown to staff only, and by the slow_queries command.
+        """
+        list(User.objects.filter(username='test_user'))
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('profiling:slow-queries')).status_code, 403)
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.client.force_login(User.objects.get(pk=self.user.pk))
+        self.assertContains(self.client.get(reverse('profiling:slow-queries')), 'auth_user')
+        stdout = StringIO()
+        call_command('slow_queries', reset=True, stdout=stdout)
+        self.assertIn('FROM "auth_user"', stdout.getvalue())
+        self.assertEqual(slow_queries(), [])
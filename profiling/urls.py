@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import SlowQueryReportView
+
+app_name = 'profiling'
+urlpatterns = [
+    path('slow-queries/', SlowQueryReportView.as_view(), name='slow-queries'),
+]
@@ -0,0 +1,15 @@
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.views.generic import TemplateView
+from .slow_queries import slow_queries
+
+class SlowQueryReportView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
+    template_name = 'profiling/slow_queries.html'
+    limit = 50
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['slow_queries'] = slow_queries(self.limit)
+        return context
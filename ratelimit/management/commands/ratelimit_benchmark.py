@@ -0,0 +1,54 @@
+import time
+from importlib import import_module
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import resolve
+from ratelimit.middleware import RateLimitMiddleware
+
+class Command(BaseCommand):
+    help = 'Time the overhead the rate limiting middleware adds to a request, against the configured cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100000)
+        parser.add_argument('--clients', type=int, default=1000, help='Number of distinct IP addresses the requests come from.')
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        url = '/carry_services/'
+        limits = {resolve(url).view_name: {'user': (10 ** 9, 1), 'ip': (10 ** 9, 1)}}
+        factory = RequestFactory()
+        requests = []
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        # Only stored sessions get a user bucket of their own.
+        session_keys = []
+        for _ in range(options['clients']):
+            session = session_store()
+            session.create()
+            session_keys.append(session.session_key)
+        for i in range(count):
+            client = i % options['clients']
+            request = factory.get(url, REMOTE_ADDR='10.0.%d.%d' % (client // 256 % 256, client % 256))
+            request.COOKIES[settings.SESSION_COOKIE_NAME] = session_keys[client]
+            request.resolver_match = resolve(url)
+            requests.append(request)
+
+        with override_settings(RATE_LIMITS={}):
+            middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        started = time.perf_counter()
+        for request in requests:
+            middleware.process_view(request, None, (), {})
+        unlimited = time.perf_counter() - started
+
+        with override_settings(RATE_LIMITS=limits):
+            middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        started = time.perf_counter()
+        for request in requests:
+            middleware.process_view(request, None, (), {})
+        limited = time.perf_counter() - started
+
+        self.stdout.write('Unlimited URL: %.2f us per request.' % (unlimited / count * 1e6))
+        self.stdout.write('Limited URL, user and IP buckets: %.2f us per request.' % (limited / count * 1e6))
+        for session_key in session_keys:
+            session_store().delete(session_key)
@@ -0,0 +1,109 @@
+"""
+Token bucket rate limits per URL name, kept in Django's cache so every worker
+process shares the same buckets.
+
+A bucket of capacity tokens refilled over period seconds is stored as a single
+timestamp, the theoretical arrival time of the next request (GCRA), so a check
+is one cache read and one cache write. They are made under a lock taken with
+cache.add, which is atomic in every cache backend, so concurrent requests on one
+bucket can not take the same token. A request that can not get the lock within
+LOCK_ATTEMPTS tries is throttled rather than let through.
+
+Clients are told apart by the address mysite.proxies reads from behind the
+TRUSTED_PROXIES, not by REMOTE_ADDR, which is the load balancer's.
+"""
+import math
+import time
+from hashlib import sha1
+from importlib import import_module
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from mysite.proxies import client_ip
+
+LOCK_ATTEMPTS = 10
+LOCK_WAIT = 0.005
+LOCK_TIMEOUT = 1
+
+class TokenBucket:
+
+    def __init__(self, cache, capacity, period):
+        self.cache = cache
+        self.interval = period / capacity
+        self.tolerance = period - self.interval
+
+    def take(self, key, now=None):
+        """
+        Take a token from the bucket stored under key. Returns 0 when a token was
+        available, otherwise the number of seconds until the next one is.
+        """
+        lock = key + ':lock'
+        for _ in range(LOCK_ATTEMPTS):
+            if self.cache.add(lock, 1, LOCK_TIMEOUT):
+                break
+            time.sleep(LOCK_WAIT)
+        else:
+            return LOCK_TIMEOUT
+        try:
+            now = time.time() if now == None else now
+            arrival = max(self.cache.get(key, now), now)
+            wait = arrival - now - self.tolerance
+            if wait > 0:
+                return wait
+            arrival += self.interval
+            self.cache.set(key, arrival, math.ceil(arrival - now))
+            return 0
+        finally:
+            self.cache.delete(lock)
+
+class RateLimitMiddleware:
+    """
+    Rejects requests over the RATE_LIMITS of their URL name with 429 Too Many
+    Requests. It runs once the URL is resolved and before the view, so throttled
+    requests never reach the ORM. Users are told apart by their session cookie
+    rather than request.user, which would load the session and user from the database.
+    Requests without a valid session take from the user limit of their address.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        cache = caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+        self.session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        self.limits = {}
+        for view_name, limit in getattr(settings, 'RATE_LIMITS', {}).items():
+            methods = {method.upper() for method in limit.get('methods', [])}
+            buckets = [(scope, TokenBucket(cache, *limit[scope])) for scope in ['user', 'ip'] if scope in limit]
+            self.limits[view_name] = (methods, buckets)
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_name = request.resolver_match.view_name
+        limit = self.limits.get(view_name)
+        if limit == None:
+            return None
+        methods, buckets = limit
+        if methods and request.method not in methods:
+            return None
+        for scope, bucket in buckets:
+            client = self.client(request, scope)
+            if client == None:
+                continue
+            wait = bucket.take('ratelimit:%s:%s:%s' % (view_name, scope, client))
+            if wait:
+                response = HttpResponse('Too many requests, try again later.', status=429, content_type='text/plain')
+                response['Retry-After'] = str(math.ceil(wait))
+                return response
+        return None
+
+    def client(self, request, scope):
+        if scope == 'ip':
+            return client_ip(request)
+        # Made-up session keys would each get a bucket of their own, so requests
+        # without a stored session are counted by address instead. The cached_db
+        # store answers from the cache for any session in use.
+        session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if session_key == None or not self.session_store().exists(session_key):
+            return 'ip:%s' % client_ip(request)
+        return sha1(session_key.encode()).hexdigest()
@@ -0,0 +1,134 @@
+import io
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from mysite.proxies import client_ip
+from .middleware import TokenBucket
+from carry_services.models import CarryService, CarryServicePotentialBuyer
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+def create_user(username, email, password):
+    """
+    Create a user with given username, email and password.
+    """
+    return User.objects.create(username=username, email=email, password=password)
+
+def create_carry_service(seller):
+    """
+    Create a carry service with the given seller.
+    """
+    return CarryService.objects.create(seller=seller, price=1, currency="test")
+
+class TokenBucketTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        return super().setUp()
+
+    def test_burst_then_refill(self):
+        """
+        A bucket should allow capacity requests at once and then one per period / capacity seconds.
+        """
+        bucket = TokenBucket(cache, 2, 10)
+        self.assertEqual(bucket.take('key', now=100), 0)
+        self.assertEqual(bucket.take('key', now=100), 0)
+        self.assertEqual(bucket.take('key', now=100), 5)
+        self.assertEqual(bucket.take('key', now=105), 0)
+        self.assertEqual(bucket.take('key', now=105), 5)
+
+    def test_locked_bucket_is_throttled(self):
+        """
+        A bucket another request holds the lock of should not give out a token.
+        """
+        bucket = TokenBucket(cache, 2, 10)
+        cache.add('key:lock', 1)
+        self.assertGreater(bucket.take('key', now=100), 0)
+        cache.delete('key:lock')
+        self.assertEqual(bucket.take('key', now=100), 0)
+        self.assertEqual(bucket.take('key', now=100), 0)
+        self.assertEqual(bucket.take('key', now=100), 5)
+
+    def test_buckets_are_separate(self):
+        """
+        Each key should have a bucket of its own.
+        """
+        bucket = TokenBucket(cache, 1, 10)
+        self.assertEqual(bucket.take('first', now=100), 0)
+        self.assertEqual(bucket.take('second', now=100), 0)
+        self.assertGreater(bucket.take('first', now=100), 0)
+
+@override_settings(RATE_LIMITS={'carry_services:carry-service-add-potential-buyer': {'user': (1, 60), 'ip': (3, 60), 'methods': ['POST']}})
+class RateLimitMiddlewareTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = create_user('seller', 'seller@example.com', 'password')
+        self.carry_service = create_carry_service(self.seller)
+        self.url = reverse('carry_services:carry-service-add-potential-buyer', kwargs={'pk': self.carry_service.pk})
+        return super().setUp()
+
+    def test_throttled_request_is_rejected_before_any_query(self):
+        """
+        A user over their limit should get 429 with Retry-After without touching the database.
+        """
+        self.client.force_login(create_user('buyer', 'buyer@example.com', 'password'))
+        self.assertEqual(self.client.post(self.url).status_code, 302)
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(CarryServicePotentialBuyer.objects.count(), 1)
+
+    def test_users_and_ips_are_limited_separately(self):
+        """
+        Each user should have their own bucket, while the IP bucket is shared.
+        """
+        for i in range(4):
+            self.client.force_login(create_user('buyer%d' % i, 'buyer%d@example.com' % i, 'password'))
+            response = self.client.post(self.url)
+            self.assertEqual(response.status_code, 429 if i == 3 else 302)
+
+    def test_made_up_sessions_share_the_address_bucket(self):
+        """
+        A new random session cookie on every request should not get a fresh user bucket.
+        """
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'madeup0000000000'
+        self.assertNotEqual(self.client.post(self.url).status_code, 429)
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'madeup0000000001'
+        self.assertEqual(self.client.post(self.url).status_code, 429)
+
+    def test_other_methods_are_not_limited(self):
+        """
+        Methods not listed should not take tokens.
+        """
+        for _ in range(5):
+            self.assertNotEqual(self.client.get(self.url).status_code, 429)
+
+    @override_settings(TRUSTED_PROXIES=['10.0.0.0/8'])
+    def test_clients_behind_the_load_balancer_are_limited_separately(self):
+        """
+        The IP bucket should be the client's from X-Forwarded-For, not the load balancer's.
+        """
+        for i in range(4):
+            self.client.force_login(create_user('buyer%d' % i, 'buyer%d@example.com' % i, 'password'))
+            response = self.client.post(self.url, REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.2.3.4, 203.0.113.%d' % i)
+            self.assertEqual(response.status_code, 302)
+
+    @override_settings(TRUSTED_PROXIES=['10.0.0.0/8'])
+    def test_client_ip_skips_trusted_proxies_only(self):
+        """
+        The client should be the last address not of a trusted proxy, and REMOTE_ADDR without one.
+        """
+        factory = RequestFactory()
+        self.assertEqual(client_ip(factory.get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.2.3.4, 203.0.113.7, 10.0.0.2')), '203.0.113.7')
+        self.assertEqual(client_ip(factory.get('/', REMOTE_ADDR='203.0.113.7', HTTP_X_FORWARDED_FOR='1.2.3.4')), '203.0.113.7')
+
+class RateLimitBenchmarkTests(TestCase):
+
+    def test_benchmark_runs(self):
+        """
+        The benchmark command should time the limiter.
+        """
+        call_command('ratelimit_benchmark', requests=100, stdout=io.StringIO())
@@ -0,0 +1,15 @@
+from django.contrib import admin
+
+from .models import SavedSearch, SavedSearchMatch
+
+class SavedSearchAdmin(admin.ModelAdmin):
+    list_display = ('user', 'kind', 'classification', 'currency', 'max_price', 'seller', 'created_at')
+    list_select_related = ('user', 'classification', 'currency', 'seller')
+    list_filter = ['kind']
+
+class SavedSearchMatchAdmin(admin.ModelAdmin):
+    list_display = ('saved_search', 'craft', 'carry_service', 'seen', 'created_at')
+    list_select_related = ('saved_search', 'craft', 'carry_service')
+
+admin.site.register(SavedSearch, SavedSearchAdmin)
+admin.site.register(SavedSearchMatch, SavedSearchMatchAdmin)
@@ -0,0 +1,16 @@
+from django import forms
+from django.contrib.auth.models import User
+from .models import SavedSearch
+
+class SavedSearchForm(forms.ModelForm):
+    class Meta:
+        model = SavedSearch
+        fields = ['kind', 'classification', 'currency', 'max_price', 'seller']
+
+    seller = forms.ModelChoiceField(queryset=User.objects.all(), to_field_name='username', required=False, widget=forms.TextInput())
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('kind') == SavedSearch.CARRY_SERVICE:
+            cleaned_data['classification'] = None
+        return cleaned_data
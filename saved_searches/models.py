@@ -0,0 +1,76 @@
+from django.db import models
+from django.db.models import Q
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+from django.db.models.signals import post_save
+from classifications.models import Classification
+from currencies.models import CurrencyField
+from crafts.models import Craft
+from carry_services.models import CarryService
+
+class SavedSearch(models.Model):
+    CRAFT = 'craft'
+    CARRY_SERVICE = 'carry_service'
+    KIND_CHOICES = [
+        (CRAFT, 'Craft'),
+        (CARRY_SERVICE, 'Carry service')
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_searches')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=CRAFT)
+    classification = models.ForeignKey(Classification, default=None, null=True, blank=True, on_delete=models.CASCADE, related_name='+', limit_choices_to={'has_crafts': True})
+    currency = CurrencyField(default=None, null=True, blank=True)
+    max_price = models.IntegerField(default=None, null=True, blank=True)
+    seller = models.ForeignKey(User, default=None, null=True, blank=True, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    class Meta:
+        indexes = [
+            # Inverted index of saved searches: a new listing only has to look
+            # at the searches filed under its own kind, classification and currency.
+            models.Index(fields=['kind', 'classification', 'currency'], name='saved_search_lookup'),
+        ]
+
+    def get_absolute_url(self):
+        return reverse('saved_searches:saved-search-list')
+
+    @property
+    def unseen_matches(self):
+        return self.matches.filter(seen=False)
+
+class SavedSearchMatch(models.Model):
+    saved_search = models.ForeignKey(SavedSearch, on_delete=models.CASCADE, related_name='matches')
+    craft = models.ForeignKey(Craft, default=None, null=True, on_delete=models.CASCADE, related_name='+')
+    carry_service = models.ForeignKey(CarryService, default=None, null=True, on_delete=models.CASCADE, related_name='+')
+    seen = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def listing(self):
+        return self.craft if self.craft_id != None else self.carry_service
+
+def matching_searches(kind, listing, classification=None):
+    """
+    Return the saved searches a new listing matches. Only the index buckets for
+    the listing's classification and currency (plus the "any" buckets) are read.
+    """
+    return SavedSearch.objects.filter(
+        Q(classification=classification) | Q(classification=None),
+        Q(currency=listing.currency_id) | Q(currency=None),
+        kind=kind,
+    ).filter(
+        Q(max_price=None) | Q(max_price__gte=listing.price),
+        Q(seller=None) | Q(seller=listing.seller_id),
+    ).exclude(user=listing.seller_id)
+
+@receiver(post_save, sender=Craft)
+def percolate_craft(sender, instance, created, **kwargs):
+    # Crafts created with a buyer are fills of buy orders, not new listings.
+    if created and instance.buyer_id == None:
+        searches = matching_searches(SavedSearch.CRAFT, instance, instance.classification_id)
+        SavedSearchMatch.objects.bulk_create([SavedSearchMatch(saved_search=search, craft=instance) for search in searches])
+
+@receiver(post_save, sender=CarryService)
+def percolate_carry_service(sender, instance, created, **kwargs):
+    if created:
+        searches = matching_searches(SavedSearch.CARRY_SERVICE, instance)
+        SavedSearchMatch.objects.bulk_create([SavedSearchMatch(saved_search=search, carry_service=instance) for search in searches])
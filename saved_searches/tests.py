@@ -0,0 +1,173 @@
+from django.test import TestCase
+from .models import SavedSearch, SavedSearchMatch
+from classifications.models import Classification
+from crafts.models import Craft
+from carry_services.models import CarryService
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+def create_classification(name):
+    """
+    Create a classification with name.
+    """
+    return Classification.objects.create(name=name, has_crafts=True)
+
+def create_craft(classification, seller, price=1, currency="test"):
+    """
+    Create a craft with the given classification, seller, price and currency.
+    """
+    return Craft.objects.create(classification=classification, seller=seller, amount=1, price=price, currency=currency)
+
+def create_carry_service(seller, price=1, currency="test"):
+    """
+    Create a carry service with the given seller, price and currency.
+    """
+    return CarryService.objects.create(seller=seller, price=price, currency=currency)
+
+def create_user(username, email, password):
+    """
+    Create a user with given username, email and password.
+    """
+    return User.objects.create(username=username, email=email, password=password)
+
+def create_saved_search(user, kind=SavedSearch.CRAFT, classification=None, currency='', max_price=None, seller=None):
+    """
+    Create a saved search for the given user.
+    """
+    return SavedSearch.objects.create(user=user, kind=kind, classification=classification, currency=currency, max_price=max_price, seller=seller)
+
+class PercolationTests(TestCase):
+
+    def setUp(self):
+        self.buyer = create_user('buyer', 'buyer@example.com', 'password')
+        self.seller = create_user('seller', 'seller@example.com', 'password')
+        self.apple = create_classification('apple')
+        self.kiwi = create_classification('kiwi')
+        return super().setUp()
+
+    def test_new_craft_matches_search_for_its_classification_and_currency(self):
+        """
+        A new craft should be matched by searches with its classification and currency.
+        """
+        search = create_saved_search(self.buyer, classification=self.apple, currency='gold')
+        craft = create_craft(self.apple, self.seller, currency='gold')
+        self.assertEqual(list(SavedSearchMatch.objects.values_list('saved_search', 'craft')), [(search.pk, craft.pk)])
+
+    def test_new_craft_does_not_match_other_classification_or_currency(self):
+        """
+        Searches for other classifications or currencies should not be matched.
+        """
+        create_saved_search(self.buyer, classification=self.kiwi, currency='gold')
+        create_saved_search(self.buyer, classification=self.apple, currency='silver')
+        create_craft(self.apple, self.seller, currency='gold')
+        self.assertEqual(SavedSearchMatch.objects.count(), 0)
+
+    def test_price_ceiling_and_seller(self):
+        """
+        Searches should only match listings under the price ceiling and from the given seller.
+        """
+        other_seller = create_user('other', 'other@example.com', 'password')
+        cheap = create_saved_search(self.buyer, classification=self.apple, max_price=10)
+        from_seller = create_saved_search(self.buyer, classification=self.apple, seller=self.seller)
+        create_craft(self.apple, self.seller, price=11)
+        create_craft(self.apple, other_seller, price=10)
+        self.assertEqual(SavedSearchMatch.objects.filter(saved_search=cheap).count(), 1)
+        self.assertEqual(SavedSearchMatch.objects.filter(saved_search=from_seller).count(), 1)
+
+    def test_search_without_classification_or_currency_matches_any(self):
+        """
+        A search without classification and currency should match any new craft.
+        """
+        create_saved_search(self.buyer)
+        create_craft(self.apple, self.seller, currency='gold')
+        create_craft(self.kiwi, self.seller, currency='silver')
+        self.assertEqual(SavedSearchMatch.objects.count(), 2)
+
+    def test_own_listing_does_not_match(self):
+        """
+        Seller's own listings should not match their saved searches.
+        """
+        create_saved_search(self.seller, classification=self.apple)
+        create_craft(self.apple, self.seller)
+        self.assertEqual(SavedSearchMatch.objects.count(), 0)
+
+    def test_new_carry_service_matches_carry_service_searches_only(self):
+        """
+        A new carry service should only match carry service searches.
+        """
+        create_saved_search(self.buyer, classification=self.apple)
+        search = create_saved_search(self.buyer, kind=SavedSearch.CARRY_SERVICE, currency='gold')
+        carry_service = create_carry_service(self.seller, currency='gold')
+        self.assertEqual(list(SavedSearchMatch.objects.values_list('saved_search', 'carry_service')), [(search.pk, carry_service.pk)])
+
+    def test_updating_a_listing_does_not_match_again(self):
+        """
+        Only new listings should be matched.
+        """
+        create_saved_search(self.buyer, classification=self.apple)
+        craft = create_craft(self.apple, self.seller)
+        craft.save()
+        self.assertEqual(SavedSearchMatch.objects.count(), 1)
+
+class SavedSearchListViewTests(TestCase):
+
+    def test_user_should_see_own_searches_and_matches(self):
+        """
+        User should see their saved searches and matches, which are then marked as seen.
+        """
+        buyer = create_user('buyer', 'buyer@example.com', 'password')
+        seller = create_user('seller', 'seller@example.com', 'password')
+        classification = create_classification('apple')
+        search = create_saved_search(buyer, classification=classification)
+        create_saved_search(seller, classification=classification)
+        craft = create_craft(classification, seller)
+        self.client.force_login(buyer)
+        response = self.client.get(reverse('saved_searches:saved-search-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['object_list']), [search])
+        self.assertEqual([match.craft for match in response.context['match_list']], [craft])
+        self.assertContains(response, 'New')
+        self.assertEqual(SavedSearchMatch.objects.filter(seen=False).count(), 0)
+
+class SavedSearchCreateViewTests(TestCase):
+
+    def test_create(self):
+        """
+        User should be able to save a search.
+        """
+        user = create_user('test_user', 'test_user@example.com', 'password')
+        seller = create_user('seller', 'seller@example.com', 'password')
+        classification = create_classification('apple')
+        self.client.force_login(user)
+        response = self.client.post(reverse('saved_searches:saved-search-create'), data={'kind': SavedSearch.CRAFT, 'classification': classification.pk, 'currency': 'gold', 'max_price': 10, 'seller': seller.username})
+        self.assertEqual(response.status_code, 302)
+        search = SavedSearch.objects.get()
+        self.assertEqual(search.user, user)
+        self.assertEqual(search.seller, seller)
+
+    def test_carry_service_search_has_no_classification(self):
+        """
+        Carry service searches should ignore the classification.
+        """
+        user = create_user('test_user', 'test_user@example.com', 'password')
+        classification = create_classification('apple')
+        self.client.force_login(user)
+        self.client.post(reverse('saved_searches:saved-search-create'), data={'kind': SavedSearch.CARRY_SERVICE, 'classification': classification.pk, 'currency': 'gold'})
+        self.assertEqual(SavedSearch.objects.get().classification, None)
+
+class SavedSearchDeleteViewTests(TestCase):
+
+    def test_only_owner_can_delete(self):
+        """
+        Only the owner should be able to delete a saved search.
+        """
+        owner = create_user('owner', 'owner@example.com', 'password')
+        other = create_user('other', 'other@example.com', 'password')
+        search = create_saved_search(owner)
+        self.client.force_login(other)
+        response = self.client.post(reverse('saved_searches:saved-search-delete', kwargs={'pk': search.pk}))
+        self.assertEqual(response.status_code, 403)
+        self.client.force_login(owner)
+        response = self.client.post(reverse('saved_searches:saved-search-delete', kwargs={'pk': search.pk}))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(SavedSearch.objects.count(), 0)
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from .views import SavedSearchCreateView, SavedSearchDeleteView, SavedSearchListView
+
+app_name = 'saved_searches'
+urlpatterns = [
+    path('', SavedSearchListView.as_view(), name='saved-search-list'),
+    path('add-saved-search/', SavedSearchCreateView.as_view(), name='saved-search-create'),
+    path('<int:pk>/delete', SavedSearchDeleteView.as_view(), name='saved-search-delete')
+]
@@ -0,0 +1,42 @@
+from django.urls.base import reverse_lazy
+from django.views.generic import CreateView, ListView
+from django.views.generic.edit import DeleteView
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from .forms import SavedSearchForm
+from .models import SavedSearch, SavedSearchMatch
+
+class SavedSearchListView(LoginRequiredMixin, ListView):
+    model = SavedSearch
+
+    def get_queryset(self):
+        return SavedSearch.objects.filter(user=self.request.user).select_related('classification', 'seller').order_by('-created_at')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        matches = SavedSearchMatch.objects.filter(saved_search__user=self.request.user).select_related('craft__classification', 'carry_service').order_by('-created_at')
+        context['match_list'] = list(matches)
+        matches.filter(seen=False).update(seen=True)
+        return context
+
+class SavedSearchCreateView(LoginRequiredMixin, CreateView):
+    model = SavedSearch
+    form_class = SavedSearchForm
+
+    def get_initial(self):
+        initial = super().get_initial()
+        for field in ['kind', 'classification', 'currency', 'max_price', 'seller']:
+            if field in self.request.GET:
+                initial[field] = self.request.GET[field]
+        return initial
+
+    def form_valid(self, form):
+        form.instance.user = self.request.user
+        return super().form_valid(form)
+
+class SavedSearchDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+    model = SavedSearch
+    success_url = reverse_lazy('saved_searches:saved-search-list')
+
+    def test_func(self):
+        self.object = self.get_object()
+        return self.object.user == self.request.user
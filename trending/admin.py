@@ -0,0 +1,10 @@
+from django.contrib import admin
+
+from .models import ListingPopularity
+
+class ListingPopularityAdmin(admin.ModelAdmin):
+    list_display = ('craft', 'carry_service', 'classification', 'views', 'score', 'updated_at')
+    list_select_related = ('craft', 'carry_service', 'classification')
+    list_filter = ['classification']
+
+admin.site.register(ListingPopularity, ListingPopularityAdmin)
@@ -0,0 +1,61 @@
+import atexit
+import logging
+import threading
+from collections import Counter
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+logger = logging.getLogger(__name__)
+
+class ViewCounter:
+    """
+    Per-process listing view counts. Detail views only bump a dict entry; a
+    background thread writes the accumulated counts to the database in batches
+    every TRENDING_FLUSH_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def record(self, kind, pk):
+        with self.lock:
+            self.counts[(kind, pk)] += 1
+
+    def flush(self):
+        from .models import write_view_counts
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+        if not counts:
+            return
+        try:
+            write_view_counts(counts)
+        except DatabaseError:
+            logger.exception('Could not write %d listing view counts, retrying on the next flush.', len(counts))
+            with self.lock:
+                self.counts.update(counts)
+
+    def start(self):
+        """
+        Start the background flusher. Called from the WSGI and ASGI entry points so
+        that management commands and the test runner never write from another thread.
+        """
+        interval = getattr(settings, 'TRENDING_FLUSH_INTERVAL', 10)
+        if self.thread != None or not interval:
+            return
+        self.thread = threading.Thread(target=self.run, args=(interval,), name='view-counter-flusher', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self.stopped.set()
+        self.flush()
+
+    def run(self, interval):
+        while not self.stopped.wait(interval):
+            self.flush()
+            connection.close()
+
+view_counter = ViewCounter()
@@ -0,0 +1,88 @@
+import math
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Q
+from django.utils import timezone
+from classifications.models import Classification
+from crafts.models import Craft
+from carry_services.models import CarryService
+from listing_cache.versions import TRENDING, bump, version_key
+
+# Scores are stored as log(sum(views * e^(decay * (viewed_at - EPOCH)))). Every row
+# decays at the same rate, so ordering by the stored score is the same as ordering by
+# the current decayed popularity, and the index never has to be rewritten.
+EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+
+def decay_rate():
+    return math.log(2) / getattr(settings, 'TRENDING_HALF_LIFE', 24 * 60 * 60)
+
+def log_add_exp(a, b):
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+class ListingPopularity(models.Model):
+    craft = models.OneToOneField(Craft, default=None, null=True, on_delete=models.CASCADE, related_name='+')
+    carry_service = models.OneToOneField(CarryService, default=None, null=True, on_delete=models.CASCADE, related_name='+')
+    classification = models.ForeignKey(Classification, default=None, null=True, on_delete=models.CASCADE, related_name='+')
+    views = models.IntegerField(default=0)
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    class Meta:
+        indexes = [
+            models.Index(fields=['classification', '-score'], name='listing_trending'),
+        ]
+
+    @property
+    def listing(self):
+        return self.craft if self.craft_id != None else self.carry_service
+
+    def add_views(self, count, now):
+        score = math.log(count) + decay_rate() * (now - EPOCH).total_seconds()
+        self.score = score if self.views == 0 else log_add_exp(self.score, score)
+        self.views += count
+
+    def popularity(self, now=None):
+        """
+        Views decayed to now, halving every TRENDING_HALF_LIFE seconds.
+        """
+        now = now or timezone.now()
+        return math.exp(self.score - decay_rate() * (now - EPOCH).total_seconds())
+
+def trending_crafts(classification, count=5):
+    return ListingPopularity.objects.filter(classification=classification).select_related('craft').order_by('-score')[:count]
+
+def trending_carry_services(count=5):
+    return ListingPopularity.objects.filter(classification=None, carry_service__isnull=False).select_related('carry_service').order_by('-score')[:count]
+
+@transaction.atomic
+def write_view_counts(counts, now=None):
+    """
+    Add a batch of (kind, pk) -> views counts to the popularity table with one read,
+    one bulk update and one bulk insert.
+    """
+    now = now or timezone.now()
+    craft_counts = {pk: count for (kind, pk), count in counts.items() if kind == 'craft'}
+    carry_service_counts = {pk: count for (kind, pk), count in counts.items() if kind == 'carry_service'}
+    existing = ListingPopularity.objects.filter(Q(craft__in=craft_counts) | Q(carry_service__in=carry_service_counts))
+    updated = []
+    for popularity in existing:
+        if popularity.craft_id != None:
+            popularity.add_views(craft_counts.pop(popularity.craft_id), now)
+        else:
+            popularity.add_views(carry_service_counts.pop(popularity.carry_service_id), now)
+        popularity.updated_at = now
+        updated.append(popularity)
+    ListingPopularity.objects.bulk_update(updated, ['views', 'score', 'updated_at'])
+    # Listings settled or deleted since they were viewed are skipped here.
+    created = []
+    for pk, classification_id in Craft.objects.filter(pk__in=craft_counts).values_list('pk', 'classification'):
+        popularity = ListingPopularity(craft_id=pk, classification_id=classification_id)
+        popularity.add_views(craft_counts[pk], now)
+        created.append(popularity)
+    for pk in CarryService.objects.filter(pk__in=carry_service_counts).values_list('pk', flat=True):
+        popularity = ListingPopularity(carry_service_id=pk)
+        popularity.add_views(carry_service_counts[pk], now)
+        created.append(popularity)
+    ListingPopularity.objects.bulk_create(created)
+    bump([version_key(TRENDING)])
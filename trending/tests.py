@@ -0,0 +1,121 @@
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+from .counters import ViewCounter, view_counter
+from .models import ListingPopularity, trending_carry_services, trending_crafts, write_view_counts
+from classifications.models import Classification
+from crafts.models import Craft
+from carry_services.models import CarryService
+
+def create_classification(name):
+    """
+    Create a classification with name.
+    """
+    return Classification.objects.create(name=name, has_crafts=True)
+
+def create_craft(classification, seller):
+    """
+    Create a craft with the given classification and seller.
+    """
+    return Craft.objects.create(classification=classification, seller=seller, amount=1, price=1, currency="test")
+
+def create_user(username, email, password):
+    """
+    Create a user with given username, email and password.
+    """
+    return User.objects.create(username=username, email=email, password=password)
+
+class ViewCounterTests(TestCase):
+
+    def setUp(self):
+        self.seller = create_user('seller', 'seller@example.com', 'password')
+        self.classification = create_classification('test1')
+        return super().setUp()
+
+    def test_flush_writes_counts_in_one_batch(self):
+        """
+        Recorded views should only be written when the counter is flushed.
+        """
+        counter = ViewCounter()
+        craft = create_craft(self.classification, self.seller)
+        carry_service = CarryService.objects.create(seller=self.seller, price=1, currency="test")
+        for _ in range(3):
+            counter.record('craft', craft.pk)
+        counter.record('carry_service', carry_service.pk)
+        self.assertEqual(ListingPopularity.objects.count(), 0)
+        # Savepoint, popularity rows, crafts, carry services, insert, release.
+        with self.assertNumQueries(6):
+            counter.flush()
+        self.assertEqual(ListingPopularity.objects.get(craft=craft).views, 3)
+        self.assertEqual(ListingPopularity.objects.get(carry_service=carry_service).classification, None)
+        counter.record('craft', craft.pk)
+        counter.flush()
+        self.assertEqual(ListingPopularity.objects.get(craft=craft).views, 4)
+
+    def test_deleted_listing_is_skipped(self):
+        """
+        Views of listings deleted before the flush should be dropped.
+        """
+        counter = ViewCounter()
+        craft = create_craft(self.classification, self.seller)
+        counter.record('craft', craft.pk)
+        craft.delete()
+        counter.flush()
+        self.assertEqual(ListingPopularity.objects.count(), 0)
+
+    def test_detail_view_records_view(self):
+        """
+        Opening a craft should count a view.
+        """
+        craft = create_craft(self.classification, self.seller)
+        self.client.force_login(self.seller)
+        view_counter.flush()
+        self.client.get(reverse('crafts:craft-detail', kwargs={'pk': craft.pk}))
+        view_counter.flush()
+        self.assertEqual(ListingPopularity.objects.get(craft=craft).views, 1)
+
+@override_settings(TRENDING_HALF_LIFE=60 * 60)
+class TrendingTests(TestCase):
+
+    def setUp(self):
+        self.seller = create_user('seller', 'seller@example.com', 'password')
+        self.classification = create_classification('test1')
+        return super().setUp()
+
+    def test_recent_views_outrank_old_views(self):
+        """
+        Old views should decay so that fewer recent views rank higher.
+        """
+        now = timezone.now()
+        old = create_craft(self.classification, self.seller)
+        recent = create_craft(self.classification, self.seller)
+        write_view_counts({('craft', old.pk): 10}, now - timedelta(hours=4))
+        write_view_counts({('craft', recent.pk): 2}, now)
+        self.assertEqual([popularity.craft for popularity in trending_crafts(self.classification)], [recent, old])
+        popularity = ListingPopularity.objects.get(craft=old)
+        self.assertAlmostEqual(popularity.popularity(now), 10 / 16)
+
+    def test_trending_is_per_classification(self):
+        """
+        Trending crafts should only include the given classification.
+        """
+        other = create_classification('test2')
+        craft = create_craft(self.classification, self.seller)
+        other_craft = create_craft(other, self.seller)
+        carry_service = CarryService.objects.create(seller=self.seller, price=1, currency="test")
+        write_view_counts({('craft', craft.pk): 1, ('craft', other_craft.pk): 5, ('carry_service', carry_service.pk): 1})
+        self.assertEqual([popularity.craft for popularity in trending_crafts(self.classification)], [craft])
+        self.assertEqual([popularity.carry_service for popularity in trending_carry_services()], [carry_service])
+
+    def test_classification_detail_shows_trending(self):
+        """
+        Classification detail view should list trending crafts.
+        """
+        craft = create_craft(self.classification, self.seller)
+        write_view_counts({('craft', craft.pk): 1})
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('classifications:classification-detail', args=[self.classification.pk]))
+        self.assertEqual([popularity.craft for popularity in response.context['trending_list']], [craft])
+        self.assertContains(response, 'Trending')